@@ -1,18 +1,61 @@
+import asyncio
+import logging
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
 import bcrypt
 from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from . import models
+from . import models, roles
+from .cache import TTLCache
+from .logging_config import fields, sampled
+
+logger = logging.getLogger(__name__)
 
 # Secret key untuk JWT (dalam production, pakai environment variable yang aman)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 hari
 
+# Cache principal (user yang sudah di-resolve dari token), key = token subject
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+# Process pool khusus bcrypt (CPU-heavy) supaya tidak memakai threadpool/event loop.
+# Antrian dibatasi: jika penuh, request langsung dapat 503 daripada menumpuk.
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "2"))
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "32"))
+_password_pool = None
+_password_pool_lock = threading.Lock()
+# Jumlah job bcrypt yang sedang jalan / antri di pool (slot dilepas saat job selesai)
+_password_in_flight = 0
+_password_in_flight_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Snapshot user yang sedang login (tanpa session DB, aman di-cache)"""
+    id: int
+    username: Optional[str]
+    email: Optional[str]
+    full_name: Optional[str]
+    role_id: int
+    is_active: bool
+
+    @property
+    def role_name(self) -> Optional[str]:
+        return roles.name(self.role_id)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password dengan hash"""
@@ -31,7 +74,7 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         
         return bcrypt.checkpw(password_bytes, hashed_bytes)
     except Exception as e:
-        print(f"Error verifying password: {e}")
+        logger.warning("Error verifying password: %s", e)
         return False
 
 
@@ -46,6 +89,110 @@ def get_password_hash(password: str) -> str:
     return hashed.decode('utf-8')
 
 
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is None:
+            _password_pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _password_pool
+
+
+def shutdown_password_pool():
+    """Matikan process pool bcrypt (dipanggil saat aplikasi shutdown)"""
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is not None:
+            _password_pool.shutdown(wait=False, cancel_futures=True)
+            _password_pool = None
+
+
+def _reset_password_pool(broken: ProcessPoolExecutor):
+    """Buang pool yang rusak (worker mati/OOM); pool baru dibuat saat submit berikutnya"""
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is broken:
+            _password_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _acquire_slot() -> bool:
+    """Ambil satu slot antrian pool, False jika workers + max_pending sudah terpakai"""
+    global _password_in_flight
+    with _password_in_flight_lock:
+        if _password_in_flight >= PASSWORD_POOL_WORKERS + PASSWORD_POOL_MAX_PENDING:
+            return False
+        _password_in_flight += 1
+        return True
+
+
+def _release_slot():
+    global _password_in_flight
+    with _password_in_flight_lock:
+        _password_in_flight -= 1
+
+
+def _release_slot_unless_broken(future):
+    # Future yang gagal karena pool rusak di-submit ulang dengan slot yang sama
+    if future.cancelled() or not isinstance(future.exception(), BrokenProcessPool):
+        _release_slot()
+
+
+async def _run_in_password_pool(fn, *args):
+    """
+    Jalankan fungsi bcrypt di process pool, raise 503 jika antrian penuh.
+    Jika pool rusak, pool dibuat ulang dan fungsi dicoba sekali lagi (503 jika tetap gagal).
+    """
+    from fastapi import HTTPException, status
+
+    busy = HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again",
+        headers={"Retry-After": "1"},
+    )
+    if not _acquire_slot():
+        raise busy
+    for _ in range(2):
+        pool = _get_password_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning("Password pool is broken, restarting it")
+            _reset_password_pool(pool)
+            continue
+        except BaseException:
+            _release_slot()
+            raise
+        future.add_done_callback(_release_slot_unless_broken)
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            logger.warning("Password pool worker died, restarting the pool")
+            _reset_password_pool(pool)
+    _release_slot()
+    raise busy
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password di process pool"""
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash di process pool"""
+    return await _run_in_password_pool(get_password_hash, password)
+
+
+def password_pool_stats() -> dict:
+    return {
+        "workers": PASSWORD_POOL_WORKERS,
+        "max_pending": PASSWORD_POOL_MAX_PENDING,
+        "in_flight": _password_in_flight,
+    }
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Buat JWT token"""
     to_encode = data.copy()
@@ -58,38 +205,39 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def authenticate_user(db: Session, username_or_email: str, password: str):
-    """Authenticate user dengan username atau email dan password"""
+async def authenticate_user(db: AsyncSession, username_or_email: str, password: str):
+    """Authenticate user dengan username atau email dan password (bcrypt di process pool)"""
     # Strip whitespace dari username/email dan password
     username_or_email = username_or_email.strip() if username_or_email else ""
     password = password.strip() if password else ""
     
-    print(f"Authenticating user - Username/Email: '{username_or_email}' (length: {len(username_or_email)}), Password length: {len(password)}")
+    logger.debug("Authenticating user", extra=fields(login=username_or_email))
     
+    query = select(models.User)
     # Cek apakah input adalah email (ada @)
     if "@" in username_or_email:
         # Login dengan email
-        user = db.query(models.User).filter(models.User.email == username_or_email).first()
+        query = query.where(models.User.email == username_or_email)
     else:
         # Login dengan username
-        user = db.query(models.User).filter(models.User.username == username_or_email).first()
+        query = query.where(models.User.username == username_or_email)
+    user = (await db.execute(query)).scalars().first()
     
     if not user:
-        print(f"User not found: '{username_or_email}'")
+        logger.info("Login failed: user not found", extra=fields(login=username_or_email))
         return False
     
-    print(f"User found: {user.username or user.email} (id: {user.id}, role_id: {user.role_id})")
-    print(f"Password hash starts with: {user.hashed_password[:20] if user.hashed_password else 'None'}")
+    logger.debug("User found", extra=fields(user_id=user.id, role_id=user.role_id))
     
-    if not verify_password(password, user.hashed_password):
-        print(f"Password verification failed for user: {username_or_email}")
+    if not await verify_password_async(password, user.hashed_password):
+        logger.info("Login failed: invalid password", extra=fields(user_id=user.id))
         return False
     
     if not user.is_active:
-        print(f"User {username_or_email} is not active")
+        logger.info("Login failed: user not active", extra=fields(user_id=user.id))
         return False
     
-    print(f"Authentication successful for user: {username_or_email}")
+    logger.info("Login succeeded", extra=sampled(user_id=user.id))
     return user
 
 
@@ -103,6 +251,42 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
+def get_principal(db: Session, subject: str) -> Optional[Principal]:
+    """Resolve token subject (email/username) ke Principal, pakai cache jika ada"""
+    principal = principal_cache.get(subject)
+    if principal is not None:
+        return principal
+    
+    query = db.query(models.User)
+    # Cek apakah subject adalah email atau username
+    if "@" in subject:
+        user = query.filter(models.User.email == subject).first()
+    else:
+        user = query.filter(models.User.username == subject).first()
+    if user is None:
+        return None
+    # Pastikan role user ada di registry (property role_name dan permission check membaca dari memori)
+    roles.name(user.role_id, db)
+    
+    principal = Principal(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name,
+        role_id=user.role_id,
+        is_active=user.is_active,
+    )
+    principal_cache.set(subject, principal)
+    return principal
+
+
+def invalidate_principal(user: Principal):
+    """Hapus principal user dari cache (setelah delete, register, ganti role/is_active)"""
+    for subject in (user.email, user.username):
+        if subject:
+            principal_cache.pop(subject)
+
+
 def decode_token(token: str):
     """Decode JWT token"""
     try:
@@ -116,36 +300,37 @@ def decode_token(token: str):
 
 
 # ==================== PERMISSION SYSTEM ====================
+# Semua check memakai role_id + registry role di memori (app/roles.py), tanpa query.
 
-def is_employee(user: models.User) -> bool:
+def is_employee(user: Principal) -> bool:
     """Cek apakah user adalah employee (admin atau sales)"""
-    if not user or not user.role:
+    if not user:
         return False
-    return user.role.name in ['admin', 'sales']
+    return roles.name(user.role_id) in ['admin', 'sales']
 
 
-def is_customer(user: models.User) -> bool:
+def is_customer(user: Principal) -> bool:
     """Cek apakah user adalah customer"""
-    if not user or not user.role:
+    if not user:
         return False
-    return user.role.name == 'customer'
+    return roles.name(user.role_id) == 'customer'
 
 
-def is_admin(user: models.User) -> bool:
+def is_admin(user: Principal) -> bool:
     """Cek apakah user adalah admin"""
-    if not user or not user.role:
+    if not user:
         return False
-    return user.role.name == 'admin'
+    return roles.name(user.role_id) == 'admin'
 
 
-def is_sales(user: models.User) -> bool:
+def is_sales(user: Principal) -> bool:
     """Cek apakah user adalah sales"""
-    if not user or not user.role:
+    if not user:
         return False
-    return user.role.name == 'sales'
+    return roles.name(user.role_id) == 'sales'
 
 
-def require_employee(user: models.User):
+def require_employee(user: Principal):
     """Require user harus employee, raise exception jika tidak"""
     if not is_employee(user):
         from fastapi import HTTPException, status
@@ -155,7 +340,7 @@ def require_employee(user: models.User):
         )
 
 
-def require_customer(user: models.User):
+def require_customer(user: Principal):
     """Require user harus customer, raise exception jika tidak"""
     if not is_customer(user):
         from fastapi import HTTPException, status
@@ -165,7 +350,7 @@ def require_customer(user: models.User):
         )
 
 
-def require_admin(user: models.User):
+def require_admin(user: Principal):
     """Require user harus admin, raise exception jika tidak"""
     if not is_admin(user):
         from fastapi import HTTPException, status
@@ -175,7 +360,7 @@ def require_admin(user: models.User):
         )
 
 
-def can_access_resource(user: models.User, resource_owner_id: int = None) -> bool:
+def can_access_resource(user: Principal, resource_owner_id: int = None) -> bool:
     """
     Cek apakah user bisa akses resource tertentu.
     - Employee (admin/sales): bisa akses semua resource
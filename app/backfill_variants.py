@@ -0,0 +1,88 @@
+"""
+Backfill varian thumbnail untuk gambar produk yang sudah ada.
+
+Gambar yang di-upload sebelum varian diperkenalkan (termasuk nama file UUID
+lama) belum punya <nama>_w<lebar><ext>. Script ini mengambil semua
+products.image_url di /uploads, lalu membuat varian yang belum ada dengan
+generate_variants yang sama seperti upload baru. File yang bukan gambar atau
+sudah hilang dari disk dilewati.
+
+    python -m app.backfill_variants --workers 2
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, uploads
+from .database import SessionLocal
+from .logging_config import fields, setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def image_paths(db: Session) -> list:
+    """Path file di disk untuk setiap image_url /uploads yang dipakai produk (aktif maupun soft-deleted)"""
+    image_urls = db.execute(
+        select(models.Product.image_url).where(models.Product.image_url.is_not(None)).distinct()
+    ).scalars()
+    return sorted({path for path in map(uploads.path_for_url, image_urls) if path is not None})
+
+
+def backfill(
+    session_factory: Callable[[], Session] = SessionLocal,
+    widths: tuple = uploads.IMAGE_VARIANT_WIDTHS,
+    workers: int = 1,
+) -> dict:
+    """Buat varian yang belum ada, return ringkasan jumlah gambar per hasil"""
+    db = session_factory()
+    try:
+        paths = image_paths(db)
+    finally:
+        db.close()
+
+    summary = {"checked": len(paths), "generated": 0, "complete": 0, "missing": 0, "errors": 0}
+    todo = []
+    for path in paths:
+        if not os.path.exists(path):
+            summary["missing"] += 1
+        elif all(os.path.exists(uploads.variant_filename(path, width)) for width in widths):
+            summary["complete"] += 1
+        else:
+            todo.append(path)
+    if not todo:
+        return summary
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {path: executor.submit(uploads.generate_variants, os.path.abspath(path), widths) for path in todo}
+        for path, future in futures.items():
+            try:
+                future.result()
+                summary["generated"] += 1
+            except Exception as e:
+                # Mis. upload lama yang bukan gambar (PIL.UnidentifiedImageError)
+                summary["errors"] += 1
+                logger.warning("Error generating image variants: %s", e, extra=fields(path=path))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buat varian thumbnail untuk gambar produk yang belum punya")
+    parser.add_argument("--workers", type=int, default=uploads.IMAGE_VARIANT_WORKERS,
+                        help="jumlah proses pembuat varian")
+    args = parser.parse_args()
+
+    setup_logging()
+    summary = backfill(workers=args.workers)
+    print(
+        f"Checked {summary['checked']} images: {summary['generated']} backfilled, "
+        f"{summary['complete']} already complete, {summary['missing']} missing, {summary['errors']} errors"
+    )
+
+
+if __name__ == "__main__":
+    main()
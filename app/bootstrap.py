@@ -0,0 +1,161 @@
+"""
+Bootstrap database: buat tabel dan role default.
+
+Dijalankan sekali saat deploy / setup (bukan saat import app.main atau saat
+worker start), supaya worker tidak melakukan DDL introspection dan query
+role setiap boot:
+
+    python -m app.bootstrap
+
+Index baru di models.py juga dibuat untuk tabel yang sudah ada (CREATE INDEX
+biasa; di tabel besar jalankan saat traffic rendah karena menahan write), begitu
+juga kolom baru (ALTER TABLE ADD COLUMN; kolom NOT NULL harus punya server_default).
+Rollup earnings yang baru dibuat langsung diisi dari tabel transactions.
+Database lama dengan index non-unique pada payments.order_id dimigrasi ke
+unique index (duplikat dibersihkan dulu, gagal jika ada duplikat yang tidak
+bisa diselesaikan otomatis).
+"""
+import logging
+import sys
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+from . import earnings, models
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROLES = (
+    ("admin", "Administrator"),
+    ("sales", "Sales Person"),
+    ("customer", "Customer Portal User"),
+)
+
+
+def init_roles(db: Session):
+    """Buat role admin, sales, dan customer jika belum ada"""
+    existing = {role.name: role for role in db.query(models.Role)}
+    for name, description in DEFAULT_ROLES:
+        if name not in existing:
+            existing[name] = models.Role(name=name, description=description)
+            db.add(existing[name])
+    db.commit()
+    return tuple(existing[name] for name, _ in DEFAULT_ROLES)
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def _has_unique_order_id(inspector) -> bool:
+    columns = ["order_id"]
+    if any(constraint["column_names"] == columns for constraint in inspector.get_unique_constraints("payments")):
+        return True
+    return any(index["unique"] and index["column_names"] == columns for index in inspector.get_indexes("payments"))
+
+
+def _remove_duplicate_payments(conn) -> int:
+    """
+    Per order_id pertahankan Payment yang terakhir di-update (status terbaru), hapus sisanya.
+    Duplikat yang menunjuk ke transaksi berbeda tidak disentuh.
+    """
+    payment = models.Payment.__table__
+    duplicated = select(payment.c.order_id).group_by(payment.c.order_id).having(func.count() > 1)
+    rows = conn.execute(
+        select(payment.c.id, payment.c.order_id, payment.c.transaction_id)
+        .where(payment.c.order_id.in_(duplicated))
+        .order_by(payment.c.order_id, payment.c.updated_at.desc(), payment.c.id.desc())
+    ).all()
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.order_id, []).append(row)
+    obsolete = [
+        row.id
+        for group in groups.values()
+        if len({row.transaction_id for row in group}) == 1
+        for row in group[1:]
+    ]
+    if obsolete:
+        conn.execute(payment.delete().where(payment.c.id.in_(obsolete)))
+    return len(obsolete)
+
+
+def migrate_payment_order_id(bind):
+    """
+    payments.order_id harus unique (target ON CONFLICT di app.payments). create_all() dan
+    create_missing_indexes() tidak mengubah index lama ix_payments_order_id yang non-unique
+    (namanya sama), jadi index itu di-drop dan dibuat ulang sebagai unique index.
+    """
+    index = next(index for index in models.Payment.__table__.indexes if index.name == "ix_payments_order_id")
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        if _has_unique_order_id(inspector):
+            return
+        removed = _remove_duplicate_payments(conn)
+        if removed:
+            logger.warning("Removed %d duplicate payments rows (kept the latest per order_id)", removed)
+        payment = models.Payment.__table__
+        remaining = conn.execute(
+            select(payment.c.order_id).group_by(payment.c.order_id).having(func.count() > 1).limit(10)
+        ).scalars().all()
+        if remaining:
+            raise MigrationError(
+                "payments.order_id has duplicates pointing at different transactions, "
+                f"resolve them manually before bootstrapping: {', '.join(remaining)}"
+            )
+        if any(existing["name"] == index.name for existing in inspector.get_indexes("payments")):
+            index.drop(bind=conn)
+        index.create(bind=conn)
+
+
+def add_missing_columns(bind):
+    """create_all() tidak mengubah tabel yang sudah ada; kolom yang ditambahkan ke model belakangan dibuat di sini"""
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in models.Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    logger.warning("Adding column %s.%s", table.name, column.name)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"
+                    )
+
+
+def create_missing_indexes(bind):
+    """create_all() hanya membuat index untuk tabel baru; index yang ditambahkan ke model belakangan dibuat di sini"""
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def bootstrap(bind=None):
+    """Buat semua tabel dan index yang belum ada lalu isi role default"""
+    bind = bind if bind is not None else engine
+    rollup_exists = inspect(bind).has_table(models.TransactionDailyStat.__tablename__)
+    models.Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    migrate_payment_order_id(bind)
+    create_missing_indexes(bind)
+    with Session(bind) as db:
+        init_roles(db)
+        if not rollup_exists:
+            # Database lama: tanpa backfill dashboard earnings kosong dan transisi order lama membuat counter negatif
+            earnings.rebuild(db)
+
+
+def main():
+    try:
+        bootstrap()
+    except MigrationError as e:
+        sys.exit(f"Bootstrap failed: {e}")
+    print("Database bootstrapped: tables and default roles are in place")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cache katalog produk (GET /api/products) per worker.
+
+Setiap entry menyimpan body JSON yang sudah di-serialize + ETag, jadi cache hit
+tidak menyentuh DB maupun serializer, dan client yang mengirim If-None-Match
+cukup dijawab 304.
+
+Cache memakai versi: invalidate() menaikkan versi sehingga hasil query yang
+dimulai sebelum invalidate tidak akan pernah dibaca lagi. TTL membatasi
+staleness di worker lain (invalidate hanya berlaku di proses ini).
+"""
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from .cache import TTLCache
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "256"))
+
+_cache = TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+_version = 0
+_version_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    body: bytes
+    etag: str
+    next_cursor: Optional[str] = None
+
+
+def current_version() -> int:
+    return _version
+
+
+def invalidate():
+    """Dipanggil setiap kali data produk berubah (create/update/delete/stock)"""
+    global _version
+    with _version_lock:
+        _version += 1
+        _cache.clear()
+
+
+def get(key) -> Optional[CatalogEntry]:
+    return _cache.get((_version, key))
+
+
+def put(version: int, key, entry: CatalogEntry):
+    """Simpan entry untuk versi saat query dimulai (diabaikan jika sudah di-invalidate)"""
+    if version == _version:
+        _cache.set((version, key), entry)
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag dari isi response (sama di semua worker untuk data yang sama)"""
+    return '"' + hashlib.sha256(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Cek header If-None-Match terhadap ETag (mendukung daftar dan '*')"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def stats() -> dict:
+    return {"version": _version, **_cache.stats()}
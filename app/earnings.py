@@ -0,0 +1,117 @@
+"""
+Rollup earnings per hari per status (tabel transaction_daily_stats).
+
+Rollup di-update secara incremental di code path yang sama dengan perubahan
+Transaction.status, jadi /api/dashboard/earnings cukup membaca rollup ini
+tanpa scan seluruh tabel transactions.
+
+Backfill / rebuild dari tabel transactions:
+    python -m app.earnings rebuild
+"""
+import argparse
+from decimal import Decimal
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, engine
+
+
+def _insert(db: Session):
+    """Pilih insert() sesuai dialect supaya bisa pakai ON CONFLICT"""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(models.TransactionDailyStat)
+    return postgresql.insert(models.TransactionDailyStat)
+
+
+def _adjust(db: Session, day, status: str, count_delta: int, amount_delta: Decimal):
+    """Tambah/kurangi counter rollup untuk (day, status) dalam satu UPSERT"""
+    stat = models.TransactionDailyStat
+    stmt = _insert(db).values(
+        day=day,
+        status=status,
+        transaction_count=count_delta,
+        total_amount=amount_delta,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stat.day, stat.status],
+        set_={
+            "transaction_count": stat.transaction_count + stmt.excluded.transaction_count,
+            "total_amount": stat.total_amount + stmt.excluded.total_amount,
+        },
+    )
+    db.execute(stmt)
+
+
+def record_new_transaction(db: Session, transaction: models.Transaction):
+    """Catat transaksi baru ke rollup (created_at harus sudah ter-load)"""
+    _adjust(db, transaction.created_at.date(), transaction.status, 1, Decimal(transaction.total_amount))
+
+
+def record_transition(db: Session, created_at, total_amount, previous_status: str, new_status: str):
+    """Pindahkan satu transaksi dari bucket status lama ke status baru jika status berubah"""
+    if previous_status == new_status:
+        return
+    day = created_at.date()
+    amount = Decimal(total_amount)
+    _adjust(db, day, previous_status, -1, -amount)
+    _adjust(db, day, new_status, 1, amount)
+
+
+def record_status_change(db: Session, transaction: models.Transaction, previous_status: str):
+    """Seperti record_transition, untuk objek Transaction yang statusnya sudah diubah"""
+    record_transition(db, transaction.created_at, transaction.total_amount, previous_status, transaction.status)
+
+
+def get_totals(db: Session) -> dict:
+    """Return {status: (count, total_amount)} dari rollup"""
+    stat = models.TransactionDailyStat
+    rows = db.execute(
+        select(
+            stat.status,
+            func.coalesce(func.sum(stat.transaction_count), 0),
+            func.coalesce(func.sum(stat.total_amount), 0),
+        ).group_by(stat.status)
+    ).all()
+    return {status: (int(count), Decimal(amount)) for status, count, amount in rows}
+
+
+def rebuild(db: Session) -> int:
+    """Hapus dan hitung ulang seluruh rollup dari tabel transactions"""
+    stat = models.TransactionDailyStat
+    transaction = models.Transaction
+    day = func.date(transaction.created_at)
+    db.execute(delete(stat))
+    db.execute(
+        _insert(db).from_select(
+            ["day", "status", "transaction_count", "total_amount"],
+            select(
+                day,
+                transaction.status,
+                func.count(transaction.id),
+                func.coalesce(func.sum(transaction.total_amount), 0),
+            ).group_by(day, transaction.status),
+        )
+    )
+    db.commit()
+    return db.query(func.count()).select_from(stat).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kelola rollup earnings (transaction_daily_stats)")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: hitung ulang rollup dari tabel transactions")
+    parser.parse_args()
+
+    models.TransactionDailyStat.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        rows = rebuild(db)
+    finally:
+        db.close()
+    print(f"Rollup rebuilt: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
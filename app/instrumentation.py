@@ -0,0 +1,371 @@
+"""
+Metrics per request dan endpoint Prometheus (/metrics).
+
+- MetricsMiddleware (ASGI murni): jumlah request dan histogram latency per
+  method + route template (mis. /api/products/{product_id}) + status code, dan
+  request in-flight per method + route template.
+- Statistik per request disimpan di contextvar: waktu dan jumlah statement DB
+  (event SQLAlchemy di engine sync dan async) serta waktu request ke Midtrans.
+  Contextvar ikut ke threadpool (endpoint sync) dan ke greenlet AsyncSession.
+- Registry metrics sederhana tanpa dependency; render() menghasilkan format
+  text Prometheus. Metrics per proses worker (scrape setiap worker).
+- Deteksi N+1: statement dengan bentuk sama (parameter diabaikan) yang
+  dieksekusi >= QUERY_REPEAT_THRESHOLD kali dalam satu request di-log sebagai
+  warning dan dihitung di http_request_repeated_statements_total.
+- Slow query log: statement yang lebih lama dari SLOW_QUERY_MS di-log (juga di
+  luar request, mis. worker/CLI). Parameter tidak pernah di-log.
+- Helper test: `with assert_max_queries(3): client.get("/api/products")`
+  gagal (AssertionError + daftar statement) jika query melebihi batas.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event
+
+from .database import async_engine, engine
+from .logging_config import fields
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Jika diisi, GET /metrics butuh header Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Bentuk statement yang sama >= sekian kali dalam satu request dianggap N+1 (0 = nonaktif)
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+# Statement lebih lama dari ini (ms) di-log sebagai slow query (0 = nonaktif)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    scope: Optional[dict] = None
+    root_path: str = ""
+    db_statements: int = 0
+    db_seconds: float = 0.0
+    midtrans_seconds: float = 0.0
+    # bentuk statement -> jumlah eksekusi
+    statement_shapes: dict = field(default_factory=dict)
+
+    def route(self) -> str:
+        return _route_label(self.scope, self.root_path) if self.scope is not None else "<none>"
+
+    def repeated_statements(self, threshold: int) -> dict:
+        return {shape: count for shape, count in self.statement_shapes.items() if count >= threshold}
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Statistik request yang sedang berjalan (None di luar request, mis. worker/CLI)"""
+    return _request_stats.get()
+
+
+def record_midtrans(seconds: float):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.midtrans_seconds += seconds
+
+
+# ==================== REGISTRY ====================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items
+        ]
+
+
+class InFlightGauge(_Metric):
+    """Request yang sedang diproses, dihitung dari _active saat render"""
+    type_name = "gauge"
+
+    def render(self) -> list:
+        counts = {}
+        for stats in list(_active.values()):
+            labels = (stats.scope["method"], stats.route())
+            counts[labels] = counts.get(labels, 0) + 1
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in counts.items()
+        ]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = self.header()
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+# Request yang sedang diproses: id(scope) -> RequestStats
+_active = {}
+
+REQUESTS = Counter("http_requests_total", "Jumlah HTTP request", ("method", "route", "status"))
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latency HTTP request", ("method", "route", "status")
+)
+IN_PROGRESS = InFlightGauge("http_requests_in_progress", "HTTP request yang sedang diproses", ("method", "route"))
+DB_DURATION = Histogram("http_request_db_seconds", "Total waktu statement DB per request", ("method", "route"))
+DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "Jumlah statement DB per request", ("method", "route"), STATEMENT_BUCKETS
+)
+MIDTRANS_DURATION = Histogram(
+    "http_request_midtrans_seconds", "Total waktu request ke Midtrans per request", ("method", "route")
+)
+REPEATED_STATEMENTS = Counter(
+    "http_request_repeated_statements_total",
+    "Request dengan statement DB berulang (indikasi N+1)",
+    ("method", "route"),
+)
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statement DB yang melebihi SLOW_QUERY_MS")
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==================== SQLALCHEMY EVENTS ====================
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+# Daftar placeholder (IN (...) yang di-expand, VALUES multi-row) diringkas supaya jumlah item tidak mengubah bentuk
+_PLACEHOLDER_LIST = re.compile(r"\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Capture aktif dari count_queries() (lintas thread, jadi juga menangkap query dari TestClient)
+_captures = []
+_captures_lock = threading.Lock()
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """Bentuk statement tanpa perbedaan whitespace dan panjang daftar parameter"""
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._instrumentation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_instrumentation_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_statements += 1
+        stats.db_seconds += elapsed
+        shape = statement_shape(statement)
+        stats.statement_shapes[shape] = stats.statement_shapes.get(shape, 0) + 1
+    if _captures:
+        with _captures_lock:
+            for capture in _captures:
+                capture.statements.append(statement)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc()
+        logger.warning(
+            "Slow SQL statement",
+            extra=fields(
+                duration_ms=round(elapsed * 1000, 1),
+                route=stats.route() if stats is not None else None,
+                statement=statement_shape(statement)[:1000],
+            ),
+        )
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ==================== TEST HELPERS ====================
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def shapes(self) -> dict:
+        counts = {}
+        for statement in self.statements:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        return counts
+
+    def report(self) -> str:
+        return "\n".join(f"{count}x {shape}" for shape, count in self.shapes().items())
+
+
+@contextmanager
+def count_queries():
+    """Hitung semua statement DB (engine sync + async, semua thread) selama blok berjalan"""
+    counter = QueryCounter()
+    with _captures_lock:
+        _captures.append(counter)
+    try:
+        yield counter
+    finally:
+        with _captures_lock:
+            _captures.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Untuk pytest: AssertionError jika blok menjalankan lebih dari `limit` statement DB"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(f"Expected at most {limit} queries, got {counter.count}:\n{counter.report()}")
+
+
+# ==================== MIDDLEWARE ====================
+def _route_label(scope, root_path: str) -> str:
+    # Label memakai template route, bukan path mentah (kardinalitas tetap kecil).
+    # Router FastAPI menyimpan route yang cocok di scope["route"]; Mount (mis. /uploads) mengubah root_path.
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("root_path", "") != root_path:
+        return scope["root_path"][len(root_path):] + "/{path}"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware (tanpa BaseHTTPMiddleware supaya overhead kecil dan streaming tetap jalan).
+    Route template baru diketahui setelah routing, jadi in-flight dihitung saat render
+    dari scope request yang sedang aktif.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope=scope, root_path=scope.get("root_path", ""))
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        key = id(scope)
+        _active[key] = stats
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _active.pop(key, None)
+            _request_stats.reset(token)
+            method = scope["method"]
+            route = stats.route()
+            status = str(status_code)
+            REQUESTS.inc((method, route, status))
+            REQUEST_DURATION.observe((method, route, status), elapsed)
+            DB_DURATION.observe((method, route), stats.db_seconds)
+            DB_STATEMENTS.observe((method, route), stats.db_statements)
+            MIDTRANS_DURATION.observe((method, route), stats.midtrans_seconds)
+            if QUERY_REPEAT_THRESHOLD:
+                self._report_repeated(method, route, stats)
+
+    @staticmethod
+    def _report_repeated(method: str, route: str, stats: RequestStats):
+        repeated = stats.repeated_statements(QUERY_REPEAT_THRESHOLD)
+        if not repeated:
+            return
+        REPEATED_STATEMENTS.inc((method, route))
+        for shape, count in repeated.items():
+            logger.warning(
+                "Repeated SQL statement (possible N+1)",
+                extra=fields(method=method, route=route, count=count, statement=shape[:1000]),
+            )
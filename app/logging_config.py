@@ -0,0 +1,144 @@
+"""
+Logging terstruktur untuk package app.
+
+- Semua module memakai logging.getLogger(__name__) (di bawah logger "app").
+- Handler di request path hanya QueueHandler: record dimasukkan ke queue dan
+  ditulis ke stdout oleh QueueListener di thread terpisah, jadi request tidak
+  menunggu I/O stdout.
+- Output satu baris per event: JSON (default) atau teks key=value (LOG_FORMAT=text).
+- Field tambahan lewat extra=fields(...). Event bervolume tinggi (login sukses,
+  stock berkurang, ...) memakai extra=sampled(...) dan hanya LOG_SAMPLE_RATE
+  bagian yang ditulis; di level DEBUG semua event ditulis.
+- Jangan log password, hash password, atau token.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+_listener = None
+_setup_lock = threading.Lock()
+
+# Atribut bawaan LogRecord (bukan field dari extra)
+_RESERVED = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "fields", "sampled"}
+
+
+def fields(**values) -> dict:
+    """extra=fields(order_id=..., ...) untuk field terstruktur"""
+    return {"fields": values}
+
+
+def sampled(**values) -> dict:
+    """Seperti fields(), tapi event hanya ditulis dengan probabilitas LOG_SAMPLE_RATE"""
+    return {"fields": values, "sampled": True}
+
+
+def _exception_text(formatter: logging.Formatter, record: logging.LogRecord):
+    # exc_text sudah disiapkan oleh QueueHandler; exc_info jika formatter dipakai langsung
+    if record.exc_info:
+        return formatter.formatException(record.exc_info)
+    return record.exc_text
+
+
+def _record_fields(record: logging.LogRecord) -> dict:
+    values = dict(getattr(record, "fields", None) or {})
+    for key, value in record.__dict__.items():
+        if key not in _RESERVED and not key.startswith("_"):
+            values.setdefault(key, value)
+    return values
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_record_fields(record),
+        }
+        exception = _exception_text(self, record)
+        if exception:
+            entry["exc_info"] = exception
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {record.getMessage()}"
+        extra = " ".join(f"{key}={value}" for key, value in _record_fields(record).items())
+        if extra:
+            line = f"{line} {extra}"
+        exception = _exception_text(self, record)
+        if exception:
+            line = f"{line}\n{exception}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Buang sebagian event yang ditandai sampled (kecuali logger di level DEBUG)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or logging.getLogger("app").isEnabledFor(logging.DEBUG):
+            return True
+        return random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format message + exception di thread pemanggil (args bisa berubah setelahnya),
+        # tapi serialisasi JSON / write stdout dikerjakan listener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Pasang queue handler + listener untuk logger "app" (idempotent)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+        logger = logging.getLogger("app")
+        logger.setLevel(LOG_LEVEL)
+        logger.handlers = [queue_handler]
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Tulis sisa record di queue lalu hentikan listener"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -1,12 +1,16 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 from datetime import timedelta
 from typing import Optional
 import os
-import shutil
-import uuid
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Request
+import secrets
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 import json
@@ -14,48 +18,39 @@ import json
 # Load environment variables from .env file
 load_dotenv()
 
-from . import models, schemas, auth
-from .database import engine, get_db, SessionLocal
-from .midtrans_config import get_midtrans_snap, get_midtrans_core
+from . import models, schemas, auth, catalog, earnings, instrumentation, payments, roles, snap_tokens, uploads, webhook_inbox
+from .pagination import NEXT_CURSOR_HEADER, next_cursor, paginate_by_created_at, paginate_by_id, set_next_cursor
+from .database import get_db, get_async_db, pool_status
+from .midtrans_config import get_async_midtrans, close_async_midtrans, midtrans_stats
+from .logging_config import fields, sampled, setup_logging
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-# Inisialisasi roles default jika belum ada
-def init_roles(db: Session):
-    """Buat role admin, sales, dan customer jika belum ada"""
-    admin_role = db.query(models.Role).filter(models.Role.name == "admin").first()
-    if not admin_role:
-        admin_role = models.Role(name="admin", description="Administrator")
-        db.add(admin_role)
-    
-    sales_role = db.query(models.Role).filter(models.Role.name == "sales").first()
-    if not sales_role:
-        sales_role = models.Role(name="sales", description="Sales Person")
-        db.add(sales_role)
-    
-    customer_role = db.query(models.Role).filter(models.Role.name == "customer").first()
-    if not customer_role:
-        customer_role = models.Role(name="customer", description="Customer Portal User")
-        db.add(customer_role)
-    
-    db.commit()
-    return admin_role, sales_role, customer_role
+# Schema dan role default dibuat oleh `python -m app.bootstrap` (bukan saat import / worker start)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup hanya pekerjaan murah (tanpa query DB): logging dan task worker
+    setup_logging()
+    # Worker yang menerapkan notifikasi dari webhook inbox
+    inbox_worker = asyncio.create_task(webhook_inbox.run_worker())
+    yield
+    inbox_worker.cancel()
+    with suppress(asyncio.CancelledError):
+        await inbox_worker
+    await close_async_midtrans()
+    # Shutdown: matikan process pool bcrypt dan pembuat varian gambar
+    auth.shutdown_password_pool()
+    uploads.shutdown_variant_pool()
 
-# Inisialisasi saat startup
-db_init = SessionLocal()
-try:
-    init_roles(db_init)
-finally:
-    db_init.close()
 
-app = FastAPI(title="Simple FastAPI + PostgreSQL App")
+app = FastAPI(title="Simple FastAPI + PostgreSQL App", lifespan=lifespan)
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_DIR = uploads.UPLOAD_DIR
 
 # Mount static files for serving uploaded images
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# (folder dibuat saat upload pertama; check_dir=False supaya import tidak butuh folder ini)
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
 
 # Allow requests from the React dev server (localhost:3000)
 origins = [
@@ -63,12 +58,17 @@ origins = [
     "http://127.0.0.1:3000",
 ]
 
+if instrumentation.METRICS_ENABLED:
+    # Metrics per route (lihat GET /metrics)
+    app.add_middleware(instrumentation.MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # OAuth2 scheme untuk JWT
@@ -79,8 +79,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> models.User:
-    """Get current user dari JWT token"""
+) -> auth.Principal:
+    """Get current user dari JWT token (principal di-cache per token subject)"""
     identifier = auth.decode_token(token)
     if identifier is None:
         raise HTTPException(
@@ -88,11 +88,7 @@ def get_current_user(
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    # Cek apakah identifier adalah email atau username
-    if "@" in identifier:
-        user = auth.get_user_by_email(db, identifier)
-    else:
-        user = auth.get_user_by_username(db, identifier)
+    user = auth.get_principal(db, identifier)
     
     if user is None:
         raise HTTPException(
@@ -105,8 +101,8 @@ def get_current_user(
 
 def require_role(role_name: str):
     """Dependency untuk cek role user"""
-    def role_checker(current_user: models.User = Depends(get_current_user)):
-        if current_user.role.name != role_name:
+    def role_checker(current_user: auth.Principal = Depends(get_current_user)):
+        if current_user.role_name != role_name:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Access denied. Required role: {role_name}"
@@ -116,19 +112,19 @@ def require_role(role_name: str):
 
 
 # Permission Dependencies
-def get_current_employee(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_employee(current_user: auth.Principal = Depends(get_current_user)) -> auth.Principal:
     """Dependency untuk require employee (admin atau sales)"""
     auth.require_employee(current_user)
     return current_user
 
 
-def get_current_customer(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_customer(current_user: auth.Principal = Depends(get_current_user)) -> auth.Principal:
     """Dependency untuk require customer"""
     auth.require_customer(current_user)
     return current_user
 
 
-def get_current_admin(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_admin(current_user: auth.Principal = Depends(get_current_user)) -> auth.Principal:
     """Dependency untuk require admin"""
     auth.require_admin(current_user)
     return current_user
@@ -141,15 +137,13 @@ def read_root():
 
 # Auth endpoints
 @app.post("/auth/login", response_model=schemas.Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login endpoint - return JWT token"""
-    print(f"Login attempt - Username: '{form_data.username}', Password length: {len(form_data.password) if form_data.password else 0}")
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
     if not user:
-        print(f"Authentication failed for username: '{form_data.username}'")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -162,8 +156,8 @@ def login(
         data={"sub": user_identifier}, expires_delta=access_token_expires
     )
     
-    # Get role name
-    role_name = user.role.name if user.role else None
+    # Get role name (dari registry role, tanpa query)
+    role_name = await roles.name_async(db, user.role_id)
     
     return {
         "access_token": access_token,
@@ -181,7 +175,7 @@ def login(
 
 
 @app.get("/auth/me", response_model=schemas.UserResponse)
-def get_current_user_info(current_user: models.User = Depends(get_current_user)):
+def get_current_user_info(current_user: auth.Principal = Depends(get_current_user)):
     """Get current user info"""
     return {
         "id": current_user.id,
@@ -189,27 +183,27 @@ def get_current_user_info(current_user: models.User = Depends(get_current_user))
         "email": current_user.email,
         "full_name": current_user.full_name,
         "role_id": current_user.role_id,
-        "role_name": current_user.role.name if current_user.role else None,
+        "role_name": current_user.role_name,
         "is_active": current_user.is_active
     }
 
 
 @app.post("/auth/register", response_model=schemas.UserResponse)
-def register_user(
+async def register_user(
     user_data: schemas.UserCreate, 
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)  # Hanya admin yang bisa create employee
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(get_current_admin)  # Hanya admin yang bisa create employee
 ):
     """Register employee baru - hanya admin yang bisa akses"""
     # Validasi: tidak boleh register customer via endpoint ini
-    role = db.query(models.Role).filter(models.Role.id == user_data.role_id).first()
-    if not role:
+    role_name = await roles.name_async(db, user_data.role_id)
+    if not role_name:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid role_id"
         )
     
-    if role.name == "customer":
+    if role_name == "customer":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Use /auth/register/customer endpoint for customer registration"
@@ -217,7 +211,9 @@ def register_user(
     
     # Cek apakah username sudah ada
     if user_data.username:
-        existing_user = db.query(models.User).filter(models.User.username == user_data.username).first()
+        existing_user = (await db.execute(
+            select(models.User).where(models.User.username == user_data.username)
+        )).scalars().first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -225,7 +221,7 @@ def register_user(
             )
     
     # Buat user baru (employee)
-    hashed_password = auth.get_password_hash(user_data.password)
+    hashed_password = await auth.get_password_hash_async(user_data.password)
     new_user = models.User(
         username=user_data.username,
         email=user_data.email,
@@ -235,8 +231,9 @@ def register_user(
         is_active=True
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    auth.invalidate_principal(new_user)
     
     return {
         "id": new_user.id,
@@ -244,16 +241,18 @@ def register_user(
         "email": new_user.email,
         "full_name": new_user.full_name,
         "role_id": new_user.role_id,
-        "role_name": new_user.role.name if new_user.role else None,
+        "role_name": role_name,
         "is_active": new_user.is_active
     }
 
 
 @app.post("/auth/register/customer", response_model=schemas.UserResponse)
-def register_customer(customer_data: schemas.CustomerRegister, db: Session = Depends(get_db)):
+async def register_customer(customer_data: schemas.CustomerRegister, db: AsyncSession = Depends(get_async_db)):
     """Register customer baru - public endpoint"""
     # Cek apakah email sudah ada
-    existing_user = db.query(models.User).filter(models.User.email == customer_data.email).first()
+    existing_user = (await db.execute(
+        select(models.User).where(models.User.email == customer_data.email)
+    )).scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -261,26 +260,27 @@ def register_customer(customer_data: schemas.CustomerRegister, db: Session = Dep
         )
     
     # Get customer role
-    customer_role = db.query(models.Role).filter(models.Role.name == "customer").first()
-    if not customer_role:
+    customer_role_id = await roles.id_for_async(db, "customer")
+    if not customer_role_id:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Customer role not found"
         )
     
     # Buat customer baru
-    hashed_password = auth.get_password_hash(customer_data.password)
+    hashed_password = await auth.get_password_hash_async(customer_data.password)
     new_customer = models.User(
         username=None,  # Customer tidak pakai username
         email=customer_data.email,
         full_name=customer_data.full_name,
         hashed_password=hashed_password,
-        role_id=customer_role.id,
+        role_id=customer_role_id,
         is_active=True
     )
     db.add(new_customer)
-    db.commit()
-    db.refresh(new_customer)
+    await db.commit()
+    await db.refresh(new_customer)
+    auth.invalidate_principal(new_customer)
     
     return {
         "id": new_customer.id,
@@ -288,7 +288,7 @@ def register_customer(customer_data: schemas.CustomerRegister, db: Session = Dep
         "email": new_customer.email,
         "full_name": new_customer.full_name,
         "role_id": new_customer.role_id,
-        "role_name": new_customer.role.name if new_customer.role else None,
+        "role_name": "customer",
         "is_active": new_customer.is_active
     }
 
@@ -300,7 +300,7 @@ def register_customer(customer_data: schemas.CustomerRegister, db: Session = Dep
 def create_item(
     item: schemas.ItemCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)  # Hanya employee
+    current_user: auth.Principal = Depends(get_current_employee)  # Hanya employee
 ):
     """Create item - hanya employee yang bisa"""
     db_item = models.Item(title=item.title, description=item.description)
@@ -313,7 +313,7 @@ def create_item(
 @app.get("/items", response_model=list[schemas.Item])
 def list_items(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)  # Hanya employee
+    current_user: auth.Principal = Depends(get_current_employee)  # Hanya employee
 ):
     """List all items - hanya employee yang bisa"""
     items = db.query(models.Item).all()
@@ -324,7 +324,7 @@ def list_items(
 def get_item(
     item_id: int, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)  # Semua user yang login
+    current_user: auth.Principal = Depends(get_current_user)  # Semua user yang login
 ):
     """Get item - semua user yang login bisa akses"""
     item = db.query(models.Item).filter(models.Item.id == item_id).first()
@@ -337,7 +337,7 @@ def get_item(
 def delete_item(
     item_id: int, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)  # Hanya admin
+    current_user: auth.Principal = Depends(get_current_admin)  # Hanya admin
 ):
     """Delete item - hanya admin yang bisa"""
     item = db.query(models.Item).filter(models.Item.id == item_id).first()
@@ -352,7 +352,7 @@ def delete_item(
 @app.get("/my/orders")
 def get_my_orders(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_customer)  # Hanya customer
+    current_user: auth.Principal = Depends(get_current_customer)  # Hanya customer
 ):
     """Get customer's own orders - hanya customer yang bisa akses"""
     # TODO: Implement order model dan query
@@ -366,7 +366,7 @@ def get_my_orders(
 # Employee dashboard endpoint
 @app.get("/employee/dashboard")
 def employee_dashboard(
-    current_user: models.User = Depends(get_current_employee)  # Hanya employee
+    current_user: auth.Principal = Depends(get_current_employee)  # Hanya employee
 ):
     """Employee dashboard - hanya employee yang bisa akses"""
     return {
@@ -374,7 +374,7 @@ def employee_dashboard(
         "user": {
             "id": current_user.id,
             "username": current_user.username,
-            "role": current_user.role.name
+            "role": current_user.role_name
         }
     }
 
@@ -382,7 +382,7 @@ def employee_dashboard(
 # Customer dashboard endpoint
 @app.get("/customer/dashboard")
 def customer_dashboard(
-    current_user: models.User = Depends(get_current_customer)  # Hanya customer
+    current_user: auth.Principal = Depends(get_current_customer)  # Hanya customer
 ):
     """Customer dashboard - hanya customer yang bisa akses"""
     return {
@@ -390,7 +390,7 @@ def customer_dashboard(
         "user": {
             "id": current_user.id,
             "username": current_user.username,
-            "role": current_user.role.name
+            "role": current_user.role_name
         }
     }
 
@@ -398,159 +398,136 @@ def customer_dashboard(
 # ==================== MIDTRANS PAYMENT ENDPOINTS ====================
 
 @app.post("/api/payment/create", response_model=schemas.PaymentResponse)
-def create_payment(
+async def create_payment(
     payment_data: schemas.CreatePaymentRequest,
-    current_user: models.User = Depends(get_current_customer),  # Hanya customer
-    db: Session = Depends(get_db)
+    current_user: auth.Principal = Depends(get_current_customer),  # Hanya customer
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Create Midtrans payment transaction"""
+    """Create Midtrans payment transaction (request ke Snap async, tidak memakai threadpool)"""
+    # Hanya pemilik transaksi yang boleh membuat / mengambil token Snap untuk order_id ini
+    owner_id = await db.scalar(
+        select(models.Transaction.customer_id).where(models.Transaction.order_id == payment_data.order_id)
+    )
+    if owner_id is None or owner_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
+
     try:
-        # Initialize Midtrans Snap
-        snap = get_midtrans_snap()
+        # Request paralel untuk order yang sama (double-click, retry) menunggu satu request Snap
+        async with snap_tokens.order_lock(payment_data.order_id):
+            # Token untuk order_id + amount yang sama masih berlaku: tidak perlu request ke Midtrans
+            cached = await snap_tokens.get_valid(db, payment_data.order_id, payment_data.gross_amount)
+            if cached:
+                return {
+                    "token": cached.token,
+                    "redirect_url": cached.redirect_url
+                }
         
-        # Prepare transaction data
-        transaction_details = {
-            "order_id": payment_data.order_id,
-            "gross_amount": payment_data.gross_amount
-        }
+            # Initialize Midtrans Snap
+            snap = get_async_midtrans()
+        
+            # Prepare transaction data
+            transaction_details = {
+                "order_id": payment_data.order_id,
+                "gross_amount": payment_data.gross_amount
+            }
         
-        # Prepare item details
-        item_details = []
-        for item in payment_data.items:
-            item_details.append({
-                "id": item.id,
-                "price": item.price,
-                "quantity": item.quantity,
-                "name": item.name
-            })
+            # Prepare item details
+            item_details = []
+            for item in payment_data.items:
+                item_details.append({
+                    "id": item.id,
+                    "price": item.price,
+                    "quantity": item.quantity,
+                    "name": item.name
+                })
         
-        # Prepare customer details
-        customer_details = payment_data.customer_details
-        # Tambahkan customer ID dari current user
-        customer_details["user_id"] = str(current_user.id)
+            # Prepare customer details
+            customer_details = payment_data.customer_details
+            # Tambahkan customer ID dari current user
+            customer_details["user_id"] = str(current_user.id)
         
-        # Prepare redirect URLs untuk redirect kembali ke aplikasi setelah payment
-        # URL akan redirect ke frontend dengan query params order_id dan transaction_status
-        frontend_base_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
-        # Redirect ke root dengan query params agar bisa di-handle oleh CustomerPage
-        finish_redirect_url = f"{frontend_base_url}/?payment=success"
-        unfinish_redirect_url = f"{frontend_base_url}/?payment=unfinish"
-        error_redirect_url = f"{frontend_base_url}/?payment=error"
+            # Prepare redirect URLs untuk redirect kembali ke aplikasi setelah payment
+            # URL akan redirect ke frontend dengan query params order_id dan transaction_status
+            frontend_base_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
+            # Redirect ke root dengan query params agar bisa di-handle oleh CustomerPage
+            finish_redirect_url = f"{frontend_base_url}/?payment=success"
+            unfinish_redirect_url = f"{frontend_base_url}/?payment=unfinish"
+            error_redirect_url = f"{frontend_base_url}/?payment=error"
         
-        # Create transaction
-        param = {
-            "transaction_details": transaction_details,
-            "item_details": item_details,
-            "customer_details": customer_details,
-            "callbacks": {
-                "finish": finish_redirect_url,
-                "unfinish": unfinish_redirect_url,
-                "error": error_redirect_url
+            # Create transaction
+            param = {
+                "transaction_details": transaction_details,
+                "item_details": item_details,
+                "customer_details": customer_details,
+                "callbacks": {
+                    "finish": finish_redirect_url,
+                    "unfinish": unfinish_redirect_url,
+                    "error": error_redirect_url
+                }
             }
-        }
         
-        # Create transaction token
-        transaction = snap.create_transaction(param)
+            # Create transaction token
+            transaction = await snap.create_transaction(param)
+            await snap_tokens.store(
+                db, payment_data.order_id, payment_data.gross_amount,
+                transaction["token"], transaction["redirect_url"]
+            )
+            await db.commit()
         
-        return {
-            "token": transaction["token"],
-            "redirect_url": transaction["redirect_url"]
-        }
+            return {
+                "token": transaction["token"],
+                "redirect_url": transaction["redirect_url"]
+            }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error creating payment: {e}")
+        logger.exception("Error creating payment", extra=fields(order_id=payment_data.order_id))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create payment: {str(e)}"
         )
 
 
+async def read_webhook_body(request: Request) -> bytes:
+    """Body webhook (endpoint tanpa auth) maksimal WEBHOOK_MAX_BODY_SIZE byte, 413 jika lebih"""
+    limit = webhook_inbox.WEBHOOK_MAX_BODY_SIZE
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body too large. Maximum size is {limit} bytes",
+    )
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise too_large
+    # Content-Length bisa tidak ada (chunked) atau salah: ukuran dihitung saat membaca
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > limit:
+            raise too_large
+    return bytes(body)
+
+
 @app.post("/api/payment/webhook")
 async def payment_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Handle Midtrans payment notification webhook"""
-    try:
-        # Parse JSON body dari Midtrans webhook
-        body = await request.json()
-        
-        # Parse webhook data
-        transaction_status = body.get("transaction_status")
-        order_id = body.get("order_id")
-        transaction_id = body.get("transaction_id")
-        gross_amount = body.get("gross_amount")
-        fraud_status = body.get("fraud_status")
-        payment_type = body.get("payment_type")
-        status_message = body.get("status_message")
-        transaction_time = body.get("transaction_time")
-        
-        print(f"Webhook received - Order ID: {order_id}, Status: {transaction_status}")
-        print(f"Full webhook data: {json.dumps(body, indent=2)}")
-        
-        # Find transaction by order_id
-        transaction = db.query(models.Transaction).filter(models.Transaction.order_id == order_id).first()
-        if not transaction:
-            print(f"Transaction not found for order_id: {order_id}")
-            return {"status": "ok"}
-        
-        # Update or create payment record
-        payment = db.query(models.Payment).filter(models.Payment.order_id == order_id).first()
-        if not payment:
-            payment = models.Payment(
-                transaction_id=transaction.id,
-                order_id=order_id,
-                gross_amount=float(gross_amount) if gross_amount else transaction.total_amount,
-                payment_type=payment_type,
-                transaction_status=transaction_status,
-                fraud_status=fraud_status,
-                midtrans_transaction_id=transaction_id,
-                status_message=status_message,
-            )
-            db.add(payment)
-        else:
-            payment.transaction_status = transaction_status
-            payment.fraud_status = fraud_status
-            payment.midtrans_transaction_id = transaction_id
-            payment.status_message = status_message
-            if transaction_time:
-                from datetime import datetime
-                payment.transaction_time = datetime.fromisoformat(transaction_time.replace('Z', '+00:00'))
-        
-        # Update transaction status and reduce stock on payment success
-        # Hanya kurangi stock jika status berubah dari pending/other ke paid (menghindari double decrement)
-        if transaction_status in ["settlement", "capture"]:
-            # Payment success
-            # Cek apakah status sebelumnya sudah "paid" untuk menghindari double decrement stock
-            previous_status = transaction.status
-            transaction.status = "paid"
-            transaction.midtrans_transaction_id = transaction_id
-            
-            # Reduce stock hanya jika sebelumnya belum "paid" (menghindari double decrement)
-            if previous_status != "paid" and transaction.product_id:
-                product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-                if product:
-                    # Check if stock is sufficient
-                    if product.stock >= transaction.quantity:
-                        product.stock -= transaction.quantity
-                        print(f"Stock reduced for product {product.id}: {product.stock + transaction.quantity} -> {product.stock}")
-                    else:
-                        print(f"Warning: Insufficient stock for product {product.id}. Stock: {product.stock}, Requested: {transaction.quantity}")
-        elif transaction_status in ["deny", "cancel", "expire"]:
-            # Payment failed
-            transaction.status = "failed"
-        
-        db.commit()
-        
-        # Return response untuk Midtrans
-        return {"status": "ok"}
-        
-    except Exception as e:
-        print(f"Error processing webhook: {e}")
-        import traceback
-        traceback.print_exc()
-        # Tetap return ok agar Midtrans tidak retry terus
-        return {"status": "error", "message": str(e)}
+    """
+    Handle Midtrans payment notification webhook.
+    Body mentah hanya disimpan ke inbox lalu langsung return; status diterapkan
+    oleh worker background (lihat app/webhook_inbox.py).
+    Jika gagal disimpan, return 500 supaya Midtrans mengirim ulang.
+    """
+    body = await read_webhook_body(request)
+    entry = models.WebhookInbox(payload=body.decode("utf-8", errors="replace"))
+    db.add(entry)
+    await db.commit()
+    webhook_inbox.notify()
+    logger.info("Webhook stored in inbox", extra=sampled(inbox_id=entry.id, size=len(body)))
+    
+    # Return response untuk Midtrans
+    return {"status": "ok"}
 
 
 # ==================== MANUAL PAYMENT STATUS UPDATE (UNTUK TESTING) ====================
@@ -559,154 +536,78 @@ def manual_update_payment_status(
     order_id: str,
     transaction_status: str,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """
     Manual update payment status - untuk testing saat webhook tidak bisa diakses
     Hanya untuk development/testing, sebaiknya di-disable di production
     """
     try:
-        print(f"Manual update - Order ID: {order_id}, Status: {transaction_status}")
+        logger.info("Manual payment status update", extra=fields(order_id=order_id, transaction_status=transaction_status))
         
-        # Find transaction by order_id
-        transaction = db.query(models.Transaction).filter(models.Transaction.order_id == order_id).first()
-        if not transaction:
+        # Upsert payment + update transaction status lewat state machine payments
+        result = payments.apply_transition(
+            db,
+            order_id,
+            transaction_status,
+            fallback_midtrans_transaction_id=f"manual-{order_id}",
+        )
+        if not result.found:
             raise HTTPException(status_code=404, detail=f"Transaction not found for order_id: {order_id}")
-        
-        # Update or create payment record
-        payment = db.query(models.Payment).filter(models.Payment.order_id == order_id).first()
-        if not payment:
-            payment = models.Payment(
-                transaction_id=transaction.id,
-                order_id=order_id,
-                gross_amount=float(transaction.total_amount),
-                transaction_status=transaction_status,
-                midtrans_transaction_id=f"manual-{order_id}",
-            )
-            db.add(payment)
-        else:
-            payment.transaction_status = transaction_status
-        
-        # Update transaction status and reduce stock on payment success
-        # Hanya kurangi stock jika status berubah dari pending/other ke paid (menghindari double decrement)
-        if transaction_status in ["settlement", "capture"]:
-            # Payment success
-            # Cek apakah status sebelumnya sudah "paid" untuk menghindari double decrement stock
-            previous_status = transaction.status
-            transaction.status = "paid"
-            
-            # Reduce stock hanya jika sebelumnya belum "paid" (menghindari double decrement)
-            if previous_status != "paid" and transaction.product_id:
-                product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-                if product:
-                    # Check if stock is sufficient
-                    if product.stock >= transaction.quantity:
-                        product.stock -= transaction.quantity
-                        print(f"Stock reduced for product {product.id}: {product.stock + transaction.quantity} -> {product.stock}")
-                    else:
-                        print(f"Warning: Insufficient stock for product {product.id}. Stock: {product.stock}, Requested: {transaction.quantity}")
-        elif transaction_status in ["deny", "cancel", "expire"]:
-            # Payment failed
-            transaction.status = "failed"
-        
         db.commit()
+        if result.stock_changed:
+            catalog.invalidate()
         
         return {
             "status": "ok",
             "message": f"Payment status updated to {transaction_status}",
-            "transaction_id": transaction.id,
+            "transaction_id": result.transaction_id,
             "order_id": order_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in manual update: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in manual update", extra=fields(order_id=order_id))
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== CHECK PAYMENT STATUS FROM MIDTRANS ====================
 @app.get("/api/payment/check-status/{order_id}")
-def check_payment_status(
+async def check_payment_status(
     order_id: str,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """
     Check payment status dari Midtrans API dan update database
     Berguna saat webhook tidak terpanggil otomatis
     """
     try:
-        # Find transaction by order_id
-        transaction = db.query(models.Transaction).filter(models.Transaction.order_id == order_id).first()
+        # Find transaction by order_id (hanya customer_id untuk cek permission)
+        transaction = (await db.execute(
+            select(models.Transaction.customer_id).where(models.Transaction.order_id == order_id)
+        )).first()
         if not transaction:
             raise HTTPException(status_code=404, detail=f"Transaction not found for order_id: {order_id}")
         
         # Check permission: customer hanya bisa check transaksi mereka sendiri
-        if current_user.role.name == "customer" and transaction.customer_id != current_user.id:
+        if current_user.role_name == "customer" and transaction.customer_id != current_user.id:
             raise HTTPException(status_code=403, detail="Access denied")
         
         # Get status dari Midtrans Core API
-        core_api = get_midtrans_core()
-        status_response = core_api.transactions.status(order_id)
+        core_api = get_async_midtrans()
+        status_response = await core_api.transaction_status(order_id)
         
-        print(f"Midtrans status check - Order ID: {order_id}, Status: {status_response.get('transaction_status')}")
+        logger.info("Midtrans status check", extra=fields(order_id=order_id, transaction_status=status_response.get("transaction_status")))
         
         transaction_status = status_response.get("transaction_status")
-        transaction_id = status_response.get("transaction_id")
-        gross_amount = status_response.get("gross_amount")
-        payment_type = status_response.get("payment_type")
-        fraud_status = status_response.get("fraud_status")
-        status_message = status_response.get("status_message")
-        transaction_time = status_response.get("transaction_time")
-        
-        # Update or create payment record
-        payment = db.query(models.Payment).filter(models.Payment.order_id == order_id).first()
-        if not payment:
-            payment = models.Payment(
-                transaction_id=transaction.id,
-                order_id=order_id,
-                gross_amount=float(gross_amount) if gross_amount else transaction.total_amount,
-                payment_type=payment_type,
-                transaction_status=transaction_status,
-                fraud_status=fraud_status,
-                midtrans_transaction_id=transaction_id,
-                status_message=status_message,
-            )
-            db.add(payment)
-        else:
-            payment.transaction_status = transaction_status
-            payment.fraud_status = fraud_status
-            payment.midtrans_transaction_id = transaction_id
-            payment.status_message = status_message
-            if transaction_time:
-                from datetime import datetime
-                payment.transaction_time = datetime.fromisoformat(transaction_time.replace('Z', '+00:00'))
-        
-        # Update transaction status and reduce stock on payment success
-        # Hanya kurangi stock jika status berubah dari pending/other ke paid (menghindari double decrement)
-        if transaction_status in ["settlement", "capture"]:
-            # Payment success
-            # Cek apakah status sebelumnya sudah "paid" untuk menghindari double decrement stock
-            previous_status = transaction.status
-            transaction.status = "paid"
-            transaction.midtrans_transaction_id = transaction_id
-            
-            # Reduce stock hanya jika sebelumnya belum "paid" (menghindari double decrement)
-            if previous_status != "paid" and transaction.product_id:
-                product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-                if product:
-                    # Check if stock is sufficient
-                    if product.stock >= transaction.quantity:
-                        product.stock -= transaction.quantity
-                        print(f"Stock reduced for product {product.id}: {product.stock + transaction.quantity} -> {product.stock}")
-                    else:
-                        print(f"Warning: Insufficient stock for product {product.id}. Stock: {product.stock}, Requested: {transaction.quantity}")
-        elif transaction_status in ["deny", "cancel", "expire"]:
-            # Payment failed
-            transaction.status = "failed"
         
-        db.commit()
+        # Upsert payment + update transaction status lewat state machine payments
+        result = await db.run_sync(payments.apply_notification, status_response)
+        await db.commit()
+        if result.stock_changed:
+            catalog.invalidate()
         
         return {
             "status": "ok",
@@ -715,14 +616,51 @@ def check_payment_status(
             "message": f"Payment status: {transaction_status}"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error checking payment status: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error checking payment status", extra=fields(order_id=order_id))
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== PRODUCT ENDPOINTS ====================
+# Kolom yang dibutuhkan schemas.Product
+PRODUCT_COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.price,
+    models.Product.description,
+    models.Product.image_url,
+    models.Product.stock,
+    models.Product.created_by,
+    models.Product.created_at,
+    models.Product.updated_at,
+    models.Product.is_active,
+)
+
+
+def product_listing_query(db: Session):
+    """Query produk + nama creator dalam satu SELECT (tanpa lookup creator per produk)"""
+    return (
+        db.query(
+            *PRODUCT_COLUMNS,
+            models.User.full_name.label("creator_full_name"),
+            models.User.username.label("creator_username"),
+        )
+        .select_from(models.Product)
+        .outerjoin(models.User, models.User.id == models.Product.created_by)
+    )
+
+
+def product_row_to_dict(row) -> dict:
+    """Ubah row hasil product_listing_query menjadi dict response"""
+    data = row._asdict()
+    creator_full_name = data.pop("creator_full_name")
+    creator_username = data.pop("creator_username")
+    data["creator_name"] = creator_full_name or creator_username
+    return data
+
+
 @app.post("/api/products", response_model=schemas.Product)
 async def create_product(
     name: str = Form(...),
@@ -730,80 +668,83 @@ async def create_product(
     description: Optional[str] = Form(None),
     stock: int = Form(0),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(get_current_employee)
 ):
     """Create new product - hanya employee (admin/sales) yang bisa"""
-    image_url = None
+    stored = None
     
-    # Handle file upload
+    # Handle file upload (streaming, nama file = hash isi file)
     if image:
-        # Generate unique filename
-        file_extension = os.path.splitext(image.filename)[1] if image.filename else ".jpg"
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        # Set image URL (relative path untuk di-serve via static files)
-        image_url = f"/uploads/{unique_filename}"
+        stored = await uploads.save_upload(image)
+        uploads.schedule_variants(stored.url)
     
     product = models.Product(
         name=name,
         price=price,
         description=description,
-        image_url=image_url,
+        image_url=stored.url if stored else None,
         stock=stock,
         created_by=current_user.id
     )
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    try:
+        await db.commit()
+    finally:
+        await uploads.confirm_upload(stored)
+    await db.refresh(product)
+    catalog.invalidate()
     
-    # Get creator name
-    creator = db.query(models.User).filter(models.User.id == product.created_by).first()
+    # Creator adalah user yang sedang login
     return {
         **schemas.Product.model_validate(product).model_dump(),
-        "creator_name": creator.full_name if creator and creator.full_name else creator.username if creator else None
+        "creator_name": current_user.full_name if current_user.full_name else current_user.username
     }
 
 
 @app.get("/api/products", response_model=list[schemas.Product])
 def get_products(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
-    """Get all products"""
-    products = db.query(models.Product).filter(models.Product.is_active == True).offset(skip).limit(limit).all()
-    result = []
-    for product in products:
-        creator = db.query(models.User).filter(models.User.id == product.created_by).first()
-        result.append({
-            **schemas.Product.model_validate(product).model_dump(),
-            "creator_name": creator.full_name if creator and creator.full_name else creator.username if creator else None
-        })
-    return result
+    """
+    Get all products - pakai ?cursor= (dari header X-Next-Cursor) untuk keyset pagination.
+    Response di-cache per worker dan mendukung ETag / If-None-Match (304).
+    """
+    cache_key = (skip, limit, cursor)
+    entry = catalog.get(cache_key)
+    if entry is None:
+        version = catalog.current_version()
+        query = product_listing_query(db).filter(models.Product.is_active == True)
+        rows = paginate_by_id(query, models.Product, skip, limit, cursor).all()
+        products = [schemas.Product(**product_row_to_dict(row)).model_dump(mode="json") for row in rows]
+        body = json.dumps(products, separators=(",", ":")).encode("utf-8")
+        entry = catalog.CatalogEntry(body=body, etag=catalog.make_etag(body), next_cursor=next_cursor(rows, limit, "id"))
+        catalog.put(version, cache_key, entry)
+    
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if entry.next_cursor:
+        headers[NEXT_CURSOR_HEADER] = entry.next_cursor
+    if catalog.etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 
 @app.get("/api/products/{product_id}", response_model=schemas.Product)
 def get_product(
     product_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """Get product by ID"""
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not product:
+    row = product_listing_query(db).filter(models.Product.id == product_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Product not found")
-    creator = db.query(models.User).filter(models.User.id == product.created_by).first()
-    return {
-        **schemas.Product.model_validate(product).model_dump(),
-        "creator_name": creator.full_name if creator and creator.full_name else creator.username if creator else None
-    }
+    return product_row_to_dict(row)
 
 
 @app.put("/api/products/{product_id}", response_model=schemas.Product)
@@ -815,11 +756,11 @@ async def update_product(
     stock: Optional[int] = Form(None),
     image: Optional[UploadFile] = File(None),
     is_active: Optional[bool] = Form(None),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(get_current_employee)
 ):
     """Update product - hanya employee yang bisa"""
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    product = await db.get(models.Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -835,29 +776,25 @@ async def update_product(
     if is_active is not None:
         product.is_active = is_active
     
-    # Handle file upload
+    # Handle file upload (streaming, nama file = hash isi file)
+    old_image_url = product.image_url
+    stored = None
     if image:
-        # Delete old image if exists
-        if product.image_url and product.image_url.startswith("/uploads/"):
-            old_file_path = product.image_url.replace("/uploads/", UPLOAD_DIR + "/")
-            if os.path.exists(old_file_path):
-                os.remove(old_file_path)
-        
-        # Generate unique filename
-        file_extension = os.path.splitext(image.filename)[1] if image.filename else ".jpg"
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        # Set image URL
-        product.image_url = f"/uploads/{unique_filename}"
+        stored = await uploads.save_upload(image)
+        product.image_url = stored.url
+        uploads.schedule_variants(stored.url)
     
-    db.commit()
-    db.refresh(product)
-    creator = db.query(models.User).filter(models.User.id == product.created_by).first()
+    try:
+        await db.commit()
+    finally:
+        await uploads.confirm_upload(stored)
+    await db.refresh(product)
+    catalog.invalidate()
+    
+    # Hapus gambar lama hanya jika tidak dipakai produk lain
+    if old_image_url != product.image_url:
+        await uploads.release_upload(db, old_image_url)
+    creator = await db.get(models.User, product.created_by)
     return {
         **schemas.Product.model_validate(product).model_dump(),
         "creator_name": creator.full_name if creator and creator.full_name else creator.username if creator else None
@@ -868,7 +805,7 @@ async def update_product(
 def delete_product(
     product_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)
+    current_user: auth.Principal = Depends(get_current_employee)
 ):
     """Delete product (soft delete) - hanya employee yang bisa"""
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -877,15 +814,64 @@ def delete_product(
     
     product.is_active = False
     db.commit()
+    catalog.invalidate()
     return {"message": "Product deleted successfully"}
 
 
 # ==================== TRANSACTION ENDPOINTS ====================
+# Kolom yang dibutuhkan schemas.Transaction, di-select langsung (tanpa load entity penuh)
+TRANSACTION_COLUMNS = (
+    models.Transaction.id,
+    models.Transaction.order_id,
+    models.Transaction.customer_id,
+    models.Transaction.product_id,
+    models.Transaction.quantity,
+    models.Transaction.total_amount,
+    models.Transaction.status,
+    models.Transaction.payment_method,
+    models.Transaction.midtrans_transaction_id,
+    models.Transaction.shipping_name,
+    models.Transaction.shipping_phone,
+    models.Transaction.shipping_address,
+    models.Transaction.shipping_city,
+    models.Transaction.shipping_postal_code,
+    models.Transaction.created_at,
+    models.Transaction.updated_at,
+)
+
+
+def transaction_listing_query(db: Session, *columns):
+    """
+    Query transaksi + nama customer dan nama produk dalam satu SELECT.
+    Menggantikan lookup User/Product per baris (N+1).
+    """
+    return (
+        db.query(
+            *(columns or TRANSACTION_COLUMNS),
+            models.User.full_name.label("customer_full_name"),
+            models.User.email.label("customer_email"),
+            models.Product.name.label("product_name"),
+        )
+        .select_from(models.Transaction)
+        .outerjoin(models.User, models.User.id == models.Transaction.customer_id)
+        .outerjoin(models.Product, models.Product.id == models.Transaction.product_id)
+    )
+
+
+def transaction_row_to_dict(row) -> dict:
+    """Ubah row hasil transaction_listing_query menjadi dict response"""
+    data = row._asdict()
+    customer_full_name = data.pop("customer_full_name")
+    customer_email = data.pop("customer_email")
+    data["customer_name"] = customer_full_name or customer_email
+    return data
+
+
 @app.post("/api/transactions", response_model=schemas.Transaction)
 def create_transaction(
     transaction_data: schemas.TransactionCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """Create new transaction"""
     # Check stock if product_id is provided
@@ -915,94 +901,76 @@ def create_transaction(
         shipping_postal_code=transaction_data.shipping_postal_code,
     )
     db.add(transaction)
-    db.commit()
+    db.flush()
     db.refresh(transaction)
+    earnings.record_new_transaction(db, transaction)
+    db.commit()
     
-    # Get customer and product names
-    customer = db.query(models.User).filter(models.User.id == transaction.customer_id).first()
-    product = None
-    if transaction.product_id:
-        product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-    
-    return {
-        **schemas.Transaction.model_validate(transaction).model_dump(),
-        "customer_name": customer.full_name if customer and customer.full_name else customer.email if customer else None,
-        "product_name": product.name if product else None
-    }
+    # Get transaction beserta customer and product names (satu query)
+    row = transaction_listing_query(db).filter(models.Transaction.id == transaction.id).one()
+    return transaction_row_to_dict(row)
 
 
 @app.get("/api/transactions", response_model=list[schemas.Transaction])
 def get_transactions(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
-    """Get all transactions - sales/admin bisa lihat semua, customer hanya lihat miliknya"""
-    query = db.query(models.Transaction)
+    """
+    Get all transactions - sales/admin bisa lihat semua, customer hanya lihat miliknya.
+    Pakai ?cursor= (dari header X-Next-Cursor) untuk keyset pagination.
+    """
+    query = transaction_listing_query(db)
     
     # Customer hanya bisa lihat transaksi mereka sendiri
-    if current_user.role.name == "customer":
+    if current_user.role_name == "customer":
         query = query.filter(models.Transaction.customer_id == current_user.id)
     
     # Filter by status if provided
     if status:
         query = query.filter(models.Transaction.status == status)
     
-    transactions = query.order_by(models.Transaction.created_at.desc()).offset(skip).limit(limit).all()
-    
-    result = []
-    for transaction in transactions:
-        customer = db.query(models.User).filter(models.User.id == transaction.customer_id).first()
-        product = None
-        if transaction.product_id:
-            product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-        result.append({
-            **schemas.Transaction.model_validate(transaction).model_dump(),
-            "customer_name": customer.full_name if customer and customer.full_name else customer.email if customer else None,
-            "product_name": product.name if product else None
-        })
-    return result
+    rows = paginate_by_created_at(query, models.Transaction, skip, limit, cursor).all()
+    set_next_cursor(response, rows, limit, "created_at", "id")
+    return [transaction_row_to_dict(row) for row in rows]
 
 
 @app.get("/api/transactions/{transaction_id}", response_model=schemas.Transaction)
 def get_transaction(
     transaction_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """Get transaction by ID"""
-    transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
-    if not transaction:
+    row = transaction_listing_query(db).filter(models.Transaction.id == transaction_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
     # Check permission: customer hanya bisa lihat transaksi mereka sendiri
-    if current_user.role.name == "customer" and transaction.customer_id != current_user.id:
+    if current_user.role_name == "customer" and row.customer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    customer = db.query(models.User).filter(models.User.id == transaction.customer_id).first()
-    product = None
-    if transaction.product_id:
-        product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-    
-    return {
-        **schemas.Transaction.model_validate(transaction).model_dump(),
-        "customer_name": customer.full_name if customer and customer.full_name else customer.email if customer else None,
-        "product_name": product.name if product else None
-    }
+    return transaction_row_to_dict(row)
 
 
 # ==================== USER MANAGEMENT ENDPOINTS (ADMIN ONLY) ====================
 @app.get("/api/users", response_model=list[schemas.UserResponse])
 def get_all_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)  # Hanya admin
+    current_user: auth.Principal = Depends(get_current_admin)  # Hanya admin
 ):
     """Get all users - hanya admin yang bisa akses"""
-    users = db.query(models.User).offset(skip).limit(limit).all()
+    users = paginate_by_id(db.query(models.User), models.User, skip, limit, cursor).all()
+    set_next_cursor(response, users, limit, "id")
     result = []
     for user in users:
         result.append({
@@ -1011,7 +979,7 @@ def get_all_users(
             "email": user.email,
             "full_name": user.full_name,
             "role_id": user.role_id,
-            "role_name": user.role.name if user.role else None,
+            "role_name": roles.name(user.role_id, db),
             "is_active": user.is_active
         })
     return result
@@ -1021,7 +989,7 @@ def get_all_users(
 def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_admin)  # Hanya admin
+    current_user: auth.Principal = Depends(get_current_admin)  # Hanya admin
 ):
     """Delete user - hanya admin yang bisa akses"""
     # Tidak boleh delete diri sendiri
@@ -1037,6 +1005,7 @@ def delete_user(
     
     db.delete(user)
     db.commit()
+    auth.invalidate_principal(user)
     return {"message": "User deleted successfully"}
 
 
@@ -1044,21 +1013,22 @@ def delete_user(
 @app.get("/api/roles", response_model=list[schemas.Role])
 def get_roles(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """Get all roles - semua user yang login bisa akses"""
-    roles = db.query(models.Role).all()
-    return roles
+    return db.query(models.Role).all()
 
 
 # ==================== PAYMENT ENDPOINTS ====================
 @app.get("/api/payments", response_model=list[schemas.Payment])
 def get_payments(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     transaction_status: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)
+    current_user: auth.Principal = Depends(get_current_employee)
 ):
     """Get all payments - hanya employee yang bisa akses"""
     query = db.query(models.Payment)
@@ -1067,7 +1037,8 @@ def get_payments(
     if transaction_status:
         query = query.filter(models.Payment.transaction_status == transaction_status)
     
-    payments = query.order_by(models.Payment.created_at.desc()).offset(skip).limit(limit).all()
+    payments = paginate_by_created_at(query, models.Payment, skip, limit, cursor).all()
+    set_next_cursor(response, payments, limit, "created_at", "id")
     return payments
 
 
@@ -1075,7 +1046,7 @@ def get_payments(
 def get_payment(
     payment_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)
+    current_user: auth.Principal = Depends(get_current_employee)
 ):
     """Get payment by ID - hanya employee yang bisa akses"""
     payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
@@ -1084,58 +1055,70 @@ def get_payment(
     return payment
 
 
+# ==================== SYSTEM STATS (ADMIN ONLY) ====================
+@app.get("/api/system/stats")
+def get_system_stats(
+    current_user: auth.Principal = Depends(get_current_admin)  # Hanya admin
+):
+    """Statistik runtime worker ini (connection pool, dll) - hanya admin yang bisa akses"""
+    return {
+        "db_pool": pool_status(),
+        "principal_cache": auth.principal_cache.stats(),
+        "password_pool": auth.password_pool_stats(),
+        "catalog_cache": catalog.stats(),
+        "midtrans": midtrans_stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Metrics format Prometheus untuk worker ini (opsional dilindungi METRICS_TOKEN)"""
+    if instrumentation.METRICS_TOKEN:
+        authorization = request.headers.get("authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {instrumentation.METRICS_TOKEN}"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(content=instrumentation.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # ==================== DASHBOARD/OVERVIEW ENDPOINTS ====================
 @app.get("/api/dashboard/recent-transactions", response_model=list[schemas.RecentTransactionResponse])
 def get_recent_transactions(
     limit: int = 10,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: auth.Principal = Depends(get_current_user)
 ):
     """Get recent transactions for dashboard"""
-    query = db.query(models.Transaction)
+    query = transaction_listing_query(
+        db,
+        models.Transaction.id,
+        models.Transaction.order_id,
+        models.Transaction.total_amount,
+        models.Transaction.status,
+        models.Transaction.created_at,
+    )
     
     # Customer hanya bisa lihat transaksi mereka sendiri
-    if current_user.role.name == "customer":
+    if current_user.role_name == "customer":
         query = query.filter(models.Transaction.customer_id == current_user.id)
     
-    transactions = query.order_by(models.Transaction.created_at.desc()).limit(limit).all()
-    
-    result = []
-    for transaction in transactions:
-        customer = db.query(models.User).filter(models.User.id == transaction.customer_id).first()
-        product = None
-        if transaction.product_id:
-            product = db.query(models.Product).filter(models.Product.id == transaction.product_id).first()
-        result.append({
-            "id": transaction.id,
-            "order_id": transaction.order_id,
-            "customer_name": customer.full_name if customer and customer.full_name else customer.email if customer else None,
-            "product_name": product.name if product else None,
-            "total_amount": float(transaction.total_amount),
-            "status": transaction.status,
-            "created_at": transaction.created_at
-        })
-    return result
+    rows = query.order_by(models.Transaction.created_at.desc()).limit(limit).all()
+    return [transaction_row_to_dict(row) for row in rows]
 
 
 @app.get("/api/dashboard/earnings", response_model=schemas.EarningsResponse)
 def get_earnings(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_employee)
+    current_user: auth.Principal = Depends(get_current_employee)
 ):
-    """Get earnings statistics - hanya employee yang bisa akses"""
-    # Get all paid transactions
-    paid_transactions = db.query(models.Transaction).filter(models.Transaction.status == "paid").all()
-    pending_transactions = db.query(models.Transaction).filter(models.Transaction.status == "pending").all()
-    failed_transactions = db.query(models.Transaction).filter(models.Transaction.status == "failed").all()
-    
-    total_earnings = sum(float(t.total_amount) for t in paid_transactions)
+    """Get earnings statistics - hanya employee yang bisa akses (dibaca dari rollup harian)"""
+    totals = earnings.get_totals(db)
+    paid_count, paid_amount = totals.get("paid", (0, 0))
     
     return {
-        "total_earnings": total_earnings,
-        "paid_count": len(paid_transactions),
-        "pending_count": len(pending_transactions),
-        "failed_count": len(failed_transactions)
+        "total_earnings": float(paid_amount),
+        "paid_count": paid_count,
+        "pending_count": totals.get("pending", (0, 0))[0],
+        "failed_count": totals.get("failed", (0, 0))[0]
     }
 
 
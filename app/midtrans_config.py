@@ -1,33 +1,374 @@
 import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+import httpx
+import requests
+from fastapi import HTTPException, status
 from midtransclient import Snap, CoreApi
+from midtransclient.config import ApiConfig
+from midtransclient.error_midtrans import MidtransAPIError
+from requests.adapters import HTTPAdapter
+
+from .instrumentation import record_midtrans
 
 # Midtrans Configuration dari Environment Variables
 MIDTRANS_SERVER_KEY = os.getenv("MIDTRANS_SERVER_KEY", "")
 MIDTRANS_CLIENT_KEY = os.getenv("MIDTRANS_CLIENT_KEY", "")
 MIDTRANS_IS_PRODUCTION = os.getenv("MIDTRANS_IS_PRODUCTION", "false").lower() == "true"
-MIDTRANS_API_URL = os.getenv("MIDTRANS_API_URL", "https://app.sandbox.midtrans.com")
 
-# Initialize Midtrans Snap API
+
+def midtrans_base_urls(is_production: bool, stub_url: str = "", snap_url: str = "", core_url: str = "") -> tuple:
+    """
+    (Snap base URL, Core API base URL), sama dengan yang dipakai midtransclient untuk is_production.
+    stub_url (MIDTRANS_STUB_URL) mengganti keduanya, hanya untuk stub lokal (benchmark / test) dan
+    ditolak di production. snap_url / core_url (MIDTRANS_API_URL / MIDTRANS_CORE_API_URL, hanya
+    ada di .env lama) tidak dipakai; ValueError jika host-nya tidak cocok dengan MIDTRANS_IS_PRODUCTION.
+    """
+    if stub_url:
+        if is_production:
+            raise ValueError("MIDTRANS_STUB_URL cannot be used with MIDTRANS_IS_PRODUCTION=true")
+        stub_url = stub_url.rstrip("/")
+        return f"{stub_url}/snap/v1", stub_url
+    if is_production:
+        snap_base, core_base = ApiConfig.SNAP_PRODUCTION_BASE_URL, ApiConfig.CORE_PRODUCTION_BASE_URL
+    else:
+        snap_base, core_base = ApiConfig.SNAP_SANDBOX_BASE_URL, ApiConfig.CORE_SANDBOX_BASE_URL
+    legacy = (("MIDTRANS_API_URL", snap_url, snap_base), ("MIDTRANS_CORE_API_URL", core_url, core_base))
+    for name, configured, expected in legacy:
+        if configured and urlsplit(configured).netloc != urlsplit(expected).netloc:
+            raise ValueError(
+                f"{name}={configured} does not match MIDTRANS_IS_PRODUCTION={str(is_production).lower()} "
+                f"(expected {expected}); remove {name}, the URL follows MIDTRANS_IS_PRODUCTION"
+            )
+    return snap_base, core_base
+
+
+MIDTRANS_SNAP_BASE_URL, MIDTRANS_CORE_BASE_URL = midtrans_base_urls(
+    MIDTRANS_IS_PRODUCTION,
+    stub_url=os.getenv("MIDTRANS_STUB_URL", ""),
+    snap_url=os.getenv("MIDTRANS_API_URL", ""),
+    core_url=os.getenv("MIDTRANS_CORE_API_URL", ""),
+)
+
+# HTTP session: timeout (detik) dan ukuran connection pool keep-alive
+MIDTRANS_CONNECT_TIMEOUT = float(os.getenv("MIDTRANS_CONNECT_TIMEOUT", "3.05"))
+MIDTRANS_READ_TIMEOUT = float(os.getenv("MIDTRANS_READ_TIMEOUT", "10"))
+MIDTRANS_POOL_SIZE = int(os.getenv("MIDTRANS_POOL_SIZE", "10"))
+
+# Circuit breaker: buka setelah N kegagalan berturut-turut, coba lagi setelah reset timeout
+MIDTRANS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("MIDTRANS_BREAKER_FAILURE_THRESHOLD", "5"))
+MIDTRANS_BREAKER_RESET_TIMEOUT = float(os.getenv("MIDTRANS_BREAKER_RESET_TIMEOUT", "30"))
+
+
+class MidtransUnavailable(HTTPException):
+    """Midtrans tidak bisa dihubungi / circuit breaker terbuka (dijawab 503 ke client)"""
+
+    def __init__(self, detail: str, retry_after: float = MIDTRANS_BREAKER_RESET_TIMEOUT):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(retry_after)))},
+        )
+
+
+class CircuitBreaker:
+    """
+    closed: semua request diteruskan.
+    open: request langsung gagal (MidtransUnavailable) sampai reset_timeout habis.
+    half_open: satu request percobaan; sukses -> closed, gagal -> open lagi.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.rejected_count = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected_count += 1
+        raise MidtransUnavailable("Payment provider is temporarily unavailable, please retry later", max(remaining, 1))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened_count += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Request dibatalkan / error di luar jaringan: lepas slot probe tanpa mengubah state"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "opened_count": self.opened_count,
+                "rejected_count": self.rejected_count,
+            }
+
+
+class LatencyStats:
+    """Latency request ke Midtrans (persentil dari sample terakhir)"""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.error_count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.count += 1
+            self.error_count += int(error)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self._recent.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, error_count, total, maximum = self.count, self.error_count, self.total_seconds, self.max_seconds
+
+        def percentile(p: float) -> Optional[float]:
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 2)
+
+        return {
+            "count": count,
+            "error_count": error_count,
+            "avg_ms": round(total / count * 1000, 2) if count else None,
+            "max_ms": round(maximum * 1000, 2),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+breaker = CircuitBreaker(MIDTRANS_BREAKER_FAILURE_THRESHOLD, MIDTRANS_BREAKER_RESET_TIMEOUT)
+latency = LatencyStats()
+
+
+def _record_call(started: float, error: bool):
+    """Catat latency global + waktu Midtrans untuk request HTTP yang sedang berjalan"""
+    elapsed = time.perf_counter() - started
+    latency.record(elapsed, error=error)
+    record_midtrans(elapsed)
+
+
+class MidtransSession(requests.Session):
+    """
+    requests.Session untuk midtransclient: koneksi keep-alive di-pool, timeout default
+    (connect, read), dan setiap request lewat circuit breaker + dicatat latency-nya.
+    Error jaringan dan HTTP 5xx dihitung sebagai kegagalan; 4xx (mis. order tidak ditemukan) tidak.
+    """
+
+    def __init__(self):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=MIDTRANS_POOL_SIZE, pool_maxsize=MIDTRANS_POOL_SIZE)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (MIDTRANS_CONNECT_TIMEOUT, MIDTRANS_READ_TIMEOUT))
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException as e:
+            _record_call(started, error=True)
+            breaker.record_failure()
+            raise MidtransUnavailable(f"Payment provider request failed: {e.__class__.__name__}") from e
+        except BaseException:
+            breaker.release_probe()
+            raise
+        failed = response.status_code >= 500
+        _record_call(started, error=failed)
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+
+_session = None
+_snap = None
+_core = None
+_clients_lock = threading.Lock()
+
+
+def _use_base_urls(api_config: ApiConfig):
+    """Client sync midtransclient memakai base URL yang sama dengan client async (termasuk stub)"""
+    api_config.SNAP_SANDBOX_BASE_URL = api_config.SNAP_PRODUCTION_BASE_URL = MIDTRANS_SNAP_BASE_URL
+    api_config.CORE_SANDBOX_BASE_URL = api_config.CORE_PRODUCTION_BASE_URL = MIDTRANS_CORE_BASE_URL
+
+
+def _get_session() -> MidtransSession:
+    global _session
+    if _session is None:
+        _session = MidtransSession()
+    return _session
+
+
+# Initialize Midtrans Snap API (satu instance per proses)
 def get_midtrans_snap():
     """Get Midtrans Snap API instance"""
+    global _snap
     if not MIDTRANS_SERVER_KEY:
         raise ValueError("MIDTRANS_SERVER_KEY is not set in environment variables")
-    
-    return Snap(
-        is_production=MIDTRANS_IS_PRODUCTION,
-        server_key=MIDTRANS_SERVER_KEY,
-        client_key=MIDTRANS_CLIENT_KEY
-    )
-
-# Initialize Midtrans Core API
+
+    with _clients_lock:
+        if _snap is None:
+            snap = Snap(
+                is_production=MIDTRANS_IS_PRODUCTION,
+                server_key=MIDTRANS_SERVER_KEY,
+                client_key=MIDTRANS_CLIENT_KEY
+            )
+            snap.http_client.http_client = _get_session()
+            _use_base_urls(snap.api_config)
+            _snap = snap
+        return _snap
+
+# Initialize Midtrans Core API (satu instance per proses)
 def get_midtrans_core():
     """Get Midtrans Core API instance"""
+    global _core
+    if not MIDTRANS_SERVER_KEY:
+        raise ValueError("MIDTRANS_SERVER_KEY is not set in environment variables")
+
+    with _clients_lock:
+        if _core is None:
+            core = CoreApi(
+                is_production=MIDTRANS_IS_PRODUCTION,
+                server_key=MIDTRANS_SERVER_KEY,
+                client_key=MIDTRANS_CLIENT_KEY
+            )
+            core.http_client.http_client = _get_session()
+            _use_base_urls(core.api_config)
+            _core = core
+        return _core
+
+
+class AsyncMidtransClient:
+    """
+    Client async (httpx) untuk Snap dan Core API, dipakai endpoint async supaya request
+    ke Midtrans tidak memakai thread dari threadpool. Error, timeout, circuit breaker
+    dan metrics sama dengan client sync (MidtransSession).
+    """
+
+    def __init__(self, server_key: str):
+        self._client = httpx.AsyncClient(
+            auth=(server_key, ""),
+            timeout=httpx.Timeout(MIDTRANS_READ_TIMEOUT, connect=MIDTRANS_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MIDTRANS_POOL_SIZE, max_keepalive_connections=MIDTRANS_POOL_SIZE),
+            headers={"accept": "application/json"},
+        )
+
+    async def _request(self, method: str, url: str, json: Optional[dict] = None) -> dict:
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            response = await self._client.request(method, url, json=json)
+        except httpx.HTTPError as e:
+            _record_call(started, error=True)
+            breaker.record_failure()
+            raise MidtransUnavailable(f"Payment provider request failed: {e.__class__.__name__}") from e
+        except BaseException:
+            # CancelledError, httpx.InvalidURL, dll: probe half_open tidak boleh tertahan
+            breaker.release_probe()
+            raise
+        failed = response.status_code >= 500
+        _record_call(started, error=failed)
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        # Error mapping sama seperti midtransclient.HttpClient
+        try:
+            response_dict = response.json()
+        except ValueError:
+            response_dict = {}
+        if response.status_code >= 400 or (
+            "status_code" in response_dict
+            and int(response_dict["status_code"]) >= 400
+            and int(response_dict["status_code"]) != 407
+        ):
+            raise MidtransAPIError(
+                message=f"Midtrans API is returning API error. HTTP status code: `{response.status_code}`. "
+                f"API response: `{response.text}`",
+                api_response_dict=response_dict,
+                http_status_code=response.status_code,
+                raw_http_client_data=response,
+            )
+        return response_dict
+
+    async def create_transaction(self, parameters: dict) -> dict:
+        """Snap API: buat transaksi, return dict dengan `token` dan `redirect_url`"""
+        return await self._request("POST", f"{MIDTRANS_SNAP_BASE_URL}/transactions", json=parameters)
+
+    async def transaction_status(self, order_id: str) -> dict:
+        """Core API: status transaksi untuk order_id"""
+        return await self._request("GET", f"{MIDTRANS_CORE_BASE_URL}/v2/{quote(order_id, safe='')}/status")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_async_client = None
+
+
+def get_async_midtrans() -> AsyncMidtransClient:
+    """Get client async Midtrans (satu instance per proses, dibuat di event loop aplikasi)"""
+    global _async_client
     if not MIDTRANS_SERVER_KEY:
         raise ValueError("MIDTRANS_SERVER_KEY is not set in environment variables")
-    
-    return CoreApi(
-        is_production=MIDTRANS_IS_PRODUCTION,
-        server_key=MIDTRANS_SERVER_KEY,
-        client_key=MIDTRANS_CLIENT_KEY
-    )
+    if _async_client is None:
+        _async_client = AsyncMidtransClient(MIDTRANS_SERVER_KEY)
+    return _async_client
+
+
+async def close_async_midtrans():
+    """Tutup connection pool client async (dipanggil saat aplikasi shutdown)"""
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client, None
+        await client.aclose()
+
 
+def midtrans_stats() -> dict:
+    return {"breaker": breaker.stats(), "latency": latency.snapshot()}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime, Date, Numeric, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -47,7 +47,7 @@ class Product(Base):
     name = Column(String(200), nullable=False, index=True)
     price = Column(Numeric(10, 2), nullable=False)
     description = Column(Text, nullable=True)
-    image_url = Column(String(500), nullable=True)
+    image_url = Column(String(500), nullable=True, index=True)  # Index untuk reference count file upload
     stock = Column(Integer, default=0, nullable=False)  # Stock quantity
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -57,6 +57,16 @@ class Product(Base):
     # Relasi: product dibuat oleh user (sales/admin)
     creator = relationship("User", foreign_keys=[created_by])
 
+    __table_args__ = (
+        # Katalog: WHERE is_active ORDER BY id (keyset by id), hanya produk aktif yang di-index
+        Index(
+            "ix_products_active_id",
+            "id",
+            postgresql_where=text("is_active"),
+            sqlite_where=text("is_active = 1"),
+        ),
+    )
+
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -67,7 +77,7 @@ class Transaction(Base):
     product_id = Column(Integer, ForeignKey("products.id"), nullable=True)  # Nullable jika custom order
     quantity = Column(Integer, default=1, nullable=False)
     total_amount = Column(Numeric(10, 2), nullable=False)
-    status = Column(String(50), default="pending", nullable=False, index=True)  # pending, paid, failed, cancelled
+    status = Column(String(50), default="pending", nullable=False)  # pending, paid, failed, refunded, cancelled
     payment_method = Column(String(50), nullable=True)
     midtrans_transaction_id = Column(String(100), nullable=True, index=True)
     # Informasi pengiriman / alamat customer pada saat checkout
@@ -83,16 +93,24 @@ class Transaction(Base):
     customer = relationship("User", foreign_keys=[customer_id])
     product = relationship("Product", foreign_keys=[product_id])
 
+    __table_args__ = (
+        # Keyset pagination: ORDER BY created_at DESC, id DESC
+        Index("ix_transactions_created_at_id", "created_at", "id"),
+        # Listing per customer dan per status dengan urutan yang sama (tanpa sort)
+        Index("ix_transactions_customer_created_at_id", customer_id, created_at.desc(), id.desc()),
+        Index("ix_transactions_status_created_at_id", status, created_at.desc(), id.desc()),
+    )
+
 
 class Payment(Base):
     __tablename__ = "payments"
 
     id = Column(Integer, primary_key=True, index=True)
     transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False, index=True)
-    order_id = Column(String(100), nullable=False, index=True)
+    order_id = Column(String(100), unique=True, nullable=False, index=True)
     gross_amount = Column(Numeric(10, 2), nullable=False)
     payment_type = Column(String(50), nullable=True)
-    transaction_status = Column(String(50), nullable=False, index=True)  # pending, settlement, cancel, expire, deny
+    transaction_status = Column(String(50), nullable=False)  # pending, settlement, cancel, expire, deny
     fraud_status = Column(String(50), nullable=True)
     transaction_time = Column(DateTime(timezone=True), nullable=True)
     status_message = Column(String(500), nullable=True)
@@ -103,4 +121,56 @@ class Payment(Base):
     # Relasi
     transaction = relationship("Transaction", foreign_keys=[transaction_id])
 
+    __table_args__ = (
+        # Keyset pagination: ORDER BY created_at DESC, id DESC
+        Index("ix_payments_created_at_id", "created_at", "id"),
+        # Filter transaction_status dengan urutan yang sama (tanpa sort)
+        Index("ix_payments_transaction_status_created_at_id", transaction_status, created_at.desc(), id.desc()),
+    )
+
+
+class TransactionDailyStat(Base):
+    """Rollup jumlah dan total transaksi per hari per status (dipakai dashboard earnings)"""
+    __tablename__ = "transaction_daily_stats"
 
+    day = Column(Date, primary_key=True)  # Tanggal transaksi dibuat
+    status = Column(String(50), primary_key=True)  # pending, paid, failed, refunded, cancelled
+    transaction_count = Column(Integer, default=0, nullable=False)
+    total_amount = Column(Numeric(14, 2), default=0, nullable=False)
+
+
+class WebhookInbox(Base):
+    """Notifikasi webhook Midtrans mentah, diproses oleh worker background (app.webhook_inbox)"""
+    __tablename__ = "webhook_inbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    payload = Column(Text, nullable=False)  # Body mentah dari Midtrans
+    order_id = Column(String(100), nullable=True, index=True)  # Diisi saat diproses
+    received_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    error = Column(Text, nullable=True)  # Pesan error jika gagal diterapkan
+    # Percobaan yang gagal karena error database sementara; entry ditunda sampai next_attempt_at
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Worker hanya mencari entry yang belum diproses
+        Index(
+            "ix_webhook_inbox_pending",
+            "id",
+            postgresql_where=text("processed_at IS NULL"),
+            sqlite_where=text("processed_at IS NULL"),
+        ),
+    )
+
+
+class SnapToken(Base):
+    """Snap token yang sudah diterbitkan per order_id, dipakai ulang selama belum expired"""
+    __tablename__ = "snap_tokens"
+
+    order_id = Column(String(100), primary_key=True)
+    gross_amount = Column(Numeric(10, 2), nullable=False)  # Token hanya dipakai ulang untuk amount yang sama
+    token = Column(String(255), nullable=False)
+    redirect_url = Column(String(500), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
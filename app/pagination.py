@@ -0,0 +1,102 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import String, and_, or_, tuple_, type_coerce
+
+# Header tempat cursor halaman berikutnya dikirim ke client
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """Encode nilai keyset (mis. created_at, id) menjadi cursor opaque"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode cursor opaque, raise 400 jika format tidak valid"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _sqlite_created_at_before(model, created_at: datetime, last_id: int):
+    """
+    (created_at, id) < cursor untuk SQLite, yang menyimpan DateTime sebagai teks dan
+    mengurutkannya sebagai teks: server_default (CURRENT_TIMESTAMP) menulis
+    'YYYY-MM-DD HH:MM:SS', sedangkan SQLAlchemy menulis 'YYYY-MM-DD HH:MM:SS.ffffff'.
+    Cursor dibandingkan dengan kedua bentuk teks; tanpa ini baris dengan created_at
+    yang sama dengan cursor selalu lolos dan client menerima halaman yang sama lagi.
+    """
+    created_at = created_at.replace(tzinfo=None)
+    forms = [created_at.strftime("%Y-%m-%d %H:%M:%S.%f")]
+    if created_at.microsecond == 0:
+        forms.insert(0, created_at.strftime("%Y-%m-%d %H:%M:%S"))
+    column = type_coerce(model.created_at, String)
+    return or_(column < forms[0], and_(column.in_(forms), model.id < last_id))
+
+
+def paginate_by_created_at(query, model, skip: int, limit: int, cursor: Optional[str] = None):
+    """
+    Urutkan (created_at desc, id desc).
+    - Dengan cursor: keyset pagination (WHERE (created_at, id) < cursor), skip diabaikan
+    - Tanpa cursor: offset(skip) seperti sebelumnya
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, last_id = decode_cursor(cursor, 2)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if query.session.get_bind().dialect.name == "sqlite":
+            query = query.filter(_sqlite_created_at_before(model, created_at, last_id))
+        else:
+            query = query.filter(tuple_(model.created_at, model.id) < (created_at, last_id))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def paginate_by_id(query, model, skip: int, limit: int, cursor: Optional[str] = None):
+    """
+    Urutkan id asc.
+    - Dengan cursor: keyset pagination (WHERE id > cursor), skip diabaikan
+    - Tanpa cursor: offset(skip) seperti sebelumnya
+    """
+    query = query.order_by(model.id.asc())
+    if cursor:
+        (last_id,) = decode_cursor(cursor, 1)
+        try:
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(model.id > last_id)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def next_cursor(rows: list, limit: int, *fields: str) -> Optional[str]:
+    """Cursor halaman berikutnya jika halaman penuh (kemungkinan masih ada data), selain itu None"""
+    if rows and len(rows) >= limit:
+        last = rows[-1]
+        return encode_cursor(*(getattr(last, field) for field in fields))
+    return None
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, *fields: str):
+    """Set header X-Next-Cursor jika ada halaman berikutnya"""
+    cursor = next_cursor(rows, limit, *fields)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
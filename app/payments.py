@@ -0,0 +1,265 @@
+"""
+State machine pembayaran Midtrans.
+
+Satu-satunya tempat yang menerapkan status Midtrans ke Payment, Transaction,
+stock dan rollup earnings. Dipakai oleh worker webhook inbox, manual-update
+dan check-status.
+
+Di PostgreSQL, upsert Payment (ON CONFLICT order_id) dan perubahan
+Transaction.status dikirim sebagai satu statement (data-modifying CTE):
+
+    WITH payment_upsert AS (
+        INSERT INTO payments (...) SELECT ... FROM transactions WHERE order_id = :order_id
+        ON CONFLICT (order_id) DO UPDATE SET ... RETURNING payments.transaction_id
+    )
+    UPDATE transactions SET status = :new_status
+    FROM (SELECT id, status FROM transactions WHERE order_id = :order_id FOR UPDATE) AS previous
+    WHERE transactions.id = previous.id AND transactions.id IN (SELECT transaction_id FROM payment_upsert)
+    RETURNING previous.status, ...
+
+Sub-select FOR UPDATE membuat status sebelumnya selalu dibaca setelah lock,
+jadi dua settlement paralel untuk order yang sama tidak mengurangi stock dua kali.
+Dialect lain (SQLite untuk dev/benchmark) menjalankan upsert, SELECT status dan UPDATE berurutan.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import earnings, models, stock
+
+# Status Midtrans -> status Transaction; None = Payment dicatat, Transaction tidak berubah
+# (status yang bisa datang terlambat setelah settlement tidak boleh mengembalikan order ke pending)
+MIDTRANS_STATUS_MAP = {
+    "settlement": "paid",
+    "capture": "paid",
+    # Sebagian dana dikembalikan, order tetap dibayar
+    "partial_refund": "paid",
+    "refund": "refunded",
+    "deny": "failed",
+    "cancel": "failed",
+    "expire": "failed",
+    "failure": "failed",
+    "pending": None,
+    # Kartu baru diotorisasi (belum capture)
+    "authorize": None,
+}
+
+
+@dataclass(frozen=True)
+class TransitionResult:
+    found: bool  # False jika tidak ada Transaction dengan order_id tersebut
+    transaction_id: Optional[int] = None
+    previous_status: Optional[str] = None
+    status: Optional[str] = None
+    stock_changed: bool = False
+
+
+def map_midtrans_status(transaction_status: Optional[str]) -> Optional[str]:
+    return MIDTRANS_STATUS_MAP.get(transaction_status)
+
+
+def _parse_transaction_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(models.Payment)
+    return postgresql.insert(models.Payment)
+
+
+def _payment_upsert(
+    db: Session,
+    order_id: str,
+    transaction_status: str,
+    midtrans_transaction_id: Optional[str],
+    fallback_midtrans_transaction_id: Optional[str],
+    gross_amount: Optional[Decimal],
+    payment_type: Optional[str],
+    fraud_status: Optional[str],
+    status_message: Optional[str],
+    transaction_time: Optional[datetime],
+):
+    """INSERT Payment dari Transaction dengan order_id tersebut, atau UPDATE jika sudah ada"""
+    payment = models.Payment
+    transaction = models.Transaction
+    source = select(
+        transaction.id,
+        literal(order_id, payment.order_id.type),
+        func.coalesce(literal(gross_amount, payment.gross_amount.type), transaction.total_amount),
+        literal(payment_type, payment.payment_type.type),
+        literal(transaction_status, payment.transaction_status.type),
+        literal(fraud_status, payment.fraud_status.type),
+        literal(midtrans_transaction_id or fallback_midtrans_transaction_id, payment.midtrans_transaction_id.type),
+        literal(status_message, payment.status_message.type),
+        literal(transaction_time, payment.transaction_time.type),
+    ).where(transaction.order_id == order_id)
+    stmt = _insert(db).from_select(
+        [
+            "transaction_id", "order_id", "gross_amount", "payment_type", "transaction_status",
+            "fraud_status", "midtrans_transaction_id", "status_message", "transaction_time",
+        ],
+        source,
+    )
+    # Field yang tidak dikirim (None) mempertahankan nilai lama
+    return stmt.on_conflict_do_update(
+        index_elements=[payment.order_id],
+        set_={
+            "transaction_status": stmt.excluded.transaction_status,
+            "payment_type": func.coalesce(stmt.excluded.payment_type, payment.payment_type),
+            "fraud_status": func.coalesce(stmt.excluded.fraud_status, payment.fraud_status),
+            "status_message": func.coalesce(stmt.excluded.status_message, payment.status_message),
+            "transaction_time": func.coalesce(stmt.excluded.transaction_time, payment.transaction_time),
+            "midtrans_transaction_id": func.coalesce(
+                literal(midtrans_transaction_id, payment.midtrans_transaction_id.type),
+                payment.midtrans_transaction_id,
+            ),
+            "updated_at": func.now(),
+        },
+    ).returning(payment.transaction_id)
+
+
+def _transaction_update(order_id: str, new_status: str, midtrans_transaction_id: Optional[str], previous=None):
+    """
+    UPDATE Transaction.status, return status sebelumnya. Tanpa `previous`, status sebelumnya
+    dibaca di sub-select FOR UPDATE (setelah row di-lock) dalam statement yang sama.
+    """
+    transaction = models.Transaction
+    values = {"status": new_status}
+    if new_status == "paid":
+        values["midtrans_transaction_id"] = func.coalesce(
+            literal(midtrans_transaction_id, transaction.midtrans_transaction_id.type),
+            transaction.midtrans_transaction_id,
+        )
+    returning = (
+        transaction.id,
+        transaction.product_id,
+        transaction.quantity,
+        transaction.total_amount,
+        transaction.created_at,
+    )
+    if previous is not None:
+        return (
+            update(transaction)
+            .where(transaction.id == previous.id)
+            .values(**values)
+            .returning(*returning, literal(previous.previous_status).label("previous_status"))
+            .execution_options(synchronize_session=False)
+        )
+    locked = (
+        select(transaction.id, transaction.status.label("previous_status"))
+        .where(transaction.order_id == order_id)
+        .with_for_update()
+        .subquery("previous")
+    )
+    return (
+        update(transaction)
+        .where(transaction.id == locked.c.id)
+        .values(**values)
+        .returning(*returning, locked.c.previous_status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def apply_transition(
+    db: Session,
+    order_id: str,
+    transaction_status: str,
+    midtrans_transaction_id: Optional[str] = None,
+    gross_amount=None,
+    payment_type: Optional[str] = None,
+    fraud_status: Optional[str] = None,
+    status_message: Optional[str] = None,
+    transaction_time: Optional[str] = None,
+    fallback_midtrans_transaction_id: Optional[str] = None,
+) -> TransitionResult:
+    """
+    Terapkan status Midtrans untuk satu order: upsert Payment, ubah Transaction.status,
+    kurangi stock saat menjadi paid (kembalikan saat paid menjadi failed / refunded),
+    dan update rollup earnings.
+    Tidak commit; caller yang commit (dan invalidate catalog jika stock_changed).
+    """
+    new_status = map_midtrans_status(transaction_status)
+    upsert = _payment_upsert(
+        db,
+        order_id,
+        transaction_status,
+        midtrans_transaction_id,
+        fallback_midtrans_transaction_id,
+        Decimal(str(gross_amount)) if gross_amount else None,
+        payment_type,
+        fraud_status,
+        status_message,
+        _parse_transaction_time(transaction_time),
+    )
+
+    if db.get_bind().dialect.name == "postgresql":
+        payment_upsert = upsert.cte("payment_upsert")
+        if new_status is None:
+            row = db.execute(select(payment_upsert.c.transaction_id)).first()
+            if row is None:
+                return TransitionResult(found=False)
+            return TransitionResult(found=True, transaction_id=row.transaction_id)
+        row = db.execute(
+            _transaction_update(order_id, new_status, midtrans_transaction_id)
+            .where(models.Transaction.id.in_(select(payment_upsert.c.transaction_id)))
+        ).first()
+    else:
+        upserted = db.execute(upsert).first()
+        if upserted is None:
+            return TransitionResult(found=False)
+        if new_status is None:
+            return TransitionResult(found=True, transaction_id=upserted.transaction_id)
+        # SQLite: RETURNING tidak bisa membaca kolom dari FROM, jadi status sebelumnya dibaca dulu
+        # (SQLite hanya punya satu writer, tidak ada race di antara SELECT dan UPDATE)
+        previous = db.execute(
+            select(models.Transaction.id, models.Transaction.status.label("previous_status"))
+            .where(models.Transaction.order_id == order_id)
+        ).first()
+        if previous is None:
+            return TransitionResult(found=False)
+        row = db.execute(
+            _transaction_update(order_id, new_status, midtrans_transaction_id, previous)
+        ).first()
+
+    if row is None:
+        return TransitionResult(found=False)
+
+    # Stock hanya berubah saat masuk / keluar dari "paid" (menghindari double decrement)
+    stock_changed = False
+    if row.product_id and new_status == "paid" and row.previous_status != "paid":
+        stock_changed = stock.decrement_stock(db, row.product_id, row.quantity) is not None
+    elif row.product_id and row.previous_status == "paid" and new_status != "paid":
+        stock_changed = stock.increment_stock(db, row.product_id, row.quantity) is not None
+
+    earnings.record_transition(db, row.created_at, row.total_amount, row.previous_status, new_status)
+    return TransitionResult(
+        found=True,
+        transaction_id=row.id,
+        previous_status=row.previous_status,
+        status=new_status,
+        stock_changed=stock_changed,
+    )
+
+
+def apply_notification(db: Session, notification: dict, **kwargs) -> TransitionResult:
+    """apply_transition untuk payload notifikasi / status response Midtrans"""
+    return apply_transition(
+        db,
+        order_id=notification.get("order_id"),
+        transaction_status=notification.get("transaction_status"),
+        midtrans_transaction_id=notification.get("transaction_id"),
+        gross_amount=notification.get("gross_amount"),
+        payment_type=notification.get("payment_type"),
+        fraud_status=notification.get("fraud_status"),
+        status_message=notification.get("status_message"),
+        transaction_time=notification.get("transaction_time"),
+        **kwargs,
+    )
@@ -0,0 +1,182 @@
+"""
+Rekonsiliasi transaksi pending terhadap Midtrans status API.
+
+Untuk webhook yang hilang: ambil semua Transaction yang masih pending lebih
+lama dari threshold, tanya status ke Midtrans Core API (paralel terbatas +
+rate limit), lalu terapkan hasilnya lewat state machine payments dengan
+commit per batch.
+
+    python -m app.reconcile --older-than-minutes 15 --concurrency 4 --rate 5
+
+Client Core API bisa diganti (parameter core_api di reconcile()), cukup objek
+dengan method transactions.status(order_id) -> dict, mis. fake lokal untuk testing.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import catalog, models, payments
+from .database import SessionLocal
+from .logging_config import fields, setup_logging
+from .midtrans_config import get_midtrans_core
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_PENDING_AGE_MINUTES = float(os.getenv("RECONCILE_PENDING_AGE_MINUTES", "15"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))
+RECONCILE_RATE_LIMIT = float(os.getenv("RECONCILE_RATE_LIMIT", "5"))  # request per detik
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "50"))
+
+
+class TokenBucket:
+    """Rate limiter thread-safe: rata-rata `rate` request per detik, burst sampai `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def pending_order_ids(db: Session, older_than: timedelta, limit: Optional[int] = None) -> list:
+    """order_id transaksi yang masih pending dan dibuat sebelum now - older_than (paling lama dulu)"""
+    cutoff = datetime.now(timezone.utc) - older_than
+    query = (
+        select(models.Transaction.order_id)
+        .where(models.Transaction.status == "pending", models.Transaction.created_at < cutoff)
+        .order_by(models.Transaction.created_at, models.Transaction.id)
+    )
+    if limit:
+        query = query.limit(limit)
+    return list(db.execute(query).scalars())
+
+
+def _apply_batch(session_factory: Callable[[], Session], results: list) -> dict:
+    """Terapkan satu batch status response dalam satu commit (error per order di-isolasi savepoint)"""
+    counts = {"updated": 0, "unchanged": 0, "errors": 0}
+    stock_changed = False
+    db = session_factory()
+    try:
+        for order_id, status_response in results:
+            savepoint = db.begin_nested()
+            try:
+                result = payments.apply_notification(db, {**status_response, "order_id": order_id})
+                savepoint.commit()
+            except Exception:
+                savepoint.rollback()
+                counts["errors"] += 1
+                logger.exception("Error applying reconciled status", extra=fields(order_id=order_id))
+                continue
+            if result.status is not None and result.status != result.previous_status:
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+            stock_changed = stock_changed or result.stock_changed
+        db.commit()
+    finally:
+        db.close()
+    if stock_changed:
+        catalog.invalidate()
+    return counts
+
+
+def reconcile(
+    core_api=None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    older_than: timedelta = timedelta(minutes=RECONCILE_PENDING_AGE_MINUTES),
+    concurrency: int = RECONCILE_CONCURRENCY,
+    rate_limit: float = RECONCILE_RATE_LIMIT,
+    batch_size: int = RECONCILE_BATCH_SIZE,
+    limit: Optional[int] = None,
+) -> dict:
+    """Rekonsiliasi transaksi pending, return ringkasan jumlah order per hasil"""
+    core_api = core_api or get_midtrans_core()
+    db = session_factory()
+    try:
+        order_ids = pending_order_ids(db, older_than, limit)
+    finally:
+        db.close()
+
+    summary = {"checked": len(order_ids), "updated": 0, "unchanged": 0, "errors": 0}
+    if not order_ids:
+        return summary
+
+    bucket = TokenBucket(rate_limit)
+
+    def fetch_status(order_id: str) -> dict:
+        bucket.acquire()
+        return core_api.transactions.status(order_id)
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(fetch_status, order_id): order_id for order_id in order_ids}
+        for future in as_completed(futures):
+            order_id = futures[future]
+            try:
+                batch.append((order_id, future.result()))
+            except Exception as e:
+                # Mis. 404 dari Midtrans jika customer belum pernah membuka Snap
+                summary["errors"] += 1
+                logger.warning("Error fetching Midtrans status: %s", e, extra=fields(order_id=order_id))
+            if len(batch) >= batch_size:
+                for key, value in _apply_batch(session_factory, batch).items():
+                    summary[key] += value
+                batch = []
+    if batch:
+        for key, value in _apply_batch(session_factory, batch).items():
+            summary[key] += value
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rekonsiliasi transaksi pending dengan Midtrans status API")
+    parser.add_argument("--older-than-minutes", type=float, default=RECONCILE_PENDING_AGE_MINUTES,
+                        help="hanya transaksi pending yang dibuat lebih lama dari ini")
+    parser.add_argument("--concurrency", type=int, default=RECONCILE_CONCURRENCY,
+                        help="jumlah request status paralel")
+    parser.add_argument("--rate", type=float, default=RECONCILE_RATE_LIMIT,
+                        help="maksimum request per detik ke Midtrans (0 = tanpa batas)")
+    parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH_SIZE,
+                        help="jumlah hasil per commit")
+    parser.add_argument("--limit", type=int, default=None, help="maksimum transaksi yang dicek")
+    args = parser.parse_args()
+
+    setup_logging()
+    summary = reconcile(
+        older_than=timedelta(minutes=args.older_than_minutes),
+        concurrency=args.concurrency,
+        rate_limit=args.rate,
+        batch_size=args.batch_size,
+        limit=args.limit,
+    )
+    print(
+        f"Reconciled {summary['checked']} pending transactions: "
+        f"{summary['updated']} updated, {summary['unchanged']} unchanged, {summary['errors']} errors"
+    )
+
+
+if __name__ == "__main__":
+    main()
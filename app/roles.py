@@ -0,0 +1,72 @@
+"""
+Registry role per proses (id -> nama dan nama -> id).
+
+Tabel roles kecil dan hampir tidak pernah berubah (diisi oleh
+`python -m app.bootstrap`), jadi cukup dimuat sekali lalu dibaca dari memori:
+permission check memakai User.role_id tanpa lazy-load relasi Role dan tanpa
+query tambahan. Jika id/nama tidak ditemukan (mis. role baru ditambahkan
+setelah registry dimuat), registry dimuat ulang dari database lalu dicari lagi.
+"""
+import threading
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+_names = {}  # role_id -> nama
+_ids = {}  # nama -> role_id
+_lock = threading.Lock()
+
+
+def refresh(db: Optional[Session] = None):
+    """Muat ulang semua role dari database (dict diganti utuh, pembaca tidak perlu lock)"""
+    global _names, _ids
+    if db is None:
+        with SessionLocal() as own_db:
+            rows = own_db.execute(select(models.Role.id, models.Role.name)).all()
+    else:
+        rows = db.execute(select(models.Role.id, models.Role.name)).all()
+    with _lock:
+        _names = {role_id: name for role_id, name in rows}
+        _ids = {name: role_id for role_id, name in rows}
+
+
+def clear():
+    """Kosongkan registry (dimuat ulang saat lookup berikutnya)"""
+    global _names, _ids
+    with _lock:
+        _names, _ids = {}, {}
+
+
+def name(role_id: Optional[int], db: Optional[Session] = None) -> Optional[str]:
+    """Nama role untuk role_id, refresh dari database (db atau session sendiri) jika belum dikenal"""
+    if role_id is None:
+        return None
+    if role_id not in _names:
+        refresh(db)
+    return _names.get(role_id)
+
+
+async def name_async(db: AsyncSession, role_id: Optional[int]) -> Optional[str]:
+    if role_id is None:
+        return None
+    if role_id not in _names:
+        await db.run_sync(refresh)
+    return _names.get(role_id)
+
+
+def id_for(role_name: str, db: Optional[Session] = None) -> Optional[int]:
+    """role_id untuk nama role, refresh dari database jika belum dikenal"""
+    if role_name not in _ids:
+        refresh(db)
+    return _ids.get(role_name)
+
+
+async def id_for_async(db: AsyncSession, role_name: str) -> Optional[int]:
+    if role_name not in _ids:
+        await db.run_sync(refresh)
+    return _ids.get(role_name)
@@ -2,7 +2,9 @@ from typing import Optional
 from datetime import datetime
 from decimal import Decimal
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, computed_field
+
+from .uploads import variant_urls
 
 
 # Auth Schemas
@@ -148,6 +150,12 @@ class Product(ProductBase):
     is_active: bool
     creator_name: Optional[str] = None
 
+    @computed_field
+    @property
+    def image_variants(self) -> dict[str, str]:
+        """URL thumbnail per lebar (px), dibuat di background setelah upload"""
+        return variant_urls(self.image_url)
+
     class Config:
         from_attributes = True
 
@@ -0,0 +1,88 @@
+"""
+Cache Snap token per order_id (tabel snap_tokens).
+
+Customer yang retry / double-click / reload CustomerPage memanggil
+/api/payment/create lagi dengan order_id yang sama; selama amount sama dan
+token belum expired, token + redirect_url yang tersimpan dikembalikan tanpa
+request ke Midtrans. Masa berlaku mengikuti Snap token (default 24 jam).
+
+Request yang datang bersamaan untuk order_id yang sama (sebelum token tersimpan)
+diserialisasi dengan order_lock: hanya satu yang request ke Snap, sisanya menunggu
+lalu memakai token yang sudah disimpan. Lock hanya berlaku dalam satu proses worker.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+SNAP_TOKEN_TTL = timedelta(hours=float(os.getenv("SNAP_TOKEN_TTL_HOURS", "24")))
+# Token yang tinggal sebentar lagi expired tidak dipakai ulang (customer butuh waktu untuk membayar)
+SNAP_TOKEN_MIN_REMAINING = timedelta(minutes=float(os.getenv("SNAP_TOKEN_MIN_REMAINING_MINUTES", "15")))
+
+
+# order_id -> [asyncio.Lock, jumlah request yang memakai / menunggu lock]
+_order_locks: dict = {}
+
+
+@asynccontextmanager
+async def order_lock(order_id: str):
+    """Satu request Snap in-flight per order_id; entry dihapus saat tidak ada yang menunggu"""
+    entry = _order_locks.setdefault(order_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _order_locks[order_id]
+
+
+def _amount(gross_amount) -> Decimal:
+    return Decimal(str(gross_amount)).quantize(Decimal("0.01"))
+
+
+def _insert(db: AsyncSession):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(models.SnapToken)
+    return postgresql.insert(models.SnapToken)
+
+
+async def get_valid(db: AsyncSession, order_id: str, gross_amount) -> Optional[models.SnapToken]:
+    """Token tersimpan untuk order_id + amount yang sama dan masih berlaku, atau None"""
+    return (await db.execute(
+        select(models.SnapToken).where(
+            models.SnapToken.order_id == order_id,
+            models.SnapToken.gross_amount == _amount(gross_amount),
+            models.SnapToken.expires_at > datetime.now(timezone.utc) + SNAP_TOKEN_MIN_REMAINING,
+        )
+    )).scalar_one_or_none()
+
+
+async def store(db: AsyncSession, order_id: str, gross_amount, token: str, redirect_url: str):
+    """Simpan (atau ganti) token untuk order_id; caller yang commit"""
+    stmt = _insert(db).values(
+        order_id=order_id,
+        gross_amount=_amount(gross_amount),
+        token=token,
+        redirect_url=redirect_url,
+        expires_at=datetime.now(timezone.utc) + SNAP_TOKEN_TTL,
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.SnapToken.order_id],
+        set_={
+            "gross_amount": stmt.excluded.gross_amount,
+            "token": stmt.excluded.token,
+            "redirect_url": stmt.excluded.redirect_url,
+            "created_at": func.now(),
+            "expires_at": stmt.excluded.expires_at,
+        },
+    ))
@@ -0,0 +1,51 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models
+from .logging_config import fields, sampled
+
+logger = logging.getLogger(__name__)
+
+
+def decrement_stock(db: Session, product_id: int, quantity: int) -> Optional[int]:
+    """
+    Kurangi stock produk secara atomic dengan satu conditional UPDATE:
+        UPDATE products SET stock = stock - :quantity
+        WHERE id = :product_id AND stock >= :quantity
+        RETURNING stock
+    Tidak ada read-modify-write di Python, jadi settlement paralel untuk produk
+    yang sama tidak saling menimpa (dan tanpa SELECT ... FOR UPDATE).
+    Return stock baru, atau None jika produk tidak ada / stock tidak cukup.
+    """
+    new_stock = db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id, models.Product.stock >= quantity)
+        .values(stock=models.Product.stock - quantity)
+        .returning(models.Product.stock)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if new_stock is None:
+        logger.warning("Insufficient stock", extra=fields(product_id=product_id, requested=quantity))
+    else:
+        logger.info("Stock reduced", extra=sampled(product_id=product_id, quantity=quantity, stock=new_stock))
+    return new_stock
+
+
+def increment_stock(db: Session, product_id: int, quantity: int) -> Optional[int]:
+    """
+    Kembalikan stock produk (order paid menjadi failed / refunded) dengan satu UPDATE atomic.
+    Return stock baru, atau None jika produk sudah tidak ada.
+    """
+    new_stock = db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id)
+        .values(stock=models.Product.stock + quantity)
+        .returning(models.Product.stock)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if new_stock is not None:
+        logger.info("Stock restored", extra=sampled(product_id=product_id, quantity=quantity, stock=new_stock))
+    return new_stock
@@ -0,0 +1,269 @@
+"""
+Penyimpanan gambar produk di UPLOAD_DIR (di-serve lewat /uploads).
+
+- Upload ditulis per chunk tanpa memblok event loop, dengan batas ukuran.
+- Nama file = sha256 isi file, jadi upload ulang gambar yang sama tidak
+  menulis file baru dan memakai URL yang sama.
+- Reference count dihitung dari products.image_url: file lama hanya dihapus
+  jika tidak ada produk lain (aktif maupun soft-deleted) yang memakainya.
+  Upload paralel dengan isi yang sama bisa commit produk baru tepat saat file
+  dihapus, jadi release_upload memindahkan file dulu, menghitung ulang
+  reference, lalu mengembalikannya jika perlu; save_upload menyimpan salinan
+  cadangan sampai caller memanggil confirm_upload setelah commit.
+- Setelah disimpan, varian lebar tetap (thumbnail) dibuat di background
+  process pool dan disimpan di sebelah file asli: <sha256>_w<lebar><ext>.
+  Hanya varian yang file-nya sudah ada yang di-listing (gambar lama / bukan
+  gambar tidak punya varian); backfill lewat python -m app.backfill_variants.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from . import catalog, models
+from .logging_config import fields
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_URL_PREFIX = "/uploads/"
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(5 * 1024 * 1024)))  # bytes, default 5 MB
+CHUNK_SIZE = 1024 * 1024
+
+# Lebar varian thumbnail (px) dan jumlah proses pembuat varian
+IMAGE_VARIANT_WIDTHS = tuple(
+    int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640").split(",") if width.strip()
+)
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "1"))
+_variant_pool = None
+_variant_pool_lock = threading.Lock()
+
+_EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+def _file_extension(filename: Optional[str]) -> str:
+    """Ambil extension yang aman dari nama file upload (default .jpg)"""
+    extension = os.path.splitext(filename)[1].lower() if filename else ""
+    return extension if _EXTENSION_RE.match(extension) else ".jpg"
+
+
+def path_for_url(image_url: Optional[str]) -> Optional[str]:
+    """Path file di disk untuk URL /uploads/..., None jika bukan file upload lokal"""
+    if not image_url or not image_url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    filename = os.path.basename(image_url[len(UPLOAD_URL_PREFIX):])
+    return os.path.join(UPLOAD_DIR, filename) if filename else None
+
+
+def variant_filename(filename: str, width: int) -> str:
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_w{width}{extension}"
+
+
+def variant_urls(image_url: Optional[str]) -> dict:
+    """
+    URL varian thumbnail per lebar yang sudah dibuat, mis. {"320": "/uploads/<hash>_w320.jpg"}.
+    Varian ditulis lewat rename atomic, jadi file yang ada selalu lengkap.
+    """
+    file_path = path_for_url(image_url)
+    if file_path is None:
+        return {}
+    return {
+        str(width): variant_filename(image_url, width)
+        for width in IMAGE_VARIANT_WIDTHS
+        if os.path.exists(variant_filename(file_path, width))
+    }
+
+
+def generate_variants(file_path: str, widths: tuple) -> list:
+    """
+    Buat varian lebar tetap untuk satu gambar (dijalankan di process pool).
+    Gambar tidak di-upscale: jika lebih kecil dari target, varian = ukuran asli.
+    """
+    from PIL import Image
+
+    created = []
+    with Image.open(file_path) as image:
+        image_format = image.format
+        for width in widths:
+            variant_path = variant_filename(file_path, width)
+            if os.path.exists(variant_path):
+                continue
+            variant = image.copy()
+            variant.thumbnail((width, width * 10))
+            if image_format == "JPEG" and variant.mode not in ("RGB", "L"):
+                variant = variant.convert("RGB")
+            # Tulis ke file sementara lalu rename supaya tidak pernah ter-serve setengah jadi
+            directory, name = os.path.split(variant_path)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".variant-", suffix=os.path.splitext(name)[1])
+            try:
+                with os.fdopen(fd, "wb") as buffer:
+                    variant.save(buffer, format=image_format, optimize=True)
+                os.replace(temp_path, variant_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            created.append(variant_path)
+    return created
+
+
+def _get_variant_pool() -> ProcessPoolExecutor:
+    global _variant_pool
+    with _variant_pool_lock:
+        if _variant_pool is None:
+            _variant_pool = ProcessPoolExecutor(
+                max_workers=IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _variant_pool
+
+
+def shutdown_variant_pool():
+    """Matikan process pool varian gambar (dipanggil saat aplikasi shutdown)"""
+    global _variant_pool
+    with _variant_pool_lock:
+        if _variant_pool is not None:
+            _variant_pool.shutdown(wait=False, cancel_futures=True)
+            _variant_pool = None
+
+
+def _report_variant_result(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Error generating image variants: %s", error)
+    elif future.result():
+        # Katalog yang sudah di-cache belum memuat varian baru
+        catalog.invalidate()
+
+
+def schedule_variants(image_url: Optional[str]):
+    """Jadwalkan pembuatan varian di background (tidak ditunggu oleh request)"""
+    file_path = path_for_url(image_url)
+    if file_path is None or not IMAGE_VARIANT_WIDTHS:
+        return
+    future = _get_variant_pool().submit(generate_variants, os.path.abspath(file_path), IMAGE_VARIANT_WIDTHS)
+    future.add_done_callback(_report_variant_result)
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    url: str
+    spare_path: Optional[str] = None  # Salinan upload jika file dengan isi yang sama sudah ada
+
+
+def _store(temp_path: str, filename: str) -> Optional[str]:
+    """Pindahkan file sementara ke nama final; jika sudah ada, file sementara dikembalikan sebagai cadangan"""
+    final_path = os.path.join(UPLOAD_DIR, filename)
+    if os.path.exists(final_path):
+        return temp_path
+    os.replace(temp_path, final_path)
+    return None
+
+
+def _restore(source_path: str, final_path: str) -> bool:
+    """Kembalikan file ke nama final jika hilang (isi sama), return True jika dikembalikan"""
+    if os.path.exists(final_path):
+        os.remove(source_path)
+        return False
+    os.replace(source_path, final_path)
+    return True
+
+
+async def save_upload(upload: UploadFile) -> StoredUpload:
+    """
+    Simpan upload secara streaming ke /uploads/<sha256><ext>.
+    Panggil confirm_upload(stored) setelah commit produk (juga jika commit gagal).
+    """
+    extension = _file_extension(upload.filename)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-", suffix=extension)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Image too large. Maximum size is {MAX_UPLOAD_SIZE} bytes",
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(buffer.write, chunk)
+        filename = f"{digest.hexdigest()}{extension}"
+        spare_path = await run_in_threadpool(_store, temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return StoredUpload(url=f"{UPLOAD_URL_PREFIX}{filename}", spare_path=spare_path)
+
+
+async def confirm_upload(stored: Optional[StoredUpload]):
+    """
+    Buang salinan cadangan setelah commit produk. Jika release_upload paralel menghapus
+    file (reference dihitung sebelum produk ini commit), file dibuat ulang dari cadangan.
+    """
+    if stored is None or stored.spare_path is None:
+        return
+    if await run_in_threadpool(_restore, stored.spare_path, path_for_url(stored.url)):
+        logger.warning("Re-created image removed by a concurrent release", extra=fields(image_url=stored.url))
+        schedule_variants(stored.url)
+
+
+def _move_aside(file_path: str) -> Optional[str]:
+    directory, name = os.path.split(file_path)
+    aside_path = os.path.join(directory, f".release-{uuid.uuid4().hex}-{name}")
+    try:
+        os.replace(file_path, aside_path)
+    except FileNotFoundError:
+        return None
+    return aside_path
+
+
+def _remove_with_variants(aside_path: str, file_path: str):
+    os.remove(aside_path)
+    if os.path.exists(file_path):
+        # Sudah dibuat ulang oleh confirm_upload; varian tetap dipakai
+        return
+    for path in [variant_filename(file_path, width) for width in IMAGE_VARIANT_WIDTHS]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def _count_references(db: AsyncSession, image_url: str) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(models.Product).where(models.Product.image_url == image_url)
+    )).scalar()
+
+
+async def release_upload(db: AsyncSession, image_url: Optional[str]):
+    """Hapus file gambar + variannya jika sudah tidak direferensikan produk mana pun (panggil setelah commit)"""
+    file_path = path_for_url(image_url)
+    if file_path is None or await _count_references(db, image_url):
+        return
+    # File dipindah dulu lalu reference dihitung ulang: produk baru dengan gambar yang sama
+    # bisa commit di antara hitungan pertama dan penghapusan
+    aside_path = await run_in_threadpool(_move_aside, file_path)
+    if aside_path is None:
+        return
+    if await _count_references(db, image_url):
+        await run_in_threadpool(_restore, aside_path, file_path)
+    else:
+        await run_in_threadpool(_remove_with_variants, aside_path, file_path)
@@ -0,0 +1,177 @@
+"""
+Inbox notifikasi webhook Midtrans.
+
+Endpoint webhook hanya menyimpan body mentah ke tabel webhook_inbox lalu
+langsung return. Worker background (satu per proses aplikasi) mengambil entry
+yang belum diproses per batch, menerapkan perubahan status, dan menandai
+entry processed di transaksi DB yang sama.
+
+Jaminan at-most-once: entry di-lock dengan SELECT ... FOR UPDATE SKIP LOCKED,
+lalu di-claim dengan UPDATE ... WHERE processed_at IS NULL (juga berlaku di
+SQLite yang tidak punya row lock), dan efeknya (payment, transaction, stock,
+rollup) di-commit bersama processed_at. Entry yang sudah punya processed_at
+tidak pernah diambil lagi, dan worker lain tidak bisa mengambil entry yang
+sedang di-lock.
+
+Error permanen (JSON tidak valid, data tidak valid, error SQL) menandai entry
+processed dengan pesan error. Error database sementara (OperationalError: koneksi
+putus, database locked; serialization failure / deadlock) menghentikan batch tanpa
+menandai entry: Midtrans sudah menerima 200 dan tidak akan mengirim ulang, jadi
+entry dicoba lagi setelah backoff (WEBHOOK_RETRY_DELAY, dikali dua setiap
+percobaan). Setelah WEBHOOK_MAX_ATTEMPTS percobaan entry ditandai processed dengan
+error supaya tidak menahan entry lain.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import exc, or_, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from starlette.concurrency import run_in_threadpool
+
+from . import catalog, models, payments
+from .database import SessionLocal
+from .logging_config import fields
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "100"))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "1.0"))  # detik
+# Retry entry yang gagal karena error database sementara: jumlah percobaan, backoff awal dan maksimum (detik)
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_DELAY = float(os.getenv("WEBHOOK_RETRY_DELAY", "5"))
+WEBHOOK_RETRY_MAX_DELAY = float(os.getenv("WEBHOOK_RETRY_MAX_DELAY", "600"))
+# Body webhook terbesar yang disimpan (bytes); notifikasi Midtrans hanya beberapa KB
+WEBHOOK_MAX_BODY_SIZE = int(os.getenv("WEBHOOK_MAX_BODY_SIZE", "16384"))
+
+# SQLSTATE serialization_failure dan deadlock_detected (PostgreSQL)
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+_wakeup = None
+
+
+def apply_notification(db: Session, notification: dict) -> bool:
+    """
+    Terapkan satu notifikasi Midtrans lewat state machine payments.
+    Return True jika stock produk berubah.
+    """
+    result = payments.apply_notification(db, notification)
+    if not result.found:
+        logger.warning("Transaction not found for webhook", extra=fields(order_id=notification.get("order_id")))
+    return result.stock_changed
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Error database yang bisa berhasil jika dicoba lagi (bukan karena isi notifikasi atau SQL yang salah)"""
+    if not isinstance(error, exc.DBAPIError):
+        return False
+    if error.connection_invalidated or isinstance(error, exc.OperationalError):
+        return True
+    sqlstate = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    return sqlstate in RETRYABLE_SQLSTATES
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff sebelum percobaan berikutnya (eksponensial, dibatasi WEBHOOK_RETRY_MAX_DELAY)"""
+    return timedelta(seconds=min(WEBHOOK_RETRY_DELAY * 2 ** (attempts - 1), WEBHOOK_RETRY_MAX_DELAY))
+
+
+def _claim(db: Session, entry: models.WebhookInbox) -> bool:
+    """Tandai entry processed jika belum (False jika sudah diproses worker lain)"""
+    inbox = models.WebhookInbox
+    claimed = db.execute(
+        update(inbox)
+        .where(inbox.id == entry.id, inbox.processed_at.is_(None))
+        .values(processed_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return claimed.rowcount == 1
+
+
+def drain_batch(db: Session, batch_size: int = WEBHOOK_BATCH_SIZE) -> int:
+    """Proses satu batch entry yang belum diproses, return jumlah entry yang selesai ditangani"""
+    inbox = models.WebhookInbox
+    now = datetime.now(timezone.utc)
+    entries = (
+        db.query(inbox)
+        .filter(inbox.processed_at.is_(None), or_(inbox.next_attempt_at.is_(None), inbox.next_attempt_at <= now))
+        .order_by(inbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    stock_changed = False
+    handled = 0
+    for entry in entries:
+        order_id = None
+        error = None
+        savepoint = db.begin_nested()
+        try:
+            if not _claim(db, entry):
+                savepoint.commit()
+                handled += 1
+                continue
+            notification = json.loads(entry.payload)
+            order_id = notification.get("order_id")
+            stock_changed = apply_notification(db, notification) or stock_changed
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            error = str(e)
+            if is_transient_error(e):
+                entry.attempts += 1
+                if entry.attempts < WEBHOOK_MAX_ATTEMPTS:
+                    # Entry tidak ditandai processed dan ditunda; sisa batch diambil lagi pada poll berikutnya
+                    entry.next_attempt_at = now + retry_delay(entry.attempts)
+                    logger.exception(
+                        "Transient error processing webhook inbox entry, will retry",
+                        extra=fields(inbox_id=entry.id, order_id=order_id, attempts=entry.attempts),
+                    )
+                    break
+                error = f"Gave up after {entry.attempts} attempts: {e}"
+            # Error permanen / retry habis: entry ditandai processed supaya tidak diulang; error disimpan untuk investigasi
+            logger.exception("Error processing webhook inbox entry", extra=fields(inbox_id=entry.id, order_id=order_id))
+        entry.order_id = order_id
+        entry.error = error
+        entry.processed_at = func.now()
+        handled += 1
+    db.commit()
+    if stock_changed:
+        catalog.invalidate()
+    return handled
+
+
+def drain_once() -> int:
+    db = SessionLocal()
+    try:
+        return drain_batch(db)
+    finally:
+        db.close()
+
+
+def notify():
+    """Bangunkan worker setelah entry baru disimpan (dipanggil dari event loop)"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_worker():
+    """Loop worker: drain per batch, tidur sampai ada entry baru atau poll interval habis"""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    while True:
+        _wakeup.clear()
+        try:
+            processed = await run_in_threadpool(drain_once)
+        except Exception:
+            logger.exception("Webhook inbox worker error")
+            processed = 0
+        if processed >= WEBHOOK_BATCH_SIZE:
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=WEBHOOK_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
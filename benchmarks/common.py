@@ -0,0 +1,113 @@
+"""Helper bersama untuk script benchmark: port, persentil, dan menjalankan aplikasi dengan uvicorn"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import bcrypt
+import httpx
+from sqlalchemy import create_engine, text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(samples: list) -> dict:
+    """Ringkasan latency (detik -> ms)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": pick(1.0)}
+
+
+def database_reachable(database_url: str) -> bool:
+    """True jika database bisa dikoneksi (mis. Postgres lokal untuk benchmark)"""
+    engine = create_engine(database_url, connect_args={"connect_timeout": 3} if database_url.startswith("postgresql") else {})
+    try:
+        with engine.connect():
+            return True
+    except Exception:
+        return False
+    finally:
+        engine.dispose()
+
+
+def create_admin(database_url: str, username: str, password: str):
+    """Buat user admin langsung di database (tidak ada endpoint publik untuk admin pertama)"""
+    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    engine = create_engine(database_url)
+    try:
+        with engine.begin() as conn:
+            role_id = conn.execute(text("SELECT id FROM roles WHERE name = 'admin'")).scalar_one()
+            conn.execute(
+                text(
+                    "INSERT INTO users (username, full_name, hashed_password, role_id, is_active) "
+                    "VALUES (:username, :full_name, :hashed_password, :role_id, :is_active)"
+                ),
+                {"username": username, "full_name": "Bench Admin", "hashed_password": hashed_password,
+                 "role_id": role_id, "is_active": True},
+            )
+    finally:
+        engine.dispose()
+
+
+def start_app(port: int, workdir: str, env: dict = None, stdout=None, extra_args: tuple = ()) -> subprocess.Popen:
+    """
+    Bootstrap database lalu jalankan app.main:app dengan uvicorn (default SQLite di workdir),
+    tunggu sampai GET / menjawab
+    """
+    process_env = app_env(workdir, env)
+    subprocess.run([sys.executable, "-m", "app.bootstrap"], cwd=ROOT, env=process_env, stdout=subprocess.DEVNULL, check=True)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+         *extra_args],
+        cwd=ROOT,
+        env=process_env,
+        stdout=stdout,
+    )
+    wait_until_ready(process, f"http://127.0.0.1:{port}")
+    return process
+
+
+def app_env(workdir: str, env: dict = None) -> dict:
+    """Environment aplikasi untuk benchmark: SQLite dan folder upload di workdir (bisa di-override)"""
+    return {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "MIDTRANS_SERVER_KEY": "bench-server-key",
+        **(env or {}),
+    }
+
+
+def wait_until_ready(process: subprocess.Popen, base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Application exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Application did not start")
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
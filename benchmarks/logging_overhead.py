@@ -0,0 +1,82 @@
+"""
+Latency login dan webhook dengan LOG_LEVEL=INFO vs LOG_LEVEL=DEBUG.
+
+Untuk setiap level, aplikasi dijalankan (uvicorn, SQLite sementara, stdout
+ditulis ke file seperti di production), lalu dikirim --requests login dan
+--requests webhook dengan --concurrency paralel.
+
+    python benchmarks/logging_overhead.py --requests 200 --concurrency 10 --output logging.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from common import free_port, percentiles, start_app, stop
+
+LEVELS = ("INFO", "DEBUG")
+
+
+async def measure(base_url: str, total: int, concurrency: int) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        await client.post("/auth/register/customer", json={"full_name": "Bench", "email": email, "password": "bench-pass"})
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(samples: list, call):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await call()
+                samples.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        login_latency, webhook_latency = [], []
+        await asyncio.gather(*(
+            timed(login_latency, lambda: client.post("/auth/login", data={"username": email, "password": "bench-pass"}))
+            for _ in range(total)
+        ))
+        notification = {
+            "order_id": "bench-missing-order",
+            "transaction_status": "settlement",
+            "transaction_id": "bench",
+            "gross_amount": "10000.00",
+        }
+        await asyncio.gather(*(
+            timed(webhook_latency, lambda: client.post("/api/payment/webhook", json=notification))
+            for _ in range(total)
+        ))
+    return {"login": percentiles(login_latency), "webhook": percentiles(webhook_latency)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark overhead logging (INFO vs DEBUG)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--output", help="tulis hasil JSON ke file ini")
+    args = parser.parse_args()
+
+    results = {}
+    for level in LEVELS:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            with open(os.path.join(workdir, "app.log"), "w") as log_file:
+                process = start_app(port, workdir, {"LOG_LEVEL": level}, stdout=log_file)
+                try:
+                    results[level] = asyncio.run(measure(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+                finally:
+                    stop(process)
+            results[level]["log_bytes"] = os.path.getsize(os.path.join(workdir, "app.log"))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
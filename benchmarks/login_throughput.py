@@ -0,0 +1,138 @@
+"""
+Throughput login: bcrypt inline vs process pool, di beberapa level concurrency.
+
+Script ini menjalankan app.main in-process (httpx ASGITransport, satu event
+loop seperti satu worker uvicorn, SQLite sementara) dan membandingkan:
+
+- inline: login seperti sebelum user-007, handler `def` (threadpool) dengan
+  Session sync dan auth.verify_password langsung, didaftarkan khusus untuk benchmark
+- pooled: POST /auth/login (bcrypt di process pool PASSWORD_POOL_WORKERS,
+  503 jika antrian PASSWORD_POOL_MAX_PENDING penuh)
+
+Selama login berjalan, GET / dikirim terus untuk mengukur seberapa lama request
+lain di worker yang sama tertahan.
+
+    python benchmarks/login_throughput.py --requests 200 --concurrency 1 8 32 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import ROOT, percentiles
+
+USERNAME = "bench-admin"
+PASSWORD = "bench-pass"
+VARIANTS = {
+    "inline": "/bench/login-inline",
+    "pooled": "/auth/login",
+}
+
+
+def load_app(workdir: str):
+    """Import app.main dengan SQLite di workdir, bootstrap schema, buat user dan route login inline"""
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "MIDTRANS_SERVER_KEY": "bench-server-key",
+        "LOG_LEVEL": "WARNING",
+    })
+    sys.path.insert(0, ROOT)
+    from fastapi import Depends, HTTPException
+    from fastapi.security import OAuth2PasswordRequestForm
+    from sqlalchemy.orm import Session
+
+    from app import auth, bootstrap
+    from app.database import engine, get_db
+    from app.main import app
+    from common import create_admin
+
+    bootstrap.bootstrap(engine)
+    create_admin(os.environ["DATABASE_URL"], USERNAME, PASSWORD)
+
+    @app.post(VARIANTS["inline"], include_in_schema=False)
+    def login_inline(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+        # Login sebelum user-007: bcrypt langsung di thread request
+        user = auth.get_user_by_username(db, form_data.username)
+        if not user or not auth.verify_password(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=401, detail="Incorrect username or password")
+        return {"access_token": auth.create_access_token(data={"sub": user.username}), "token_type": "bearer"}
+
+    return app
+
+
+async def measure(app, path: str, total: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        login_latency, probe_latency = [], []
+        statuses = {}
+        done = asyncio.Event()
+        form = {"username": USERNAME, "password": PASSWORD}
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, data=form)
+                login_latency.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                (await client.get("/")).raise_for_status()
+                probe_latency.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        for _ in range(4):  # warm-up (process pool spawn, connection pool)
+            (await client.post(path, data=form)).raise_for_status()
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    return {
+        "concurrency": concurrency,
+        "logins_per_second": round(statuses.get(200, 0) / elapsed, 1),
+        "status_codes": statuses,
+        "login": percentiles(login_latency),
+        "concurrent_get_root": percentiles(probe_latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput login: bcrypt inline vs process pool")
+    parser.add_argument("--requests", type=int, default=200, help="jumlah login per variant per concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--output", help="tulis hasil JSON ke file ini")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = load_app(workdir)
+        from app import auth
+        results = {
+            "cpu_count": os.cpu_count(),
+            "password_pool_workers": auth.PASSWORD_POOL_WORKERS,
+            "password_pool_max_pending": auth.PASSWORD_POOL_MAX_PENDING,
+            "requests": args.requests,
+        }
+        for variant, path in VARIANTS.items():
+            results[variant] = [asyncio.run(measure(app, path, args.requests, c)) for c in args.concurrency]
+        auth.shutdown_password_pool()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Overhead MetricsMiddleware: latency dengan METRICS_ENABLED=true vs false.
+
+Request dikirim berurutan (concurrency 1) supaya selisih latency per request
+terlihat tanpa noise antrian: GET / (tanpa DB) dan GET /auth/me (principal cache).
+
+    python benchmarks/metrics_overhead.py --requests 2000 --output metrics.json
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from common import free_port, percentiles, start_app, stop
+
+
+async def measure(base_url: str, total: int) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        await client.post("/auth/register/customer", json={"full_name": "Bench", "email": email, "password": "bench-pass"})
+        token = (await client.post("/auth/login", data={"username": email, "password": "bench-pass"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        results = {}
+        for path in ("/", "/auth/me"):
+            for _ in range(min(100, total)):  # warm-up
+                await client.get(path, headers=headers)
+            samples = []
+            for _ in range(total):
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                samples.append(time.perf_counter() - started)
+                response.raise_for_status()
+            results[path] = percentiles(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark overhead metrics middleware")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", help="tulis hasil JSON ke file ini")
+    args = parser.parse_args()
+
+    results = {}
+    for enabled in ("false", "true"):
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            process = start_app(port, workdir, {"METRICS_ENABLED": enabled, "LOG_LEVEL": "WARNING"})
+            try:
+                results[f"metrics_enabled={enabled}"] = asyncio.run(measure(f"http://127.0.0.1:{port}", args.requests))
+            finally:
+                stop(process)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
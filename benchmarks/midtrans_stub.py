@@ -0,0 +1,88 @@
+"""
+Stub lokal Midtrans Snap + Core API untuk benchmark / load test.
+
+    POST /snap/v1/transactions  -> {"token", "redirect_url"}
+    GET  /v2/{order_id}/status  -> {"order_id", "transaction_status", ...}
+
+Setiap request menunggu --latency-ms sebelum dijawab. Status yang dijawab
+Core API diatur dengan --status (default pending).
+
+    python benchmarks/midtrans_stub.py --port 9100 --latency-ms 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import uvicorn
+
+
+def make_app(latency: float, transaction_status: str = "pending"):
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        while (await receive()).get("more_body"):
+            pass
+        if latency:
+            await asyncio.sleep(latency)
+        if scope["method"] == "POST" and scope["path"] == "/snap/v1/transactions":
+            token = uuid.uuid4().hex
+            body = {"token": token, "redirect_url": f"http://midtrans-stub/snap/v2/vtweb/{token}"}
+            status = 201
+        elif scope["method"] == "GET" and scope["path"].endswith("/status"):
+            order_id = scope["path"].split("/")[-2]
+            body = {
+                "status_code": "200" if transaction_status == "settlement" else "201",
+                "order_id": order_id,
+                "transaction_id": f"stub-{order_id}",
+                "transaction_status": transaction_status,
+                "payment_type": "bank_transfer",
+            }
+            status = 200
+        else:
+            body, status = {"status_code": "404", "status_message": "Not found"}, 404
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+    return app
+
+
+def _wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def start(port: int, latency_ms: float, transaction_status: str = "pending") -> subprocess.Popen:
+    """Jalankan stub di proses terpisah (tidak berebut GIL dengan load generator)"""
+    process = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__),
+        "--port", str(port), "--latency-ms", str(latency_ms), "--status", transaction_status,
+    ])
+    _wait_for_port(port)
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub lokal Midtrans Snap + Core API")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--status", default="pending", help="transaction_status yang dijawab Core API")
+    args = parser.parse_args()
+    uvicorn.run(
+        make_app(args.latency_ms / 1000, args.status),
+        host="127.0.0.1", port=args.port, log_level="warning", backlog=4096,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Load test POST /api/payment/create terhadap stub Snap lokal dengan latency buatan.
+
+Menjalankan:
+  - stub Snap/Core API (benchmarks/midtrans_stub.py) yang menunggu
+    --latency-ms sebelum menjawab,
+  - aplikasi (uvicorn, SQLite sementara) dengan MIDTRANS_STUB_URL
+    diarahkan ke stub,
+lalu mengirim --requests checkout dengan --concurrency paralel, sambil mengukur
+latency GET / (endpoint sync yang memakai threadpool) untuk melihat apakah
+checkout yang lambat membuat endpoint lain ikut menunggu.
+
+    python benchmarks/snap_checkout.py --requests 500 --concurrency 100 --latency-ms 200
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+
+import httpx
+
+import midtrans_stub
+from common import free_port, percentiles, start_app, stop
+
+
+async def run_load(base_url: str, total: int, concurrency: int, warmup: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        await client.post("/auth/register/customer", json={"full_name": "Bench", "email": email, "password": "bench-pass"})
+        token = (await client.post("/auth/login", data={"username": email, "password": "bench-pass"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        customer_id = (await client.get("/auth/me", headers=headers)).json()["id"]
+
+        checkout_latency, probe_latency, errors = [], [], []
+        queue = asyncio.Queue()
+        record = False
+        running = True
+
+        async def checkout_worker():
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                order_id = f"bench-{uuid.uuid4().hex[:12]}-{i}"
+                # create_payment hanya menerima order milik customer; transaksi dibuat di luar pengukuran
+                await client.post("/api/transactions", headers=headers, json={
+                    "order_id": order_id, "customer_id": customer_id, "quantity": 1, "total_amount": 10000,
+                })
+                payload = {
+                    "order_id": order_id,
+                    "gross_amount": 10000,
+                    "items": [{"id": "1", "price": 10000, "quantity": 1, "name": "Bench"}],
+                    "customer_details": {"first_name": "Bench", "email": email},
+                }
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/payment/create", json=payload, headers=headers)
+                except httpx.HTTPError as e:
+                    errors.append(e.__class__.__name__)
+                    continue
+                if record:
+                    checkout_latency.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+
+        async def probe():
+            while running:
+                started = time.perf_counter()
+                await client.get("/")
+                probe_latency.append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        # Warm-up: buka koneksi keep-alive (client -> app -> stub) sebelum diukur
+        for i in range(warmup):
+            queue.put_nowait(i)
+        await asyncio.gather(*(checkout_worker() for _ in range(concurrency)))
+        errors.clear()
+        record = True
+
+        for i in range(total):
+            queue.put_nowait(i)
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(checkout_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        running = False
+        await probe_task
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "errors": len(errors),
+        "checkout": percentiles(checkout_latency),
+        "probe_get_root": percentiles(probe_latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test create_payment terhadap stub Snap lokal")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=None, help="request warm-up (default = concurrency)")
+    parser.add_argument("--latency-ms", type=float, default=200, help="latency buatan di stub Snap")
+    parser.add_argument("--output", help="tulis hasil JSON ke file ini")
+    args = parser.parse_args()
+
+    stub_port, app_port = free_port(), free_port()
+    stub = midtrans_stub.start(stub_port, args.latency_ms)
+    with tempfile.TemporaryDirectory() as workdir:
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        process = start_app(app_port, workdir, {
+            "MIDTRANS_STUB_URL": stub_url,
+            "MIDTRANS_POOL_SIZE": "200",
+        })
+        try:
+            result = asyncio.run(run_load(
+                f"http://127.0.0.1:{app_port}", args.requests, args.concurrency,
+                args.concurrency if args.warmup is None else args.warmup,
+            ))
+        finally:
+            stop(process)
+            stop(stub)
+    result["stub_latency_ms"] = args.latency_ms
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
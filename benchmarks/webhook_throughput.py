@@ -0,0 +1,169 @@
+"""
+Throughput webhook paralel: handler dengan Session sync vs AsyncSession.
+
+Sebelum user-004, `payment_webhook` adalah `async def` yang memakai Session
+sync, jadi setiap query/commit memblok event loop. Script ini menjalankan
+app.main in-process (httpx ASGITransport, satu event loop seperti satu worker
+uvicorn) dan membandingkan:
+
+- sync_session: handler webhook yang sama (simpan body ke inbox + commit)
+  dengan Session sync di dalam `async def`, didaftarkan khusus untuk benchmark
+- async_session: POST /api/payment/webhook (AsyncSession)
+
+Dengan --database-url PostgreSQL, latency database adalah latency asli. Tanpa itu
+dipakai SQLite sementara yang hampir tanpa latency, jadi latency disimulasikan
+dengan trigger pada INSERT webhook_inbox yang memanggil fungsi sleep di dalam
+eksekusi SQLite (--db-latency-ms). Sleep itu berjalan di thread yang
+mengeksekusi query: event loop untuk Session sync, thread aiosqlite untuk
+AsyncSession. SQLite hanya punya satu writer, jadi di SQLite throughput kedua
+variant dibatasi latency simulasi; perbedaannya terlihat di latency request
+lain. Selama webhook berjalan, GET / dikirim terus untuk mengukur seberapa
+lama request lain di worker yang sama tertahan.
+
+    python benchmarks/webhook_throughput.py --requests 500 --concurrency 1 16 64 --db-latency-ms 5
+    python benchmarks/webhook_throughput.py --database-url $BENCH_DATABASE_URL
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import ROOT, percentiles
+
+NOTIFICATION = {
+    "order_id": "bench-missing-order",
+    "transaction_status": "settlement",
+    "transaction_id": "bench",
+    "gross_amount": "10000.00",
+}
+VARIANTS = {
+    "sync_session": "/bench/webhook-sync-session",
+    "async_session": "/api/payment/webhook",
+}
+
+
+def load_app(workdir: str, database_url: str, db_latency_ms: float):
+    """Import app.main, bootstrap schema, pasang route sync (dan trigger latency untuk SQLite)"""
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.update({
+        "DATABASE_URL": database_url or f"sqlite:///{workdir}/bench.db",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "MIDTRANS_SERVER_KEY": "bench-server-key",
+        "LOG_LEVEL": "WARNING",
+    })
+    sys.path.insert(0, ROOT)
+    from fastapi import Request
+    from sqlalchemy import event, text
+
+    from app import bootstrap, models, webhook_inbox
+    from app.database import SessionLocal, async_engine, engine
+    from app.main import app
+
+    def bench_sleep(milliseconds):
+        time.sleep(milliseconds / 1000)
+        return 0
+
+    if engine.dialect.name == "sqlite":
+        for target in (engine, async_engine.sync_engine):
+            @event.listens_for(target, "connect")
+            def register_sleep(dbapi_connection, _):
+                dbapi_connection.create_function("bench_sleep", 1, bench_sleep)
+                # Writer mengantri (satu writer SQLite) daripada gagal "database is locked" setelah 5 detik
+                dbapi_connection.execute("PRAGMA busy_timeout = 60000")
+
+    bootstrap.bootstrap(engine)
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text("DROP TRIGGER IF EXISTS bench_inbox_latency"))
+            conn.execute(text(
+                "CREATE TRIGGER bench_inbox_latency AFTER INSERT ON webhook_inbox "
+                f"BEGIN SELECT bench_sleep({float(db_latency_ms)}); END"
+            ))
+
+    @app.post(VARIANTS["sync_session"], include_in_schema=False)
+    async def webhook_sync_session(request: Request):
+        # Handler sebelum user-004: Session sync di dalam async def (memblok event loop)
+        body = await request.body()
+        db = SessionLocal()
+        try:
+            db.add(models.WebhookInbox(payload=body.decode("utf-8", errors="replace")))
+            db.commit()
+        finally:
+            db.close()
+        webhook_inbox.notify()
+        return {"status": "ok"}
+
+    return app
+
+
+async def measure(app, path: str, total: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        webhook_latency, probe_latency = [], []
+        done = asyncio.Event()
+
+        async def send():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(path, json=NOTIFICATION)
+                webhook_latency.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        async def probe():
+            # Request lain di worker yang sama: berapa lama tertahan oleh webhook
+            while not done.is_set():
+                started = time.perf_counter()
+                (await client.get("/")).raise_for_status()
+                probe_latency.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        for _ in range(min(20, total)):  # warm-up (connection pool, import lazy)
+            await client.post(path, json=NOTIFICATION)
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    return {
+        "concurrency": concurrency,
+        "requests_per_second": round(total / elapsed, 1),
+        "webhook": percentiles(webhook_latency),
+        "concurrent_get_root": percentiles(probe_latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput webhook: Session sync vs AsyncSession")
+    parser.add_argument("--requests", type=int, default=500, help="jumlah webhook per variant per concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="database PostgreSQL untuk benchmark (default SQLite sementara)")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="latency simulasi per INSERT inbox (SQLite)")
+    parser.add_argument("--output", help="tulis hasil JSON ke file ini")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = load_app(workdir, args.database_url, args.db_latency_ms)
+        from app.database import engine
+        results = {"database": engine.dialect.name, "requests": args.requests}
+        if engine.dialect.name == "sqlite":
+            results["simulated_db_latency_ms"] = args.db_latency_ms
+        for variant, path in VARIANTS.items():
+            results[variant] = [asyncio.run(measure(app, path, args.requests, c)) for c in args.concurrency]
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -459,7 +459,12 @@ function CustomerPage({ user, onLogout }) {
             >
               {p.image_url ? (
                 <img
-                  src={`${API_BASE}${p.image_url}`}
+                  src={`${API_BASE}${p.image_variants?.["320"] || p.image_url}`}
+                  onError={(e) => {
+                    // Thumbnail belum selesai dibuat, fallback ke gambar asli
+                    const original = `${API_BASE}${p.image_url}`;
+                    if (e.currentTarget.src !== original) e.currentTarget.src = original;
+                  }}
                   alt={p.name}
                   style={{
                     width: "100%",
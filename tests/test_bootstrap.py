@@ -0,0 +1,108 @@
+"""python -m app.bootstrap pada database yang dibuat sebelum tabel/index baru ditambahkan."""
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import inspect, text
+
+from app import bootstrap, earnings, models, payments
+from app.database import engine
+from conftest import create_transaction
+
+
+def test_bootstrap_backfills_new_earnings_rollup(db, customer):
+    create_transaction(db, customer, order_id="paid-order", status="paid")
+    create_transaction(db, customer, order_id="pending-order")
+    # Database dari sebelum rollup ada
+    db.close()
+    models.TransactionDailyStat.__table__.drop(bind=engine)
+
+    bootstrap.bootstrap(engine)
+
+    assert earnings.get_totals(db) == {
+        "paid": (1, Decimal("10000")),
+        "pending": (1, Decimal("10000")),
+    }
+
+
+def test_bootstrap_keeps_existing_rollup(db, customer):
+    create_transaction(db, customer, order_id="paid-order", status="paid")
+    before = earnings.get_totals(db)
+    db.close()
+
+    bootstrap.bootstrap(engine)
+
+    assert earnings.get_totals(db) == before
+
+
+def downgrade_payment_order_id_index():
+    """Schema sebelum payments.order_id unique: index non-unique dengan nama yang sama"""
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_payments_order_id"))
+        conn.execute(text("CREATE INDEX ix_payments_order_id ON payments (order_id)"))
+
+
+def add_payment(db, transaction, status: str, updated_at: datetime, order_id: str = None):
+    db.add(models.Payment(
+        transaction_id=transaction.id,
+        order_id=order_id or transaction.order_id,
+        gross_amount=transaction.total_amount,
+        transaction_status=status,
+        updated_at=updated_at,
+    ))
+    db.commit()
+
+
+def order_id_is_unique() -> bool:
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("payments")}
+    return indexes["ix_payments_order_id"]["unique"]
+
+
+def test_bootstrap_migrates_payment_order_id_to_unique(db, customer):
+    downgrade_payment_order_id_index()
+    transaction = create_transaction(db, customer, order_id="ORDER-1")
+    add_payment(db, transaction, "pending", datetime(2026, 1, 1, 10, 0))
+    add_payment(db, transaction, "settlement", datetime(2026, 1, 1, 10, 5))
+    add_payment(db, transaction, "pending", datetime(2026, 1, 1, 10, 1))
+    db.close()
+    assert not order_id_is_unique()
+
+    bootstrap.bootstrap(engine)
+
+    assert order_id_is_unique()
+    assert [payment.transaction_status for payment in db.query(models.Payment)] == ["settlement"]
+    # ON CONFLICT (order_id) sekarang punya target
+    result = payments.apply_transition(db, "ORDER-1", "settlement", "midtrans-1")
+    db.commit()
+    assert result.found and result.status == "paid"
+    assert db.query(models.Payment).count() == 1
+
+
+def test_bootstrap_fails_on_unresolvable_duplicates(db, customer):
+    downgrade_payment_order_id_index()
+    first = create_transaction(db, customer, order_id="ORDER-1")
+    second = create_transaction(db, customer, order_id="ORDER-2")
+    add_payment(db, first, "pending", datetime(2026, 1, 1, 10, 0))
+    add_payment(db, second, "pending", datetime(2026, 1, 1, 10, 0), order_id="ORDER-1")
+    db.close()
+
+    with pytest.raises(bootstrap.MigrationError, match="ORDER-1"):
+        bootstrap.bootstrap(engine)
+
+    assert not order_id_is_unique()
+    assert db.query(models.Payment).count() == 2
+
+
+def test_bootstrap_adds_new_inbox_columns(db):
+    # webhook_inbox dari sebelum retry dengan backoff
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE webhook_inbox DROP COLUMN attempts"))
+        conn.execute(text("ALTER TABLE webhook_inbox DROP COLUMN next_attempt_at"))
+        conn.execute(text("INSERT INTO webhook_inbox (payload) VALUES ('{}')"))
+
+    bootstrap.bootstrap(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("webhook_inbox")}
+    assert {"attempts", "next_attempt_at"} <= columns
+    entry = db.query(models.WebhookInbox).one()
+    assert entry.attempts == 0 and entry.next_attempt_at is None
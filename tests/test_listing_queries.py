@@ -0,0 +1,47 @@
+"""Jumlah statement SQL endpoint listing tidak boleh bertambah dengan page size (N+1)."""
+import pytest
+
+from app import instrumentation
+from conftest import auth_headers, create_product, create_transaction, create_user
+
+SMALL_PAGE, LARGE_PAGE = 2, 20
+
+
+@pytest.fixture
+def seeded(db, admin):
+    customers = [create_user(db, "customer", email=f"customer{i}@example.com") for i in range(3)]
+    products = [create_product(db, admin) for _ in range(3)]
+    for i in range(30):
+        create_transaction(db, customers[i % 3], products[i % 3], order_id=f"ORDER-{i}")
+    return admin, customers[0]
+
+
+def statement_count(client, path: str, headers: dict) -> int:
+    with instrumentation.count_queries() as counter:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return counter.count
+
+
+@pytest.mark.parametrize("path", ["/api/transactions", "/api/dashboard/recent-transactions"])
+@pytest.mark.parametrize("viewer", ["employee", "customer"])
+def test_statement_count_does_not_grow_with_page_size(client, seeded, path, viewer):
+    employee, customer = seeded
+    user = employee if viewer == "employee" else customer
+    headers = auth_headers(user)
+    # Request pertama mengisi cache principal dan registry role
+    client.get(path, headers=headers)
+
+    small = statement_count(client, f"{path}?limit={SMALL_PAGE}", headers)
+    large = statement_count(client, f"{path}?limit={LARGE_PAGE}", headers)
+
+    assert small == large
+    assert large <= 1
+
+
+def test_large_page_returns_joined_names(client, seeded):
+    employee, _ = seeded
+    response = client.get(f"/api/transactions?limit={LARGE_PAGE}", headers=auth_headers(employee))
+    rows = response.json()
+    assert len(rows) == LARGE_PAGE
+    assert all(row["customer_name"] and row["product_name"] for row in rows)
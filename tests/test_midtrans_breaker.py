@@ -0,0 +1,99 @@
+"""Circuit breaker Midtrans: probe half_open yang dibatalkan atau error tak terduga tidak mengunci breaker."""
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from app import midtrans_config
+from app.midtrans_config import AsyncMidtransClient, CircuitBreaker, MidtransSession, MidtransUnavailable
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """Breaker yang langsung half_open: terbuka setelah satu kegagalan, reset timeout 0"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setattr(midtrans_config, "breaker", breaker)
+    return breaker
+
+
+def async_client(handler) -> AsyncMidtransClient:
+    client = AsyncMidtransClient("server-key")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def ok(request):
+    return httpx.Response(200, json={"status_code": "200"})
+
+
+def test_cancelled_async_probe_releases_slot(breaker):
+    async def slow(request):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        client = async_client(slow)
+        probe = asyncio.create_task(client.transaction_status("ORDER-1"))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(ok))
+        return await client.transaction_status("ORDER-1")
+
+    assert asyncio.run(scenario()) == {"status_code": "200"}
+    assert breaker.state == "closed"
+
+
+def test_unexpected_async_error_releases_slot(breaker):
+    calls = []
+
+    def invalid_then_ok(request):
+        # httpx.InvalidURL bukan turunan httpx.HTTPError
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.InvalidURL("invalid")
+        return ok(request)
+
+    async def scenario():
+        client = async_client(invalid_then_ok)
+        with pytest.raises(httpx.InvalidURL):
+            await client.transaction_status("ORDER-1")
+        return await client.transaction_status("ORDER-1")
+
+    assert asyncio.run(scenario()) == {"status_code": "200"}
+    assert breaker.state == "closed"
+
+
+def test_unexpected_sync_error_releases_slot(breaker, monkeypatch):
+    def broken(self, method, url, **kwargs):
+        raise ValueError("unexpected")
+
+    monkeypatch.setattr(requests.Session, "request", broken)
+    session = MidtransSession()
+    with pytest.raises(ValueError):
+        session.request("GET", "https://midtrans.invalid")
+    assert breaker.state == "half_open"
+
+    # Slot probe bebas lagi: request berikutnya diteruskan, bukan ditolak 503
+    with pytest.raises(ValueError):
+        session.request("GET", "https://midtrans.invalid")
+    assert breaker.rejected_count == 0
+
+
+def test_failed_probe_reopens_breaker(breaker):
+    breaker.reset_timeout = 60
+
+    async def scenario():
+        client = async_client(lambda request: httpx.Response(503))
+        breaker._opened_at -= 60
+        with pytest.raises(Exception):
+            await client.transaction_status("ORDER-1")
+        with pytest.raises(MidtransUnavailable):
+            await client.transaction_status("ORDER-1")
+
+    asyncio.run(scenario())
+    assert breaker.state == "open"
+    assert breaker.rejected_count == 1
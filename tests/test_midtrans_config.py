@@ -0,0 +1,71 @@
+"""Base URL Midtrans mengikuti MIDTRANS_IS_PRODUCTION untuk client sync dan async."""
+import asyncio
+
+import httpx
+import pytest
+
+from app import midtrans_config
+from app.midtrans_config import AsyncMidtransClient, midtrans_base_urls
+
+
+@pytest.mark.parametrize("is_production, snap_base, core_base", [
+    (False, "https://app.sandbox.midtrans.com/snap/v1", "https://api.sandbox.midtrans.com"),
+    (True, "https://app.midtrans.com/snap/v1", "https://api.midtrans.com"),
+])
+def test_base_urls_follow_production_flag(is_production, snap_base, core_base):
+    assert midtrans_base_urls(is_production) == (snap_base, core_base)
+
+
+def test_matching_legacy_urls_are_accepted():
+    urls = midtrans_base_urls(
+        False, snap_url="https://app.sandbox.midtrans.com", core_url="https://api.sandbox.midtrans.com"
+    )
+
+    assert urls == ("https://app.sandbox.midtrans.com/snap/v1", "https://api.sandbox.midtrans.com")
+
+
+def test_sandbox_url_with_production_flag_fails():
+    # .env.example lama + MIDTRANS_IS_PRODUCTION=true
+    with pytest.raises(ValueError, match="MIDTRANS_API_URL"):
+        midtrans_base_urls(True, snap_url="https://app.sandbox.midtrans.com")
+    with pytest.raises(ValueError, match="MIDTRANS_CORE_API_URL"):
+        midtrans_base_urls(True, core_url="https://api.sandbox.midtrans.com")
+
+
+def test_stub_url_replaces_both_base_urls():
+    assert midtrans_base_urls(False, stub_url="http://127.0.0.1:9000/") == (
+        "http://127.0.0.1:9000/snap/v1", "http://127.0.0.1:9000"
+    )
+
+
+def test_stub_url_is_rejected_in_production():
+    with pytest.raises(ValueError, match="MIDTRANS_STUB_URL"):
+        midtrans_base_urls(True, stub_url="http://127.0.0.1:9000")
+
+
+def test_sync_and_async_clients_use_same_base_urls(monkeypatch):
+    monkeypatch.setattr(midtrans_config, "MIDTRANS_SNAP_BASE_URL", "http://stub/snap/v1")
+    monkeypatch.setattr(midtrans_config, "MIDTRANS_CORE_BASE_URL", "http://stub")
+    monkeypatch.setattr(midtrans_config, "_snap", None)
+    monkeypatch.setattr(midtrans_config, "_core", None)
+
+    assert midtrans_config.get_midtrans_snap().api_config.get_snap_base_url() == "http://stub/snap/v1"
+    assert midtrans_config.get_midtrans_core().api_config.get_core_api_base_url() == "http://stub"
+
+
+def test_transaction_status_quotes_order_id():
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.raw_path)
+        return httpx.Response(200, json={"status_code": "200"})
+
+    async def scenario():
+        client = AsyncMidtransClient("server-key")
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await client.transaction_status("ORDER/1?x=2#y")
+        await client.aclose()
+
+    asyncio.run(scenario())
+
+    assert paths == [b"/v2/ORDER%2F1%3Fx%3D2%23y/status"]
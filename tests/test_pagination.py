@@ -0,0 +1,44 @@
+"""Keyset pagination: mengikuti X-Next-Cursor mengembalikan setiap baris tepat sekali."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.pagination import NEXT_CURSOR_HEADER
+from conftest import auth_headers, create_transaction
+
+
+def follow_cursor(client, path: str, headers: dict, limit: int, max_pages: int = 20) -> list:
+    order_ids, cursor = [], None
+    for _ in range(max_pages):
+        url = f"{path}?limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.text
+        order_ids.extend(row["order_id"] for row in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return order_ids
+    pytest.fail(f"cursor pagination did not finish after {max_pages} pages: {order_ids}")
+
+
+def test_follow_cursor_with_server_default_timestamps(client, db, admin, customer):
+    # created_at dari server_default: di SQLite beberapa baris bisa punya detik yang sama
+    for i in range(5):
+        create_transaction(db, customer, order_id=f"o{i}")
+
+    order_ids = follow_cursor(client, "/api/transactions", auth_headers(admin), limit=2)
+
+    assert order_ids == ["o4", "o3", "o2", "o1", "o0"]
+
+
+@pytest.mark.parametrize("microsecond", [0, 250000])
+def test_follow_cursor_with_explicit_timestamps(client, db, admin, customer, microsecond):
+    base = datetime(2026, 1, 1, 12, 0, 0, microsecond)
+    for i in range(6):
+        transaction = create_transaction(db, customer, order_id=f"o{i}")
+        # Dua baris per timestamp, ditulis oleh SQLAlchemy (dengan microsecond)
+        transaction.created_at = base + timedelta(seconds=i // 2)
+    db.commit()
+
+    order_ids = follow_cursor(client, "/api/transactions", auth_headers(admin), limit=2)
+
+    assert order_ids == ["o5", "o4", "o3", "o2", "o1", "o0"]
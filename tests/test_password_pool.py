@@ -0,0 +1,54 @@
+"""Process pool bcrypt pulih setelah worker mati (BrokenProcessPool)."""
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth
+
+
+def break_password_pool():
+    pool = auth._get_password_pool()
+    future = pool.submit(os._exit, 1)
+    try:
+        future.result(timeout=30)
+    except Exception:
+        pass
+    return pool
+
+
+def test_hashing_recovers_after_pool_worker_dies():
+    broken = break_password_pool()
+
+    hashed = asyncio.run(auth.get_password_hash_async("secret"))
+
+    assert auth._password_pool is not broken
+    assert asyncio.run(auth.verify_password_async("secret", hashed))
+    auth.shutdown_password_pool()
+
+
+def test_broken_pool_does_not_leak_queue_slots():
+    break_password_pool()
+    asyncio.run(auth.verify_password_async("secret", auth.get_password_hash("secret")))
+    auth.shutdown_password_pool()
+
+    assert auth.password_pool_stats()["in_flight"] == 0
+
+
+def test_full_queue_is_rejected_and_counted(monkeypatch):
+    monkeypatch.setattr(auth, "PASSWORD_POOL_WORKERS", 1)
+    monkeypatch.setattr(auth, "PASSWORD_POOL_MAX_PENDING", 0)
+
+    async def scenario():
+        running = asyncio.ensure_future(auth._run_in_password_pool(time.sleep, 0.5))
+        await asyncio.sleep(0)
+        in_flight = auth.password_pool_stats()["in_flight"]
+        with pytest.raises(HTTPException) as rejected:
+            await auth.get_password_hash_async("secret")
+        await running
+        return in_flight, rejected.value.status_code
+
+    assert asyncio.run(scenario()) == (1, 503)
+    assert auth.password_pool_stats()["in_flight"] == 0
@@ -0,0 +1,111 @@
+"""POST /api/payment/create: hanya pemilik order, dan request paralel untuk order yang sama hanya membuat satu transaksi Snap."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import main, snap_tokens
+from app.midtrans_config import MidtransUnavailable
+from conftest import auth_headers, create_transaction, create_user
+
+PARALLEL = 8
+
+
+class SlowSnap:
+    """Pengganti client Snap async: lambat supaya request paralel saling tumpang tindih"""
+
+    def __init__(self):
+        self.orders = []
+
+    async def create_transaction(self, parameters: dict) -> dict:
+        order_id = parameters["transaction_details"]["order_id"]
+        self.orders.append(order_id)
+        number = len(self.orders)
+        await asyncio.sleep(0.2)
+        return {"token": f"token-{number}", "redirect_url": f"https://snap.test/{number}"}
+
+
+@pytest.fixture
+def snap(monkeypatch):
+    snap = SlowSnap()
+    monkeypatch.setattr(main, "get_async_midtrans", lambda: snap)
+    return snap
+
+
+def payload(order_id: str) -> dict:
+    return {
+        "order_id": order_id,
+        "gross_amount": 10000,
+        "items": [{"id": "1", "price": 10000, "quantity": 1, "name": "Product"}],
+        "customer_details": {"first_name": "Customer"},
+    }
+
+
+def create_in_parallel(client, headers, order_ids) -> list:
+    def call(order_id):
+        response = client.post("/api/payment/create", json=payload(order_id), headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    with ThreadPoolExecutor(max_workers=len(order_ids)) as pool:
+        return list(pool.map(call, order_ids))
+
+
+def test_parallel_requests_for_one_order_share_one_snap_call(client, db, customer, snap):
+    create_transaction(db, customer, order_id="ORDER-1")
+
+    results = create_in_parallel(client, auth_headers(customer), ["ORDER-1"] * PARALLEL)
+
+    assert snap.orders == ["ORDER-1"]
+    assert {result["token"] for result in results} == {"token-1"}
+    assert snap_tokens._order_locks == {}
+
+
+def test_different_orders_are_not_serialized(client, db, customer, snap):
+    orders = [f"ORDER-{i}" for i in range(PARALLEL)]
+    for order_id in orders:
+        create_transaction(db, customer, order_id=order_id)
+
+    results = create_in_parallel(client, auth_headers(customer), orders)
+
+    assert sorted(snap.orders) == sorted(orders)
+    assert len({result["token"] for result in results}) == PARALLEL
+
+
+def test_failed_snap_call_lets_next_request_retry(client, db, customer, snap, monkeypatch):
+    create_transaction(db, customer, order_id="ORDER-1")
+    original = snap.create_transaction
+
+    async def unavailable(parameters):
+        snap.orders.append(parameters["transaction_details"]["order_id"])
+        raise MidtransUnavailable("Payment provider request failed: ConnectError")
+
+    monkeypatch.setattr(snap, "create_transaction", unavailable)
+    response = client.post("/api/payment/create", json=payload("ORDER-1"), headers=auth_headers(customer))
+    assert response.status_code == 503
+
+    monkeypatch.setattr(snap, "create_transaction", original)
+    response = client.post("/api/payment/create", json=payload("ORDER-1"), headers=auth_headers(customer))
+    assert response.status_code == 200
+    assert snap.orders == ["ORDER-1", "ORDER-1"]
+    assert snap_tokens._order_locks == {}
+
+
+def test_other_customer_cannot_use_order(client, db, customer, snap):
+    create_transaction(db, customer, order_id="ORDER-1")
+    response = client.post("/api/payment/create", json=payload("ORDER-1"), headers=auth_headers(customer))
+    assert response.status_code == 200
+    other = create_user(db, "customer", email="other@example.com")
+
+    response = client.post("/api/payment/create", json=payload("ORDER-1"), headers=auth_headers(other))
+
+    assert response.status_code == 404
+    assert "token" not in response.json()
+    assert snap.orders == ["ORDER-1"]
+
+
+def test_unknown_order_is_rejected(client, customer, snap):
+    response = client.post("/api/payment/create", json=payload("MISSING-ORDER"), headers=auth_headers(customer))
+
+    assert response.status_code == 404
+    assert snap.orders == []
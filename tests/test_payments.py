@@ -0,0 +1,119 @@
+"""State machine pembayaran: setiap status Midtrans terhadap Payment, Transaction, stock dan rollup earnings."""
+from decimal import Decimal
+
+import pytest
+
+from app import earnings, models, payments
+from conftest import create_product, create_transaction
+
+INITIAL_STOCK = 10
+QUANTITY = 2
+AMOUNT = Decimal("20000")
+
+PAID = INITIAL_STOCK - QUANTITY
+
+# (status Midtrans berurutan, status Transaction akhir, stock akhir, rollup {status: jumlah})
+TRANSITIONS = {
+    "settlement": (["settlement"], "paid", PAID, {"paid": 1}),
+    "capture": (["capture"], "paid", PAID, {"paid": 1}),
+    "deny": (["deny"], "failed", INITIAL_STOCK, {"failed": 1}),
+    "cancel": (["cancel"], "failed", INITIAL_STOCK, {"failed": 1}),
+    "expire": (["expire"], "failed", INITIAL_STOCK, {"failed": 1}),
+    "failure": (["failure"], "failed", INITIAL_STOCK, {"failed": 1}),
+    "pending": (["pending"], "pending", INITIAL_STOCK, {"pending": 1}),
+    "authorize": (["authorize"], "pending", INITIAL_STOCK, {"pending": 1}),
+    "repeated settlement": (["settlement", "settlement"], "paid", PAID, {"paid": 1}),
+    "pending then settlement": (["pending", "settlement"], "paid", PAID, {"paid": 1}),
+    "authorize then capture": (["authorize", "capture"], "paid", PAID, {"paid": 1}),
+    "capture then settlement": (["capture", "settlement"], "paid", PAID, {"paid": 1}),
+    # Notifikasi terlambat tidak mengembalikan order yang sudah dibayar ke pending
+    "settlement then pending": (["settlement", "pending"], "paid", PAID, {"paid": 1}),
+    "capture then authorize": (["capture", "authorize"], "paid", PAID, {"paid": 1}),
+    # paid -> failed / refunded: stock dikembalikan
+    "settlement then expire": (["settlement", "expire"], "failed", INITIAL_STOCK, {"failed": 1}),
+    "settlement then cancel": (["settlement", "cancel"], "failed", INITIAL_STOCK, {"failed": 1}),
+    "refund": (["settlement", "refund"], "refunded", INITIAL_STOCK, {"refunded": 1}),
+    "partial_refund": (["settlement", "partial_refund"], "paid", PAID, {"paid": 1}),
+    "partial then full refund": (["settlement", "partial_refund", "refund"], "refunded", INITIAL_STOCK, {"refunded": 1}),
+    # failed -> paid
+    "expire then settlement": (["expire", "settlement"], "paid", PAID, {"paid": 1}),
+    "settlement, cancel, settlement": (["settlement", "cancel", "settlement"], "paid", PAID, {"paid": 1}),
+}
+
+
+def rollup_counts(db) -> dict:
+    return {status: count for status, (count, _) in earnings.get_totals(db).items() if count}
+
+
+@pytest.mark.parametrize("name", TRANSITIONS)
+def test_transition(db, admin, customer, name):
+    statuses, expected_status, expected_stock, expected_rollup = TRANSITIONS[name]
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+    transaction = create_transaction(db, customer, product, order_id="ORDER-1", quantity=QUANTITY)
+
+    results = []
+    for status in statuses:
+        results.append(payments.apply_transition(db, "ORDER-1", status, "midtrans-1", gross_amount=AMOUNT))
+        db.commit()
+
+    db.expire_all()
+    assert all(result.found for result in results)
+    assert db.get(models.Transaction, transaction.id).status == expected_status
+    assert db.get(models.Product, product.id).stock == expected_stock
+    assert rollup_counts(db) == expected_rollup
+    payment = db.query(models.Payment).one()
+    assert payment.transaction_status == statuses[-1]
+    assert payment.gross_amount == AMOUNT
+    assert payment.midtrans_transaction_id == "midtrans-1"
+
+
+def test_settlement_updates_rollup_amounts(db, admin, customer):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+    create_transaction(db, customer, product, order_id="ORDER-1", quantity=QUANTITY)
+
+    payments.apply_transition(db, "ORDER-1", "settlement", "midtrans-1")
+    db.commit()
+
+    totals = earnings.get_totals(db)
+    assert totals["paid"] == (1, product.price * QUANTITY)
+    assert totals["pending"] == (0, Decimal("0"))
+
+
+def test_refund_moves_amount_out_of_paid(db, admin, customer):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+    create_transaction(db, customer, product, order_id="ORDER-1", quantity=QUANTITY)
+
+    settled = payments.apply_transition(db, "ORDER-1", "settlement", "midtrans-1")
+    refunded = payments.apply_transition(db, "ORDER-1", "refund")
+    db.commit()
+
+    assert settled.stock_changed and refunded.stock_changed
+    assert refunded.previous_status == "paid" and refunded.status == "refunded"
+    totals = earnings.get_totals(db)
+    assert totals["paid"] == (0, Decimal("0"))
+    assert totals["refunded"] == (1, product.price * QUANTITY)
+
+
+def test_missing_fields_keep_stored_values(db, admin, customer):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+    create_transaction(db, customer, product, order_id="ORDER-1")
+
+    payments.apply_transition(db, "ORDER-1", "pending", "midtrans-1", payment_type="bank_transfer")
+    payments.apply_transition(db, "ORDER-1", "settlement")
+    db.commit()
+
+    payment = db.query(models.Payment).one()
+    assert payment.payment_type == "bank_transfer"
+    assert payment.midtrans_transaction_id == "midtrans-1"
+
+
+def test_unknown_order(db, admin):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+
+    result = payments.apply_transition(db, "MISSING-ORDER", "settlement", "midtrans-1")
+    db.commit()
+
+    assert not result.found
+    assert db.query(models.Payment).count() == 0
+    assert db.get(models.Product, product.id).stock == INITIAL_STOCK
+    assert rollup_counts(db) == {}
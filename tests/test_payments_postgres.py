@@ -0,0 +1,97 @@
+"""apply_transition di PostgreSQL: upsert + update status dalam satu statement (CTE + FOR UPDATE)."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import earnings, models, payments
+from conftest import create_product, create_transaction, create_user
+
+PARALLEL = 16
+
+
+def settle_in_parallel(pg_sessions, order_ids) -> list:
+    barrier = threading.Barrier(len(order_ids))
+
+    def settle(order_id):
+        session = pg_sessions()
+        try:
+            barrier.wait()
+            result = payments.apply_transition(session, order_id, "settlement", f"midtrans-{order_id}")
+            session.commit()
+            return result
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=len(order_ids)) as pool:
+        return list(pool.map(settle, order_ids))
+
+
+def test_upsert_and_transition(pg_db):
+    admin = create_user(pg_db, "admin", username="admin")
+    customer = create_user(pg_db, "customer", email="customer@example.com")
+    product = create_product(pg_db, admin, stock=10)
+    transaction = create_transaction(pg_db, customer, product, order_id="ORDER-1", quantity=2)
+
+    pending = payments.apply_transition(pg_db, "ORDER-1", "pending", "midtrans-1", payment_type="bank_transfer")
+    pg_db.commit()
+    assert pending.found and pending.status is None
+    assert pg_db.query(models.Payment).one().transaction_status == "pending"
+
+    settled = payments.apply_transition(pg_db, "ORDER-1", "settlement", "midtrans-1", gross_amount="20000.00")
+    pg_db.commit()
+    assert settled.previous_status == "pending" and settled.status == "paid" and settled.stock_changed
+
+    pg_db.expire_all()
+    payment = pg_db.query(models.Payment).one()
+    assert payment.transaction_status == "settlement"
+    assert payment.payment_type == "bank_transfer"
+    assert payment.midtrans_transaction_id == "midtrans-1"
+    assert pg_db.get(models.Transaction, transaction.id).midtrans_transaction_id == "midtrans-1"
+    assert pg_db.get(models.Product, product.id).stock == 8
+    assert earnings.get_totals(pg_db)["paid"][0] == 1
+
+    expired = payments.apply_transition(pg_db, "ORDER-1", "expire")
+    pg_db.commit()
+    assert expired.previous_status == "paid" and expired.status == "failed" and expired.stock_changed
+    pg_db.expire_all()
+    assert pg_db.get(models.Product, product.id).stock == 10
+    assert {status: count for status, (count, _) in earnings.get_totals(pg_db).items() if count} == {"failed": 1}
+
+
+def test_unknown_order(pg_db):
+    assert not payments.apply_transition(pg_db, "MISSING-ORDER", "settlement").found
+    assert not payments.apply_transition(pg_db, "MISSING-ORDER", "pending").found
+    assert pg_db.query(models.Payment).count() == 0
+
+
+def test_concurrent_settlements_of_one_order_decrement_once(pg_sessions, pg_db):
+    admin = create_user(pg_db, "admin", username="admin")
+    customer = create_user(pg_db, "customer", email="customer@example.com")
+    product = create_product(pg_db, admin, stock=10)
+    create_transaction(pg_db, customer, product, order_id="ORDER-1", quantity=3)
+
+    results = settle_in_parallel(pg_sessions, ["ORDER-1"] * PARALLEL)
+
+    assert sum(result.stock_changed for result in results) == 1
+    assert sum(result.previous_status == "pending" for result in results) == 1
+    pg_db.expire_all()
+    assert pg_db.get(models.Product, product.id).stock == 7
+    assert pg_db.query(models.Payment).count() == 1
+    assert earnings.get_totals(pg_db)["paid"][0] == 1
+    assert earnings.get_totals(pg_db)["pending"][0] == 0
+
+
+def test_concurrent_settlements_of_different_orders(pg_sessions, pg_db):
+    admin = create_user(pg_db, "admin", username="admin")
+    customer = create_user(pg_db, "customer", email="customer@example.com")
+    product = create_product(pg_db, admin, stock=PARALLEL - 4)
+    orders = [f"ORDER-{i}" for i in range(PARALLEL)]
+    for order_id in orders:
+        create_transaction(pg_db, customer, product, order_id=order_id)
+
+    results = settle_in_parallel(pg_sessions, orders)
+
+    assert all(result.status == "paid" for result in results)
+    assert sum(result.stock_changed for result in results) == PARALLEL - 4
+    pg_db.expire_all()
+    assert pg_db.get(models.Product, product.id).stock == 0
+    assert earnings.get_totals(pg_db)["paid"][0] == PARALLEL
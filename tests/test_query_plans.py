@@ -0,0 +1,226 @@
+"""
+Regression test query plan untuk query listing dan dashboard.
+
+Query dibangun dengan helper yang sama dengan endpoint di app/main.py
+(transaction_listing_query, product_listing_query, paginate_*), lalu di-EXPLAIN
+terhadap database benchmark yang sudah berisi data. Hanya tabel utama query
+(transactions / payments / products) yang dicek:
+  - tidak di-seq scan (Postgres: Seq Scan, SQLite: SCAN tanpa index),
+  - urutan datang dari index, bukan sort atas banyak baris (Postgres: Sort /
+    Incremental Sort dengan key tabel utama atas lebih dari SORT_ROW_LIMIT baris
+    estimasi; SQLite: USE TEMP B-TREE FOR ORDER BY),
+  - kolom filter (customer_id, status, ...) dipakai sebagai index condition.
+Tabel lookup dari outer join (users, products) boleh di-plan apa saja (mis. Hash
+Join + Seq Scan pada tabel kecil).
+
+Di-skip kecuali BENCH_DATABASE_URL di-set ke database yang sudah di-seed:
+
+    python benchmarks/generate_dataset.py --database-url $BENCH_DATABASE_URL --transactions 1000000 --truncate
+    BENCH_DATABASE_URL=... python -m pytest -q tests/test_query_plans.py
+"""
+import json
+import os
+import re
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import models
+from app.main import product_listing_query, transaction_listing_query
+from app.pagination import encode_cursor, paginate_by_created_at, paginate_by_id
+
+PAGE_SIZE = 100
+# Planner memilih seq scan untuk tabel kecil; plan baru bermakna dengan data sebanyak ini
+MIN_TRANSACTIONS = 10_000
+# Sort atas baris satu customer (puluhan baris) murah; sort atas banyak halaman berarti index tidak dipakai
+SORT_ROW_LIMIT = 10 * PAGE_SIZE
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _explain_postgresql(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, "sqlite")
+def _explain_sqlite(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+# ==================== ANALISIS PLAN ====================
+def _postgresql_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _postgresql_nodes(child)
+
+
+def _postgresql_problems(plan: dict, table: str) -> list:
+    problems = []
+    for node in _postgresql_nodes(plan):
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == table:
+            problems.append(f"Seq Scan on {table}")
+        elif node["Node Type"] in ("Sort", "Incremental Sort"):
+            keys = node.get("Sort Key", [])
+            if any(key.startswith(f"{table}.") for key in keys) and node["Plan Rows"] > SORT_ROW_LIMIT:
+                problems.append(f"{node['Node Type']} of ~{node['Plan Rows']} rows by {', '.join(keys)}")
+    return problems
+
+
+def _postgresql_summary(plan: dict, depth: int = 0) -> list:
+    target = plan.get("Index Name") or plan.get("Relation Name")
+    node = f"{plan['Node Type']} {target}" if target else plan["Node Type"]
+    lines = [f"{'  ' * depth}{node} (rows={plan['Plan Rows']})"]
+    for child in plan.get("Plans", []):
+        lines.extend(_postgresql_summary(child, depth + 1))
+    return lines
+
+
+def explain(db: Session, query, table: str, index_columns: tuple = ()) -> tuple:
+    """Return (problems, baris ringkasan plan) untuk tabel utama `table`"""
+    statement = query.statement if hasattr(query, "statement") else query
+    rows = db.execute(Explain(statement)).all()
+    if db.get_bind().dialect.name == "postgresql":
+        plan = rows[0][0]
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+        problems, summary = _postgresql_problems(plan, table), _postgresql_summary(plan)
+        conditions = " ".join(
+            node["Index Cond"] for node in _postgresql_nodes(plan)
+            if "Index Cond" in node and node.get("Index Name", "").startswith(f"ix_{table}_")
+        )
+    else:
+        summary = [row[-1] for row in rows]
+        problems = [
+            detail for detail in summary
+            if (re.match(rf"SCAN {table}\b", detail) and " USING " not in detail) or "TEMP B-TREE" in detail
+        ]
+        conditions = " ".join(detail for detail in summary if re.match(rf"SEARCH {table}\b", detail))
+    for column in index_columns:
+        if not re.search(rf"\b{column}\b", conditions):
+            problems.append(f"{column} is not an index condition on {table}")
+    return problems, summary
+
+
+# ==================== QUERY PER ENDPOINT ====================
+@pytest.fixture(scope="module")
+def bench_db():
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        pytest.skip("BENCH_DATABASE_URL is not set")
+    engine = create_engine(url)
+    with Session(engine) as db:
+        rows = db.scalar(select(func.count()).select_from(models.Transaction))
+        if rows < MIN_TRANSACTIONS:
+            pytest.skip(f"Only {rows} transactions; seed the database first (benchmarks/generate_dataset.py)")
+        yield db
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def values(bench_db) -> dict:
+    """Nilai filter dan cursor yang realistis dari data yang ada"""
+    db = bench_db
+    transaction = models.Transaction
+    payment = models.Payment
+    total = db.scalar(select(func.count()).select_from(transaction))
+    middle = db.execute(
+        select(transaction.customer_id, transaction.created_at, transaction.id)
+        .order_by(transaction.created_at.desc(), transaction.id.desc())
+        .offset(total // 2).limit(1)
+    ).first()
+    payment_middle = db.execute(
+        select(payment.created_at, payment.id).order_by(payment.created_at.desc(), payment.id.desc())
+        .offset(db.scalar(select(func.count()).select_from(payment)) // 2).limit(1)
+    ).first()
+    product_middle = db.scalar(
+        select(models.Product.id).where(models.Product.is_active == True).order_by(models.Product.id)
+        .offset(db.scalar(select(func.count()).select_from(models.Product)) // 2).limit(1)
+    )
+    return {
+        "customer_id": middle.customer_id,
+        "transaction_cursor": encode_cursor(middle.created_at, middle.id),
+        "payment_cursor": encode_cursor(payment_middle.created_at, payment_middle.id) if payment_middle else None,
+        "product_cursor": encode_cursor(product_middle) if product_middle else None,
+    }
+
+
+def transactions(db, *filters, cursor=None):
+    return paginate_by_created_at(
+        transaction_listing_query(db).filter(*filters), models.Transaction, 0, PAGE_SIZE, cursor
+    )
+
+
+def payments(db, *filters, cursor=None):
+    return paginate_by_created_at(db.query(models.Payment).filter(*filters), models.Payment, 0, PAGE_SIZE, cursor)
+
+
+def recent(db, *filters):
+    transaction = models.Transaction
+    columns = (transaction.id, transaction.order_id, transaction.total_amount, transaction.status, transaction.created_at)
+    return (
+        transaction_listing_query(db, *columns).filter(*filters)
+        .order_by(transaction.created_at.desc()).limit(10)
+    )
+
+
+def products(db, cursor=None):
+    query = product_listing_query(db).filter(models.Product.is_active == True)
+    return paginate_by_id(query, models.Product, 0, PAGE_SIZE, cursor)
+
+
+def by_customer(values):
+    return models.Transaction.customer_id == values["customer_id"]
+
+
+BY_STATUS = models.Transaction.status == "pending"
+BY_PAYMENT_STATUS = models.Payment.transaction_status == "pending"
+
+# Nama check -> (tabel utama, query seperti di handler, kolom filter yang harus jadi index condition)
+CHECKS = {
+    "GET /api/transactions (employee)": ("transactions", lambda db, v: transactions(db), ()),
+    "GET /api/transactions (employee, cursor)": (
+        "transactions", lambda db, v: transactions(db, cursor=v["transaction_cursor"]), ()
+    ),
+    "GET /api/transactions (customer)": (
+        "transactions", lambda db, v: transactions(db, by_customer(v)), ("customer_id",)
+    ),
+    "GET /api/transactions (customer, cursor)": (
+        "transactions", lambda db, v: transactions(db, by_customer(v), cursor=v["transaction_cursor"]),
+        ("customer_id",),
+    ),
+    "GET /api/transactions?status=": ("transactions", lambda db, v: transactions(db, BY_STATUS), ("status",)),
+    "GET /api/transactions?status= (cursor)": (
+        "transactions", lambda db, v: transactions(db, BY_STATUS, cursor=v["transaction_cursor"]), ("status",)
+    ),
+    "GET /api/dashboard/recent-transactions (employee)": ("transactions", lambda db, v: recent(db), ()),
+    "GET /api/dashboard/recent-transactions (customer)": (
+        "transactions", lambda db, v: recent(db, by_customer(v)), ("customer_id",)
+    ),
+    "GET /api/payments": ("payments", lambda db, v: payments(db), ()),
+    "GET /api/payments?transaction_status=": (
+        "payments", lambda db, v: payments(db, BY_PAYMENT_STATUS), ("transaction_status",)
+    ),
+    "GET /api/payments?transaction_status= (cursor)": (
+        "payments", lambda db, v: payments(db, BY_PAYMENT_STATUS, cursor=v["payment_cursor"]),
+        ("transaction_status",),
+    ),
+    "GET /api/products": ("products", lambda db, v: products(db), ()),
+    "GET /api/products (cursor)": ("products", lambda db, v: products(db, v["product_cursor"]), ()),
+}
+
+
+@pytest.mark.parametrize("name", CHECKS)
+def test_query_plan(bench_db, values, name):
+    table, build, index_columns = CHECKS[name]
+
+    problems, plan = explain(bench_db, build(bench_db, values), table, index_columns)
+
+    assert not problems, "\n".join([name, *problems, *plan])
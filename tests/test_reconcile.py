@@ -0,0 +1,219 @@
+"""Rekonsiliasi transaksi pending terhadap fake Midtrans Core API (transactions.status)."""
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from midtransclient.error_midtrans import MidtransAPIError
+
+from app import models, payments, reconcile
+from app.database import SessionLocal
+from conftest import create_product, create_transaction
+
+OLDER_THAN = timedelta(minutes=15)
+QUANTITY = 2
+
+
+class FakeTransactions:
+    def __init__(self, responses: dict):
+        self.responses = responses
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def status(self, order_id: str) -> dict:
+        with self._lock:
+            self.calls.append(order_id)
+        response = self.responses.get(order_id)
+        if response is None:
+            raise MidtransAPIError(
+                "Midtrans API is returning API error. HTTP status code: 404",
+                {"status_code": "404", "status_message": "Transaction doesn't exist."},
+                404,
+            )
+        return response
+
+
+class FakeCoreApi:
+    """Pengganti midtransclient.CoreApi: hanya transactions.status(order_id)"""
+
+    def __init__(self, responses: dict):
+        self.transactions = FakeTransactions(responses)
+
+
+def status_response(order_id: str, transaction_status: str) -> dict:
+    return {
+        "status_code": "200",
+        "order_id": order_id,
+        "transaction_id": f"midtrans-{order_id}",
+        "transaction_status": transaction_status,
+        "gross_amount": "20000.00",
+        "payment_type": "bank_transfer",
+    }
+
+
+def create_stale_transactions(db, customer, product, *order_ids, status: str = "pending"):
+    """Transaksi yang dibuat lebih lama dari OLDER_THAN (kandidat rekonsiliasi)"""
+    created_at = datetime.now(timezone.utc) - 2 * OLDER_THAN
+    for order_id in order_ids:
+        transaction = create_transaction(db, customer, product, order_id=order_id, quantity=QUANTITY, status=status)
+        transaction.created_at = created_at
+    db.commit()
+
+
+def run(core_api, **kwargs) -> dict:
+    options = {"older_than": OLDER_THAN, "concurrency": 2, "rate_limit": 0, **kwargs}
+    return reconcile.reconcile(core_api, SessionLocal, **options)
+
+
+def statuses(db) -> dict:
+    db.expire_all()
+    return dict(db.query(models.Transaction.order_id, models.Transaction.status))
+
+
+@pytest.fixture
+def product(db, admin):
+    return create_product(db, admin, stock=10)
+
+
+def test_status_responses_are_applied(db, customer, product):
+    create_stale_transactions(db, customer, product, "ORDER-SETTLED", "ORDER-EXPIRED", "ORDER-PENDING", "ORDER-404")
+    core_api = FakeCoreApi({
+        "ORDER-SETTLED": status_response("ORDER-SETTLED", "settlement"),
+        "ORDER-EXPIRED": status_response("ORDER-EXPIRED", "expire"),
+        "ORDER-PENDING": status_response("ORDER-PENDING", "pending"),
+    })
+
+    summary = run(core_api)
+
+    assert summary == {"checked": 4, "updated": 2, "unchanged": 1, "errors": 1}
+    assert statuses(db) == {
+        "ORDER-SETTLED": "paid",
+        "ORDER-EXPIRED": "failed",
+        "ORDER-PENDING": "pending",
+        "ORDER-404": "pending",
+    }
+    assert db.get(models.Product, product.id).stock == 10 - QUANTITY
+    payment = db.query(models.Payment).filter_by(order_id="ORDER-SETTLED").one()
+    assert payment.midtrans_transaction_id == "midtrans-ORDER-SETTLED"
+    assert db.query(models.Payment).filter_by(order_id="ORDER-404").count() == 0
+
+
+def test_only_stale_pending_transactions_are_checked(db, customer, product):
+    create_stale_transactions(db, customer, product, "ORDER-STALE")
+    create_stale_transactions(db, customer, product, "ORDER-PAID", status="paid")
+    create_transaction(db, customer, product, order_id="ORDER-FRESH")
+    core_api = FakeCoreApi({})
+
+    summary = run(core_api)
+
+    assert core_api.transactions.calls == ["ORDER-STALE"]
+    assert summary == {"checked": 1, "updated": 0, "unchanged": 0, "errors": 1}
+
+
+def test_results_are_committed_per_batch(db, customer, product, monkeypatch):
+    order_ids = [f"ORDER-{i}" for i in range(5)]
+    create_stale_transactions(db, customer, product, *order_ids)
+    core_api = FakeCoreApi({order_id: status_response(order_id, "expire") for order_id in order_ids})
+    batches = []
+    original = reconcile._apply_batch
+
+    def recording(session_factory, results):
+        batches.append([order_id for order_id, _ in results])
+        return original(session_factory, results)
+
+    monkeypatch.setattr(reconcile, "_apply_batch", recording)
+
+    summary = run(core_api, batch_size=2)
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert sorted(order_id for batch in batches for order_id in batch) == order_ids
+    assert summary == {"checked": 5, "updated": 5, "unchanged": 0, "errors": 0}
+    assert set(statuses(db).values()) == {"failed"}
+
+
+def test_failing_order_is_rolled_back_to_its_savepoint(db, customer, product, monkeypatch):
+    order_ids = ["ORDER-1", "ORDER-2", "ORDER-3"]
+    create_stale_transactions(db, customer, product, *order_ids)
+    core_api = FakeCoreApi({order_id: status_response(order_id, "settlement") for order_id in order_ids})
+    original = payments.apply_notification
+
+    def failing_after_write(session, notification, **kwargs):
+        result = original(session, notification, **kwargs)
+        if notification["order_id"] == "ORDER-2":
+            raise RuntimeError("boom")
+        return result
+
+    monkeypatch.setattr(payments, "apply_notification", failing_after_write)
+
+    summary = run(core_api, batch_size=10)
+
+    assert summary == {"checked": 3, "updated": 2, "unchanged": 0, "errors": 1}
+    assert statuses(db) == {"ORDER-1": "paid", "ORDER-2": "pending", "ORDER-3": "paid"}
+    # Update stock dan Payment ORDER-2 ikut di-rollback, batch lainnya tetap di-commit
+    assert db.get(models.Product, product.id).stock == 10 - 2 * QUANTITY
+    assert sorted(order_id for (order_id,) in db.query(models.Payment.order_id)) == ["ORDER-1", "ORDER-3"]
+
+
+class FakeClock:
+    """Pengganti modul time untuk TokenBucket: sleep memajukan jam, tanpa menunggu"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(reconcile, "time", fake)
+    return fake
+
+
+def test_token_bucket_allows_burst_then_rate(clock):
+    bucket = reconcile.TokenBucket(rate=2, capacity=2)
+
+    for _ in range(6):
+        bucket.acquire()
+
+    # 2 token burst, 4 sisanya masing-masing menunggu 1 / rate detik
+    assert clock.now == pytest.approx(2.0)
+    assert clock.sleeps == [pytest.approx(0.5)] * 4
+
+
+def test_token_bucket_refills_while_idle(clock):
+    bucket = reconcile.TokenBucket(rate=2, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+
+    clock.now += 10
+    bucket.acquire()
+    bucket.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_token_bucket_without_rate_never_waits(clock):
+    bucket = reconcile.TokenBucket(rate=0)
+
+    for _ in range(100):
+        bucket.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_reconcile_respects_rate_limit(db, customer, product, clock):
+    order_ids = [f"ORDER-{i}" for i in range(5)]
+    create_stale_transactions(db, customer, product, *order_ids)
+    core_api = FakeCoreApi({order_id: status_response(order_id, "pending") for order_id in order_ids})
+
+    summary = run(core_api, rate_limit=2, concurrency=1)
+
+    assert summary["checked"] == 5
+    assert len(core_api.transactions.calls) == 5
+    assert clock.now == pytest.approx(1.5)
@@ -0,0 +1,106 @@
+"""Registry role di memori: permission check tanpa SQL, role yang belum dikenal memicu refresh."""
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from app import auth, instrumentation, models, roles
+from app.database import AsyncSessionLocal, async_engine
+from conftest import auth_headers
+
+
+def principal(user: models.User) -> auth.Principal:
+    return auth.Principal(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name,
+        role_id=user.role_id,
+        is_active=user.is_active,
+    )
+
+
+def add_role(db, name: str) -> int:
+    role = models.Role(name=name)
+    db.add(role)
+    db.commit()
+    return role.id
+
+
+def test_permission_checks_run_no_sql_once_loaded(db, admin, customer):
+    roles.refresh(db)
+    admin_principal, customer_principal = principal(admin), principal(customer)
+
+    with instrumentation.assert_max_queries(0):
+        assert auth.is_admin(admin_principal) and auth.is_employee(admin_principal)
+        assert not auth.is_sales(admin_principal) and not auth.is_customer(admin_principal)
+        assert auth.is_customer(customer_principal) and not auth.is_employee(customer_principal)
+        assert admin_principal.role_name == "admin"
+        assert roles.id_for("customer") == customer.role_id
+
+
+def test_authenticated_request_runs_no_sql_once_cached(client, admin):
+    headers = auth_headers(admin)
+    # Request pertama mengisi cache principal dan registry role
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    with instrumentation.assert_max_queries(0):
+        response = client.get("/auth/me", headers=headers)
+
+    assert response.status_code == 200
+
+
+def test_unknown_role_id_triggers_refresh(db):
+    roles.refresh(db)
+    auditor_id = add_role(db, "auditor")
+
+    with instrumentation.count_queries() as counter:
+        assert roles.name(auditor_id) == "auditor"
+    assert counter.count == 1
+
+    with instrumentation.assert_max_queries(0):
+        assert roles.name(auditor_id) == "auditor"
+        assert roles.id_for("auditor") == auditor_id
+
+
+def test_unknown_role_name_triggers_refresh(db):
+    roles.refresh(db)
+    auditor_id = add_role(db, "auditor")
+
+    with instrumentation.count_queries() as counter:
+        assert roles.id_for("auditor", db) == auditor_id
+        assert roles.id_for("missing", db) is None
+    assert counter.count == 2
+
+
+def test_unknown_role_id_triggers_refresh_async(db):
+    roles.refresh(db)
+    auditor_id = add_role(db, "auditor")
+
+    async def lookup():
+        try:
+            async with AsyncSessionLocal() as session:
+                return await roles.name_async(session, auditor_id), await roles.id_for_async(session, "auditor")
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(lookup()) == ("auditor", auditor_id)
+
+
+@pytest.mark.parametrize("reload", [roles.refresh, roles.clear])
+def test_role_change_is_picked_up_after_refresh(db, admin, reload):
+    roles.refresh(db)
+    admin_principal = principal(admin)
+    db.execute(update(models.Role).where(models.Role.id == admin.role_id).values(name="owner"))
+    db.commit()
+
+    # Registry belum dimuat ulang: masih nama lama, tanpa query
+    with instrumentation.assert_max_queries(0):
+        assert auth.is_admin(admin_principal)
+
+    reload()
+
+    assert admin_principal.role_name == "owner"
+    assert not auth.is_admin(admin_principal) and not auth.is_employee(admin_principal)
+    assert roles.id_for("owner") == admin.role_id
+    assert roles.id_for("admin") is None
@@ -0,0 +1,67 @@
+"""Settlement paralel untuk satu produk: stock akhir tepat, tidak ada update yang hilang."""
+from concurrent.futures import ThreadPoolExecutor
+
+from app import models, payments, stock
+from app.database import SessionLocal
+from conftest import create_product, create_transaction
+
+SETTLEMENTS = 300
+INITIAL_STOCK = 250
+WORKERS = 32
+
+
+def run_parallel(fn, count: int) -> list:
+    def call(i):
+        session = SessionLocal()
+        try:
+            result = fn(session, i)
+            session.commit()
+            return result
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        return list(pool.map(call, range(count)))
+
+
+def test_parallel_decrements_never_oversell(db, admin):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+
+    results = run_parallel(lambda session, _: stock.decrement_stock(session, product.id, 1), SETTLEMENTS)
+
+    succeeded = [result for result in results if result is not None]
+    assert len(succeeded) == INITIAL_STOCK
+    assert sorted(succeeded) == list(range(INITIAL_STOCK))
+    db.expire_all()
+    assert db.get(models.Product, product.id).stock == 0
+
+
+def test_parallel_settlements_leave_exact_stock(db, admin, customer):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+    for i in range(SETTLEMENTS):
+        create_transaction(db, customer, product, order_id=f"ORDER-{i}")
+
+    results = run_parallel(
+        lambda session, i: payments.apply_transition(session, f"ORDER-{i}", "settlement", f"midtrans-{i}"),
+        SETTLEMENTS,
+    )
+
+    assert all(result.found and result.status == "paid" for result in results)
+    assert sum(result.stock_changed for result in results) == INITIAL_STOCK
+    db.expire_all()
+    assert db.get(models.Product, product.id).stock == 0
+    assert db.query(models.Transaction).filter(models.Transaction.status == "paid").count() == SETTLEMENTS
+
+
+def test_repeated_parallel_settlements_of_one_order_decrement_once(db, admin, customer):
+    product = create_product(db, admin, stock=INITIAL_STOCK)
+    create_transaction(db, customer, product, order_id="ORDER-1", quantity=2)
+
+    results = run_parallel(
+        lambda session, i: payments.apply_transition(session, "ORDER-1", "settlement", "midtrans-1"),
+        50,
+    )
+
+    assert sum(result.stock_changed for result in results) == 1
+    db.expire_all()
+    assert db.get(models.Product, product.id).stock == INITIAL_STOCK - 2
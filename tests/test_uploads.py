@@ -0,0 +1,178 @@
+"""Gambar yang dipakai bersama: release_upload paralel dengan upload isi yang sama tidak menghilangkan file."""
+import asyncio
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import update
+
+from app import models, uploads
+from app.database import AsyncSessionLocal, async_engine
+from conftest import create_product
+
+IMAGE_BYTES = b"not really a jpeg"
+
+
+@pytest.fixture(autouse=True)
+def no_variants(monkeypatch):
+    # Isi file bukan gambar asli; varian tidak dibuat
+    monkeypatch.setattr(uploads, "IMAGE_VARIANT_WIDTHS", ())
+
+
+def upload(data: bytes = IMAGE_BYTES) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="photo.jpg")
+
+
+def run(coroutine):
+    async def wrapper():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(wrapper())
+
+
+async def set_image(db, product_id: int, image_url):
+    await db.execute(update(models.Product).where(models.Product.id == product_id).values(image_url=image_url))
+    await db.commit()
+
+
+def test_same_bytes_share_one_file(db, admin):
+    async def scenario():
+        first = await uploads.save_upload(upload())
+        second = await uploads.save_upload(upload())
+        await uploads.confirm_upload(first)
+        await uploads.confirm_upload(second)
+        return first, second
+
+    first, second = run(scenario())
+
+    assert first.url == second.url
+    assert first.spare_path is None and second.spare_path is not None
+    assert not os.path.exists(second.spare_path)
+    assert os.path.exists(uploads.path_for_url(first.url))
+
+
+def test_upload_committed_after_release_recreates_file(db, admin):
+    old = create_product(db, admin)
+    new = create_product(db, admin)
+
+    async def scenario():
+        stored = await uploads.save_upload(upload())
+        await uploads.confirm_upload(stored)
+        async with AsyncSessionLocal() as session:
+            await set_image(session, old.id, stored.url)
+            # Request B: upload isi yang sama, file sudah ada (belum commit produk)
+            concurrent = await uploads.save_upload(upload())
+            # Request A: gambar produk lama diganti, reference = 0, file dihapus
+            await set_image(session, old.id, None)
+            await uploads.release_upload(session, stored.url)
+            assert not os.path.exists(uploads.path_for_url(stored.url))
+            # Request B commit lalu confirm
+            await set_image(session, new.id, concurrent.url)
+            await uploads.confirm_upload(concurrent)
+        return concurrent
+
+    concurrent = run(scenario())
+
+    with open(uploads.path_for_url(concurrent.url), "rb") as image:
+        assert image.read() == IMAGE_BYTES
+    assert not os.path.exists(concurrent.spare_path)
+
+
+def test_release_restores_file_claimed_during_release(db, admin, monkeypatch):
+    old = create_product(db, admin)
+    new = create_product(db, admin)
+    move_aside = uploads._move_aside
+
+    async def scenario():
+        stored = await uploads.save_upload(upload())
+        await uploads.confirm_upload(stored)
+        async with AsyncSessionLocal() as session:
+            await set_image(session, old.id, stored.url)
+            await set_image(session, old.id, None)
+
+            def move_aside_then_commit_other_product(file_path):
+                aside_path = move_aside(file_path)
+                # Produk lain dengan gambar yang sama commit setelah hitungan pertama
+                db.execute(update(models.Product).where(models.Product.id == new.id).values(image_url=stored.url))
+                db.commit()
+                return aside_path
+
+            monkeypatch.setattr(uploads, "_move_aside", move_aside_then_commit_other_product)
+            await uploads.release_upload(session, stored.url)
+        return stored
+
+    stored = run(scenario())
+
+    assert os.path.exists(uploads.path_for_url(stored.url))
+    assert not [name for name in os.listdir(uploads.UPLOAD_DIR) if name.startswith(".release-")]
+
+
+def test_unreferenced_file_is_removed(db, admin):
+    product = create_product(db, admin)
+
+    async def scenario():
+        stored = await uploads.save_upload(upload())
+        await uploads.confirm_upload(stored)
+        async with AsyncSessionLocal() as session:
+            await set_image(session, product.id, stored.url)
+            await set_image(session, product.id, None)
+            await uploads.release_upload(session, stored.url)
+        return stored
+
+    stored = run(scenario())
+
+    assert not os.path.exists(uploads.path_for_url(stored.url))
+
+
+def write_upload(filename: str, data: bytes) -> str:
+    os.makedirs(uploads.UPLOAD_DIR, exist_ok=True)
+    with open(os.path.join(uploads.UPLOAD_DIR, filename), "wb") as file:
+        file.write(data)
+    return f"{uploads.UPLOAD_URL_PREFIX}{filename}"
+
+
+def png_bytes(width: int = 800, height: int = 600) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_only_generated_variants_are_listed(monkeypatch):
+    monkeypatch.setattr(uploads, "IMAGE_VARIANT_WIDTHS", (160, 320))
+    # Upload lama dengan nama UUID, belum punya varian
+    legacy_url = write_upload("0b8f6f5e-6a47-4c1e-9a53-2f4f3c0d1e7a.png", png_bytes())
+    assert uploads.variant_urls(legacy_url) == {}
+
+    write_upload("0b8f6f5e-6a47-4c1e-9a53-2f4f3c0d1e7a_w160.png", b"variant")
+
+    assert uploads.variant_urls(legacy_url) == {"160": "/uploads/0b8f6f5e-6a47-4c1e-9a53-2f4f3c0d1e7a_w160.png"}
+    assert uploads.variant_urls("https://example.com/photo.png") == {}
+    assert uploads.variant_urls(None) == {}
+
+
+def test_backfill_generates_missing_variants(db, admin, monkeypatch):
+    from app import backfill_variants
+
+    widths = (160, 320)
+    monkeypatch.setattr(uploads, "IMAGE_VARIANT_WIDTHS", widths)
+    legacy_url = write_upload("legacy-photo.png", png_bytes())
+    text_url = write_upload("legacy-notes.png", b"not an image")
+    for image_url in (legacy_url, text_url, "/uploads/deleted.png", "https://example.com/photo.png"):
+        product = create_product(db, admin)
+        product.image_url = image_url
+    db.commit()
+
+    summary = backfill_variants.backfill(widths=widths)
+
+    assert summary == {"checked": 3, "generated": 1, "complete": 0, "missing": 1, "errors": 1}
+    assert uploads.variant_urls(legacy_url) == {
+        "160": "/uploads/legacy-photo_w160.png",
+        "320": "/uploads/legacy-photo_w320.png",
+    }
+    assert uploads.variant_urls(text_url) == {}
+    assert backfill_variants.backfill(widths=widths)["complete"] == 1
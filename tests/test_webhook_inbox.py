@@ -0,0 +1,251 @@
+"""Worker webhook inbox: setiap entry diterapkan paling banyak sekali, error sementara dicoba lagi."""
+import json
+import threading
+from collections import Counter
+
+import pytest
+from sqlalchemy import exc
+
+from app import earnings, models, payments, webhook_inbox
+from app.database import SessionLocal
+from conftest import create_product, create_transaction
+
+
+def settlement(order_id: str, nonce: str = "midtrans-1") -> dict:
+    return {
+        "order_id": order_id,
+        "transaction_status": "settlement",
+        "transaction_id": nonce,
+        "gross_amount": "10000.00",
+    }
+
+
+def add_entries(db, *payloads):
+    for payload in payloads:
+        db.add(models.WebhookInbox(payload=payload if isinstance(payload, str) else json.dumps(payload)))
+    db.commit()
+
+
+def drain_all(db) -> int:
+    total = 0
+    while True:
+        handled = webhook_inbox.drain_batch(db)
+        total += handled
+        if handled == 0:
+            return total
+
+
+@pytest.fixture
+def product(db, admin):
+    return create_product(db, admin, stock=100)
+
+
+@pytest.fixture
+def applied(monkeypatch):
+    """Hitung berapa kali setiap notifikasi (per transaction_id Midtrans) diterapkan"""
+    calls = Counter()
+    lock = threading.Lock()
+    original = payments.apply_notification
+
+    def counting(db, notification, **kwargs):
+        with lock:
+            calls[notification["transaction_id"]] += 1
+        return original(db, notification, **kwargs)
+
+    monkeypatch.setattr(payments, "apply_notification", counting)
+    return calls
+
+
+def pending_entries(db) -> int:
+    return db.query(models.WebhookInbox).filter(models.WebhookInbox.processed_at.is_(None)).count()
+
+
+def test_duplicate_notifications_decrement_stock_once(db, customer, product, applied):
+    create_transaction(db, customer, product, order_id="ORDER-1", quantity=3)
+    add_entries(db, settlement("ORDER-1", "n1"), settlement("ORDER-1", "n2"))
+
+    assert drain_all(db) == 2
+
+    db.expire_all()
+    assert db.get(models.Product, product.id).stock == 97
+    assert applied == {"n1": 1, "n2": 1}
+    assert earnings.get_totals(db)["paid"][0] == 1
+    assert db.query(models.Payment).count() == 1
+    assert pending_entries(db) == 0
+
+
+def test_processed_entries_are_not_applied_again(db, customer, product, applied):
+    create_transaction(db, customer, product, order_id="ORDER-1")
+    add_entries(db, settlement("ORDER-1", "n1"))
+
+    assert webhook_inbox.drain_batch(db) == 1
+    assert webhook_inbox.drain_batch(db) == 0
+
+    assert applied == {"n1": 1}
+
+
+def test_concurrent_drains_apply_each_entry_once(db, customer, product, applied):
+    orders = [f"ORDER-{i}" for i in range(20)]
+    for order_id in orders:
+        create_transaction(db, customer, product, order_id=order_id)
+    # Setiap order dapat dua notifikasi settlement
+    add_entries(db, *(settlement(order_id, f"{order_id}-{copy}") for copy in range(2) for order_id in orders))
+    errors = []
+
+    def worker():
+        session = SessionLocal()
+        try:
+            drain_all(session)
+        except Exception as e:  # pragma: no cover - dilaporkan lewat assert di bawah
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(applied) == sorted(f"{order_id}-{copy}" for copy in range(2) for order_id in orders)
+    assert set(applied.values()) == {1}
+    db.expire_all()
+    assert db.get(models.Product, product.id).stock == 100 - len(orders)
+    assert pending_entries(db) == 0
+
+
+def test_malformed_payload_is_recorded_and_skipped(db, customer, product):
+    create_transaction(db, customer, product, order_id="ORDER-1")
+    add_entries(db, "{not json", settlement("ORDER-1"))
+
+    assert drain_all(db) == 2
+
+    broken, valid = db.query(models.WebhookInbox).order_by(models.WebhookInbox.id).all()
+    assert broken.processed_at is not None and broken.error
+    assert valid.processed_at is not None and valid.error is None
+    assert valid.order_id == "ORDER-1"
+    assert db.get(models.Transaction, 1).status == "paid"
+
+
+def test_unknown_order_is_processed_without_changes(db, product):
+    add_entries(db, settlement("MISSING-ORDER"))
+
+    assert drain_all(db) == 1
+
+    entry = db.query(models.WebhookInbox).one()
+    assert entry.processed_at is not None and entry.error is None
+    assert db.query(models.Payment).count() == 0
+
+
+def lost_connection(db, notification, **kwargs):
+    raise exc.OperationalError("UPDATE transactions ...", {}, Exception("server closed the connection"))
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(webhook_inbox, "WEBHOOK_RETRY_DELAY", 0)
+
+
+def test_transient_database_error_leaves_entry_for_retry(db, customer, product, monkeypatch, no_backoff):
+    create_transaction(db, customer, product, order_id="ORDER-1")
+    add_entries(db, settlement("ORDER-1"))
+    original = payments.apply_notification
+
+    monkeypatch.setattr(payments, "apply_notification", lost_connection)
+    assert webhook_inbox.drain_batch(db) == 0
+    assert pending_entries(db) == 1
+    assert db.query(models.WebhookInbox).one().attempts == 1
+
+    monkeypatch.setattr(payments, "apply_notification", original)
+    assert drain_all(db) == 1
+
+    db.expire_all()
+    assert pending_entries(db) == 0
+    assert db.get(models.Transaction, 1).status == "paid"
+    assert db.get(models.Product, product.id).stock == 99
+
+
+def test_failing_entry_is_deferred_and_does_not_block_inbox(db, customer, product, monkeypatch):
+    create_transaction(db, customer, product, order_id="ORDER-1")
+    create_transaction(db, customer, product, order_id="ORDER-2")
+    add_entries(db, settlement("ORDER-1"), settlement("ORDER-2"))
+    original = payments.apply_notification
+
+    def order_1_fails(db, notification, **kwargs):
+        if notification["order_id"] == "ORDER-1":
+            lost_connection(db, notification)
+        return original(db, notification, **kwargs)
+
+    monkeypatch.setattr(payments, "apply_notification", order_1_fails)
+    assert webhook_inbox.drain_batch(db) == 0
+    # Entry pertama ditunda (backoff), entry berikutnya tetap diproses
+    assert webhook_inbox.drain_batch(db) == 1
+
+    db.expire_all()
+    first, second = db.query(models.WebhookInbox).order_by(models.WebhookInbox.id).all()
+    assert first.processed_at is None and first.attempts == 1 and first.next_attempt_at is not None
+    assert second.processed_at is not None and second.error is None
+    assert db.get(models.Transaction, 2).status == "paid"
+
+
+def test_entry_is_given_up_after_max_attempts(db, customer, product, monkeypatch, no_backoff):
+    monkeypatch.setattr(webhook_inbox, "WEBHOOK_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(payments, "apply_notification", lost_connection)
+    create_transaction(db, customer, product, order_id="ORDER-1")
+    add_entries(db, settlement("ORDER-1"))
+
+    assert [webhook_inbox.drain_batch(db) for _ in range(4)] == [0, 0, 1, 0]
+
+    entry = db.query(models.WebhookInbox).one()
+    assert entry.processed_at is not None and entry.attempts == 3
+    assert entry.error.startswith("Gave up after 3 attempts")
+    assert db.get(models.Transaction, 1).status == "pending"
+
+
+def test_sql_error_is_recorded_without_retry(db, customer, product, monkeypatch):
+    def broken_statement(db, notification, **kwargs):
+        raise exc.ProgrammingError("UPDATE transactions ...", {}, Exception("column does not exist"))
+
+    monkeypatch.setattr(payments, "apply_notification", broken_statement)
+    create_transaction(db, customer, product, order_id="ORDER-1")
+    add_entries(db, settlement("ORDER-1"), settlement("ORDER-1", "n2"))
+
+    assert webhook_inbox.drain_batch(db) == 2
+
+    entries = db.query(models.WebhookInbox).all()
+    assert all(entry.processed_at is not None and "column does not exist" in entry.error for entry in entries)
+    assert all(entry.attempts == 0 for entry in entries)
+
+
+class PostgresError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+@pytest.mark.parametrize("error, transient", [
+    (exc.OperationalError("SELECT 1", {}, Exception("database is locked")), True),
+    (exc.InternalError("SELECT 1", {}, PostgresError("40001")), True),  # serialization_failure
+    (exc.InternalError("SELECT 1", {}, PostgresError("40P01")), True),  # deadlock_detected
+    (exc.InternalError("SELECT 1", {}, PostgresError("XX000")), False),
+    (exc.ProgrammingError("SELECT 1", {}, Exception("syntax error")), False),
+    (exc.IntegrityError("INSERT ...", {}, Exception("duplicate key")), False),
+    (exc.DataError("INSERT ...", {}, Exception("value too long")), False),
+    (exc.DBAPIError("SELECT 1", {}, Exception("server closed"), connection_invalidated=True), True),
+    (ValueError("not json"), False),
+])
+def test_is_transient_error(error, transient):
+    assert webhook_inbox.is_transient_error(error) is transient
+
+
+def test_webhook_body_size_is_limited(client, db, monkeypatch):
+    monkeypatch.setattr(webhook_inbox, "WEBHOOK_MAX_BODY_SIZE", 64)
+
+    assert client.post("/api/payment/webhook", content=b"x" * 64).status_code == 200
+    assert client.post("/api/payment/webhook", content=b"x" * 65).status_code == 413
+    # Tanpa Content-Length (chunked): ukuran dihitung saat body dibaca
+    chunked = client.post("/api/payment/webhook", content=iter([b"x" * 40, b"x" * 40]))
+    assert chunked.status_code == 413
+
+    assert db.query(models.WebhookInbox).count() == 1